@@ -0,0 +1,66 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from sqlalchemy.orm import Query, Session
+
+from geoimagenet_api.database.async_connection import fetch_scalar
+from geoimagenet_api.database.models import DataVersion
+
+
+def get_data_version(session: Session, name: str) -> int:
+    """Get the current version of a group of tables.
+
+    The versions are incremented by triggers on each write to the tables.
+    """
+    version = session.query(DataVersion.version).filter_by(name=name).scalar()
+    return version or 0
+
+
+async def fetch_data_version(name: str) -> int:
+    """Get the current version of a group of tables, for asynchronous endpoints."""
+    version = await fetch_scalar(Query(DataVersion.version).filter_by(name=name))
+    return version or 0
+
+
+def make_etag(version, key: Hashable) -> str:
+    """Build a strong ETag from a data version and a cache key."""
+    digest = hashlib.md5(repr(key).encode()).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+
+class VersionedCache:
+    """Thread safe in-process cache, where every entry is tied to a data version.
+
+    An entry is only returned if it was stored with the same version as the one
+    requested. When a newer version is stored, entries of older versions are dropped.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version) -> Optional[Any]:
+        with self._lock:
+            if version != self._version or key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Hashable, version, value: Any):
+        with self._lock:
+            if version != self._version:
+                self._data.clear()
+                self._version = version
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._version = None
@@ -1 +1,8 @@
-from .config import get, get_database_url, get_all_config
+from .config import (
+    get,
+    get_database_url,
+    get_replica_database_url,
+    get_all_config,
+    reload,
+    settings,
+)
@@ -3,7 +3,7 @@ from pathlib import Path
 import configparser
 
 # global variable used to read configuration files only once
-from typing import Dict
+from typing import Dict, Optional
 
 config_ini = None
 # prefix to use in environment variables
@@ -30,43 +30,143 @@ def _get_environment_var(parameter_name, default=None):
     return os.environ.get(environment_variable, default)
 
 
-def get(parameter_name: str, type_):
+class Settings:
+    """Typed snapshot of the configuration.
+
+    The values are read from the ini files and the environment variables,
+    validated and converted once, when `reload` is called. Attribute access is
+    a plain python attribute lookup.
+
+    Parameters that are not declared here are still available as strings with `get`.
     """
-    Get a configuration parameter.
+
+    postgis_db: str
+    postgis_host: str
+    postgis_user: str
+    postgis_password: str
+    wait_for_db_connection_on_import: bool
+    verbose_sqlalchemy: bool
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_timeout: int
+    db_pool_recycle: int
+    db_pool_pre_ping: bool
+    db_statement_timeout: int
+    db_export_statement_timeout: int
+    postgis_replica_host: str
+    replica_max_lag: float
+    replica_lag_check_interval: float
+    replica_read_your_writes_delay: int
+    async_database: bool
+    async_database_pool_size: int
+    server_timing: bool
+    server_timing_token: str
+    response_cache_max_age: int
+    response_cache_size: int
+    magpie_url: str
+    magpie_verify_ssl: bool
+    approximate_counts_sample_rows: int
+    batch_export_cache_dir: str
+    batch_creation_url: str
+    batch_creation_timeout: float
+    batch_creation_retries: int
+    allow_cors: bool
+    gs_datastore_url: str
+    gs_datastore_user: str
+    gs_datastore_password: str
+    gs_mirror_url: str
+    gs_mirror_user: str
+    gs_mirror_password: str
+    gs_yaml_config: str
+    sentry_url: str
+    sentry_environment: str
+    sentry_server_name: str
+
+    def __init__(self):
+        self._raw = {}
+
+    def _load(self, raw: Dict[str, str]):
+        """Convert and set all the values, or raise a ValueError listing the errors."""
+        values = {}
+        errors = []
+        for name, type_ in self.__annotations__.items():
+            if name not in raw:
+                errors.append(f"{name}: missing")
+                continue
+            try:
+                values[name] = _convert(raw[name], type_)
+            except ValueError as e:
+                errors.append(f"{name}: {e}")
+        if errors:
+            raise ValueError("Invalid configuration: " + ", ".join(errors))
+
+        self.__dict__.update(values)
+        self._raw = raw
+
+    def as_dict(self) -> Dict[str, str]:
+        """The configuration, as strings."""
+        return dict(self._raw)
+
+
+settings = Settings()
+
+# values converted by `get`, by (parameter_name, type_)
+_converted = {}
+
+
+def reload() -> Settings:
+    """Read the configuration again, from the ini files and the environment.
+
     In order of priority:
       - environment variables prefixed by `GEOIMAGENET_API_`
       - parameters in the ini file located in GEOIMAGENET_API_CONFIG environment variable
       - parameters in the ./custom.ini file
       - parameters in the ./default.ini file
+
+    The `settings` object is updated in place, so references to it stay valid.
+    """
+    global config_ini
+    config_ini = None
+    configuration = _load_config_ini()["geoimagenet_api"]
+
+    raw = {}
+    for name, from_config in configuration.items():
+        raw[name] = _get_environment_var(name) or from_config
+
+    settings._load(raw)
+    _converted.clear()
+    return settings
+
+
+def get(parameter_name: str, type_):
+    """
+    Get a configuration parameter, from the snapshot taken by `reload`.
+
     :param parameter_name: the name of the config element to get
     :param type_: the type of the parameter. Booleans are handled. (ex: bool('false') -> False)
     """
-    config = _load_config_ini()
+    key = (parameter_name, type_)
+    try:
+        return _converted[key]
+    except KeyError:
+        pass
 
-    configuration = config["geoimagenet_api"]
-    if parameter_name not in configuration:
+    if parameter_name not in settings._raw:
         raise KeyError("Parameter name not found in configuration.")
 
-    from_environment = _get_environment_var(parameter_name)
-    from_config = configuration[parameter_name]
-
-    conversion_function = {bool: _convert_bool}.get(type_, type_)
-
-    return conversion_function(from_environment or from_config)
+    value = _convert(settings._raw[parameter_name], type_)
+    _converted[key] = value
+    return value
 
 
 def get_all_config() -> Dict:
     """Returns the complete configuration as a dict"""
+    return settings.as_dict()
 
-    config = _load_config_ini()
-    configuration = config["geoimagenet_api"]
 
-    for param in configuration:
-        from_environment = _get_environment_var(param)
-        if from_environment:
-            configuration[param] = from_environment
-
-    return configuration
+def _convert(value: str, type_):
+    conversion_function = {bool: _convert_bool}.get(type_, type_)
+    return conversion_function(value)
 
 
 def _convert_bool(value):
@@ -76,11 +176,22 @@ def _convert_bool(value):
     return boolean_states[value.lower()]
 
 
-def get_database_url():
+def get_database_url(host: str = None):
     db = get("postgis_db", str)
-    host = get("postgis_host", str)
+    host = host or get("postgis_host", str)
     username = get("postgis_user", str)
     password = get("postgis_password", str)
     url = f"postgresql://{username}:{password}@{host}/{db}"
 
     return url
+
+
+def get_replica_database_url() -> Optional[str]:
+    """Url of the read replica, or None when no replica is configured."""
+    host = get("postgis_replica_host", str)
+    if not host:
+        return None
+    return get_database_url(host)
+
+
+reload()
@@ -0,0 +1,56 @@
+"""25_batch_submission
+
+Revision ID: 1f6d4b8e2c57
+Revises: 5a8c3e1f7b24
+Create Date: 2020-08-12 15:20:48.330127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision = "1f6d4b8e2c57"
+down_revision = "5a8c3e1f7b24"
+branch_labels = None
+depends_on = None
+
+statuses = ("pending", "sent", "failed")
+
+
+def upgrade():
+    op.create_table(
+        "batch_submission",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum(*statuses, name="batch_submission_status_enum"),
+            server_default="pending",
+            nullable=False,
+        ),
+        sa.Column("batch_url", sa.String(), nullable=False),
+        sa.Column("sent_to_ml", sa.JSON(), nullable=False),
+        sa.Column("response_from_ml", sa.JSON(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("NOW()"), nullable=False
+        ),
+        sa.Column(
+            "updated_at", sa.DateTime(), server_default=sa.text("NOW()"), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_batch_submission_status"),
+        "batch_submission",
+        ["status"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_batch_submission_status"), table_name="batch_submission")
+    op.drop_table("batch_submission")
+    op.execute("DROP TYPE IF EXISTS batch_submission_status_enum;")
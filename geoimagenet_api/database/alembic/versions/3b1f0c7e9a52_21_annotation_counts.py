@@ -0,0 +1,187 @@
+"""21_annotation_counts
+
+Revision ID: 3b1f0c7e9a52
+Revises: 6d80bc41d745
+Create Date: 2020-08-03 10:12:41.228417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "3b1f0c7e9a52"
+down_revision = "6d80bc41d745"
+branch_labels = None
+depends_on = None
+
+statuses = ("new", "pre_released", "released", "review", "validated", "rejected", "deleted")
+
+# image_id is nullable, so the unique key is built on coalesce(image_id, 0)
+# to be usable by the 'on conflict' clause
+unique_index = """
+    CREATE UNIQUE INDEX uc_annotation_count ON annotation_count
+    (taxonomy_class_id, (COALESCE(image_id, 0)), annotator_id, status, review_requested);
+"""
+
+annotation_count_add = """
+    CREATE OR REPLACE FUNCTION annotation_count_add(
+        _taxonomy_class_id integer,
+        _image_id integer,
+        _annotator_id integer,
+        _status annotation_status_enum,
+        _review_requested boolean,
+        _delta integer
+    ) RETURNS void AS $$
+        DECLARE
+            remaining integer;
+        BEGIN
+            IF _delta > 0 THEN
+                INSERT INTO annotation_count AS c
+                (taxonomy_class_id, image_id, annotator_id, status, review_requested, annotation_count)
+                VALUES (_taxonomy_class_id, _image_id, _annotator_id, _status, _review_requested, _delta)
+                ON CONFLICT (taxonomy_class_id, (COALESCE(image_id, 0)), annotator_id, status, review_requested)
+                DO UPDATE SET annotation_count = c.annotation_count + EXCLUDED.annotation_count;
+            ELSE
+                UPDATE annotation_count SET annotation_count = annotation_count + _delta
+                WHERE taxonomy_class_id = _taxonomy_class_id
+                  AND COALESCE(image_id, 0) = COALESCE(_image_id, 0)
+                  AND annotator_id = _annotator_id
+                  AND status = _status
+                  AND review_requested = _review_requested
+                RETURNING annotation_count INTO remaining;
+
+                -- don't keep empty groups, the table would grow with every status change
+                IF remaining = 0 THEN
+                    DELETE FROM annotation_count
+                    WHERE taxonomy_class_id = _taxonomy_class_id
+                      AND COALESCE(image_id, 0) = COALESCE(_image_id, 0)
+                      AND annotator_id = _annotator_id
+                      AND status = _status
+                      AND review_requested = _review_requested
+                      AND annotation_count = 0;
+                END IF;
+            END IF;
+        END;
+    $$ LANGUAGE 'plpgsql';
+"""
+
+trigger_annotation_count = """
+    CREATE OR REPLACE FUNCTION annotation_count_event() RETURNS trigger AS $$
+        BEGIN
+            IF tg_op IN ('UPDATE', 'DELETE') THEN
+                PERFORM annotation_count_add(
+                    OLD.taxonomy_class_id, OLD.image_id, OLD.annotator_id,
+                    OLD.status, OLD.review_requested, -1
+                );
+            END IF;
+            IF tg_op IN ('INSERT', 'UPDATE') THEN
+                PERFORM annotation_count_add(
+                    NEW.taxonomy_class_id, NEW.image_id, NEW.annotator_id,
+                    NEW.status, NEW.review_requested, 1
+                );
+            END IF;
+            RETURN NULL;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE TRIGGER annotation_count_insert_delete AFTER INSERT OR DELETE ON annotation
+    FOR EACH ROW EXECUTE PROCEDURE annotation_count_event();
+
+    CREATE TRIGGER annotation_count_update
+    AFTER UPDATE OF taxonomy_class_id, image_id, annotator_id, status, review_requested ON annotation
+    FOR EACH ROW
+    WHEN (
+        (OLD.taxonomy_class_id, OLD.image_id, OLD.annotator_id, OLD.status, OLD.review_requested)
+        IS DISTINCT FROM
+        (NEW.taxonomy_class_id, NEW.image_id, NEW.annotator_id, NEW.status, NEW.review_requested)
+    )
+    EXECUTE PROCEDURE annotation_count_event();
+"""
+
+trigger_annotation_count_truncate = """
+    CREATE OR REPLACE FUNCTION annotation_count_truncate_event() RETURNS trigger AS $$
+        BEGIN
+            TRUNCATE annotation_count;
+            RETURN NULL;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE TRIGGER annotation_count_truncate AFTER TRUNCATE ON annotation
+    FOR EACH STATEMENT EXECUTE PROCEDURE annotation_count_truncate_event();
+"""
+
+fill_annotation_count = """
+    INSERT INTO annotation_count
+    (taxonomy_class_id, image_id, annotator_id, status, review_requested, annotation_count)
+    SELECT taxonomy_class_id, image_id, annotator_id, status, review_requested, count(*)
+    FROM annotation
+    GROUP BY taxonomy_class_id, image_id, annotator_id, status, review_requested;
+"""
+
+
+def upgrade():
+    op.create_table(
+        "annotation_count",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("taxonomy_class_id", sa.Integer(), nullable=False),
+        sa.Column("image_id", sa.Integer(), nullable=True),
+        sa.Column("annotator_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "status",
+            postgresql.ENUM(*statuses, name="annotation_status_enum", create_type=False),
+            nullable=False,
+        ),
+        sa.Column("review_requested", sa.Boolean(), nullable=False),
+        sa.Column(
+            "annotation_count", sa.Integer(), server_default="0", nullable=False
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_annotation_count_taxonomy_class_id"),
+        "annotation_count",
+        ["taxonomy_class_id"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_annotation_count_image_id"),
+        "annotation_count",
+        ["image_id"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_annotation_count_annotator_id"),
+        "annotation_count",
+        ["annotator_id"],
+        unique=False,
+    )
+    op.execute(unique_index)
+
+    # ---------
+    # Triggers
+    # ---------
+    op.execute(annotation_count_add)
+    op.execute(trigger_annotation_count)
+    op.execute(trigger_annotation_count_truncate)
+
+    # ------
+    # Migrate data
+    # ------
+    op.execute(fill_annotation_count)
+
+
+def downgrade():
+    op.execute("drop trigger if exists annotation_count_insert_delete on annotation cascade;")
+    op.execute("drop trigger if exists annotation_count_update on annotation cascade;")
+    op.execute("drop trigger if exists annotation_count_truncate on annotation cascade;")
+    op.execute("drop function if exists annotation_count_event();")
+    op.execute("drop function if exists annotation_count_truncate_event();")
+    op.execute(
+        "drop function if exists annotation_count_add("
+        "integer, integer, integer, annotation_status_enum, boolean, integer);"
+    )
+
+    op.drop_table("annotation_count")
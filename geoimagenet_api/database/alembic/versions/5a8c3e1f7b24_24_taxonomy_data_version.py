@@ -0,0 +1,44 @@
+"""24_taxonomy_data_version
+
+Revision ID: 5a8c3e1f7b24
+Revises: 9e4b2c6d8a13
+Create Date: 2020-08-10 11:02:37.514902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision = "5a8c3e1f7b24"
+down_revision = "9e4b2c6d8a13"
+branch_labels = None
+depends_on = None
+
+trigger_taxonomy_data_version = """
+    CREATE TRIGGER taxonomy_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON taxonomy
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_data_version('taxonomy');
+
+    CREATE TRIGGER taxonomy_class_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON taxonomy_class
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_data_version('taxonomy');
+"""
+
+
+def upgrade():
+    op.execute("INSERT INTO data_version (name, version) VALUES ('taxonomy', 1);")
+
+    # ---------
+    # Triggers
+    # ---------
+    op.execute(trigger_taxonomy_data_version)
+
+
+def downgrade():
+    op.execute("drop trigger if exists taxonomy_data_version on taxonomy cascade;")
+    op.execute(
+        "drop trigger if exists taxonomy_class_data_version on taxonomy_class cascade;"
+    )
+    op.execute("DELETE FROM data_version WHERE name = 'taxonomy';")
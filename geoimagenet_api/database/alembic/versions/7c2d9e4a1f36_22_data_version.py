@@ -0,0 +1,56 @@
+"""22_data_version
+
+Revision ID: 7c2d9e4a1f36
+Revises: 3b1f0c7e9a52
+Create Date: 2020-08-05 14:31:09.671204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision = "7c2d9e4a1f36"
+down_revision = "3b1f0c7e9a52"
+branch_labels = None
+depends_on = None
+
+# The first argument of the trigger is the name of the data version to increment
+bump_data_version = """
+    CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO data_version (name, version) VALUES (TG_ARGV[0], 1)
+            ON CONFLICT (name) DO UPDATE SET version = data_version.version + 1;
+            RETURN NULL;
+        END;
+    $$ LANGUAGE 'plpgsql';
+"""
+
+trigger_image_data_version = """
+    CREATE TRIGGER image_data_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON image
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_data_version('image');
+"""
+
+
+def upgrade():
+    op.create_table(
+        "data_version",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("version", sa.BigInteger(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    op.execute("INSERT INTO data_version (name, version) VALUES ('image', 1);")
+
+    # ---------
+    # Triggers
+    # ---------
+    op.execute(bump_data_version)
+    op.execute(trigger_image_data_version)
+
+
+def downgrade():
+    op.execute("drop trigger if exists image_data_version on image cascade;")
+    op.execute("drop function if exists bump_data_version();")
+    op.drop_table("data_version")
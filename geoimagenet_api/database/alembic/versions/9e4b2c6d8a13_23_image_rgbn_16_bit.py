@@ -0,0 +1,141 @@
+"""23_image_rgbn_16_bit
+
+Revision ID: 9e4b2c6d8a13
+Revises: 7c2d9e4a1f36
+Create Date: 2020-08-07 09:48:22.105396
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision = "9e4b2c6d8a13"
+down_revision = "7c2d9e4a1f36"
+branch_labels = None
+depends_on = None
+
+# Pair a single image with the closest 16 bits RGBN image of the same sensor
+pair_image_rgbn_16_bit = """
+    CREATE OR REPLACE FUNCTION pair_image_rgbn_16_bit(_image_id integer) RETURNS void AS $$
+        BEGIN
+            DELETE FROM image_rgbn_16_bit WHERE image_id = _image_id;
+
+            INSERT INTO image_rgbn_16_bit (image_id, rgbn_16_bit_image_id)
+            SELECT i.id, i16.id
+            FROM image i
+                JOIN image i16 ON i16.sensor_name = i.sensor_name
+                    AND i16.bits = 16
+                    AND i16.bands = 'RGBN'
+            WHERE i.id = _image_id
+            ORDER BY levenshtein(i.filename, i16.filename), i16.id
+            LIMIT 1;
+        END;
+    $$ LANGUAGE 'plpgsql';
+"""
+
+# Only the pairings affected by the modified row are computed again:
+#  - a new (or renamed) image is paired with the 16 bits images of its sensor
+#  - a new 16 bits RGBN image replaces the pairings of the images it is closer to
+#  - the images paired with a removed 16 bits RGBN image are paired again
+trigger_image_rgbn_16_bit = """
+    CREATE OR REPLACE FUNCTION image_rgbn_16_bit_event() RETURNS trigger AS $$
+        BEGIN
+            IF tg_op IN ('UPDATE', 'DELETE') AND OLD.bits = 16 AND OLD.bands = 'RGBN' THEN
+                PERFORM pair_image_rgbn_16_bit(p.image_id)
+                FROM image_rgbn_16_bit p
+                WHERE p.rgbn_16_bit_image_id = OLD.id AND p.image_id != OLD.id;
+            END IF;
+
+            IF tg_op = 'DELETE' THEN
+                RETURN NULL;
+            END IF;
+
+            PERFORM pair_image_rgbn_16_bit(NEW.id);
+
+            IF NEW.bits = 16 AND NEW.bands = 'RGBN' THEN
+                INSERT INTO image_rgbn_16_bit AS p (image_id, rgbn_16_bit_image_id)
+                SELECT i.id, NEW.id
+                FROM image i
+                    LEFT JOIN image_rgbn_16_bit current_pair ON current_pair.image_id = i.id
+                    LEFT JOIN image current_16 ON current_16.id = current_pair.rgbn_16_bit_image_id
+                WHERE i.sensor_name = NEW.sensor_name
+                  AND i.id != NEW.id
+                  AND (
+                    current_16.id IS NULL
+                    OR (levenshtein(i.filename, NEW.filename), NEW.id)
+                        < (levenshtein(i.filename, current_16.filename), current_16.id)
+                  )
+                ON CONFLICT (image_id)
+                DO UPDATE SET rgbn_16_bit_image_id = EXCLUDED.rgbn_16_bit_image_id;
+            END IF;
+            RETURN NULL;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE TRIGGER image_rgbn_16_bit_insert_delete AFTER INSERT OR DELETE ON image
+    FOR EACH ROW EXECUTE PROCEDURE image_rgbn_16_bit_event();
+
+    CREATE TRIGGER image_rgbn_16_bit_update
+    AFTER UPDATE OF sensor_name, bands, bits, filename ON image
+    FOR EACH ROW
+    WHEN (
+        (OLD.sensor_name, OLD.bands, OLD.bits, OLD.filename)
+        IS DISTINCT FROM
+        (NEW.sensor_name, NEW.bands, NEW.bits, NEW.filename)
+    )
+    EXECUTE PROCEDURE image_rgbn_16_bit_event();
+"""
+
+fill_image_rgbn_16_bit = """
+    INSERT INTO image_rgbn_16_bit (image_id, rgbn_16_bit_image_id)
+    SELECT DISTINCT ON (i.id) i.id, i16.id
+    FROM image i
+        JOIN image i16 ON i16.sensor_name = i.sensor_name
+            AND i16.bits = 16
+            AND i16.bands = 'RGBN'
+    ORDER BY i.id, levenshtein(i.filename, i16.filename), i16.id;
+"""
+
+
+def upgrade():
+    # rgbn_16_bit_image_id has no foreign key: when a 16 bits image is deleted,
+    # the trigger pairs the images again instead of deleting their rows
+    op.create_table(
+        "image_rgbn_16_bit",
+        sa.Column("image_id", sa.Integer(), nullable=False),
+        sa.Column("rgbn_16_bit_image_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["image_id"], ["image.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("image_id"),
+    )
+    op.create_index(
+        op.f("ix_image_rgbn_16_bit_rgbn_16_bit_image_id"),
+        "image_rgbn_16_bit",
+        ["rgbn_16_bit_image_id"],
+        unique=False,
+    )
+
+    # ---------
+    # Triggers
+    # ---------
+    op.execute(pair_image_rgbn_16_bit)
+    op.execute(trigger_image_rgbn_16_bit)
+
+    # ------
+    # Migrate data
+    # ------
+    op.execute(fill_image_rgbn_16_bit)
+
+
+def downgrade():
+    op.execute("drop trigger if exists image_rgbn_16_bit_insert_delete on image cascade;")
+    op.execute("drop trigger if exists image_rgbn_16_bit_update on image cascade;")
+    op.execute("drop function if exists image_rgbn_16_bit_event();")
+    op.execute("drop function if exists pair_image_rgbn_16_bit(integer);")
+
+    op.drop_index(
+        op.f("ix_image_rgbn_16_bit_rgbn_16_bit_image_id"),
+        table_name="image_rgbn_16_bit",
+    )
+    op.drop_table("image_rgbn_16_bit")
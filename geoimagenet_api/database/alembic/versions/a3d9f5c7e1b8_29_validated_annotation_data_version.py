@@ -0,0 +1,63 @@
+"""29_validated_annotation_data_version
+
+Revision ID: a3d9f5c7e1b8
+Revises: c4f1a8e6d2b7
+Create Date: 2020-08-31 10:17:52.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision = "a3d9f5c7e1b8"
+down_revision = "c4f1a8e6d2b7"
+branch_labels = None
+depends_on = None
+
+# The batch export only contains validated annotations, so only the writes
+# of validated annotations bump the version. The other annotation writes are
+# frequent, and would all wait for the lock of the data_version row.
+# The version is bumped for each row, because statement triggers can't see the rows
+# before postgresql 10.
+trigger_validated_annotation_data_version = """
+    CREATE TRIGGER validated_annotation_data_version_insert
+    AFTER INSERT ON annotation
+    FOR EACH ROW WHEN (NEW.status = 'validated')
+    EXECUTE PROCEDURE bump_data_version('validated_annotation');
+
+    CREATE TRIGGER validated_annotation_data_version_update
+    AFTER UPDATE ON annotation
+    FOR EACH ROW WHEN (OLD.status = 'validated' OR NEW.status = 'validated')
+    EXECUTE PROCEDURE bump_data_version('validated_annotation');
+
+    CREATE TRIGGER validated_annotation_data_version_delete
+    AFTER DELETE ON annotation
+    FOR EACH ROW WHEN (OLD.status = 'validated')
+    EXECUTE PROCEDURE bump_data_version('validated_annotation');
+
+    CREATE TRIGGER validated_annotation_data_version_truncate
+    AFTER TRUNCATE ON annotation
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_data_version('validated_annotation');
+"""
+
+
+def upgrade():
+    op.execute(
+        "INSERT INTO data_version (name, version) VALUES ('validated_annotation', 1);"
+    )
+
+    # ---------
+    # Triggers
+    # ---------
+    op.execute(trigger_validated_annotation_data_version)
+
+
+def downgrade():
+    for event in ("insert", "update", "delete", "truncate"):
+        op.execute(
+            f"drop trigger if exists validated_annotation_data_version_{event} "
+            "on annotation cascade;"
+        )
+    op.execute("DELETE FROM data_version WHERE name = 'validated_annotation';")
@@ -0,0 +1,199 @@
+"""26_statement_level_annotation_log
+
+Revision ID: b5e8f2a4c913
+Revises: 1f6d4b8e2c57
+Create Date: 2020-08-20 10:41:17.602855
+
+"""
+import sys
+from pathlib import Path
+
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision = "b5e8f2a4c913"
+down_revision = "1f6d4b8e2c57"
+branch_labels = None
+depends_on = None
+
+# transition tables (REFERENCING NEW TABLE ...) were added in postgresql 10
+TRANSITION_TABLES_SERVER_VERSION = (10,)
+
+# The annotation_log is written once per statement, from the transition tables.
+# Like before, geometry updates (which can happen way too often) are not logged,
+# and the updated values are logged only when they changed.
+# The geometries are compared on their binary representation, which is a lot
+# cheaper than st_equals.
+# A trigger with transition tables can only have a single event.
+trigger_annotation_log_statement = """
+    CREATE OR REPLACE FUNCTION annotation_log_insert_event() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO annotation_log
+            (annotation_id, annotator_id, geometry, taxonomy_class_id, image_id, status, review_requested, operation)
+            SELECT id, annotator_id, geometry, taxonomy_class_id, image_id, status, review_requested,
+                   'insert'::annotation_log_operation_enum
+            FROM new_annotation
+            ORDER BY id;
+            RETURN NULL;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE OR REPLACE FUNCTION annotation_log_update_event() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO annotation_log
+            (annotation_id, annotator_id, taxonomy_class_id, image_id, status, review_requested, operation)
+            SELECT
+                n.id,
+                CASE WHEN o.annotator_id = n.annotator_id THEN NULL ELSE n.annotator_id END,
+                CASE WHEN o.taxonomy_class_id = n.taxonomy_class_id THEN NULL ELSE n.taxonomy_class_id END,
+                CASE WHEN o.image_id = n.image_id THEN NULL ELSE n.image_id END,
+                CASE WHEN o.status = n.status THEN NULL ELSE n.status END,
+                CASE WHEN o.review_requested = n.review_requested THEN NULL ELSE n.review_requested END,
+                'update'::annotation_log_operation_enum
+            FROM new_annotation n
+            JOIN old_annotation o ON o.id = n.id
+            WHERE o.geometry::bytea = n.geometry::bytea
+            ORDER BY n.id;
+            RETURN NULL;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE OR REPLACE FUNCTION annotation_log_delete_event() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO annotation_log (annotation_id, operation)
+            SELECT id, 'delete'::annotation_log_operation_enum
+            FROM old_annotation
+            ORDER BY id;
+            RETURN NULL;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE TRIGGER log_annotation_insert AFTER INSERT ON annotation
+    REFERENCING NEW TABLE AS new_annotation
+    FOR EACH STATEMENT EXECUTE PROCEDURE annotation_log_insert_event();
+
+    CREATE TRIGGER log_annotation_update AFTER UPDATE ON annotation
+    REFERENCING OLD TABLE AS old_annotation NEW TABLE AS new_annotation
+    FOR EACH STATEMENT EXECUTE PROCEDURE annotation_log_update_event();
+
+    CREATE TRIGGER log_annotation_delete AFTER DELETE ON annotation
+    REFERENCING OLD TABLE AS old_annotation
+    FOR EACH STATEMENT EXECUTE PROCEDURE annotation_log_delete_event();
+"""
+
+# For postgresql < 10, the row level trigger is kept, only st_equals is replaced
+trigger_annotation_save_row = """
+    CREATE OR REPLACE FUNCTION annotation_save_event() RETURNS trigger AS $$
+        BEGIN
+            -- If it's not a geometry update (which can happen way too often), log the action
+            IF tg_op = 'INSERT' OR OLD.geometry::bytea = NEW.geometry::bytea THEN
+                INSERT INTO annotation_log
+                (annotation_id, annotator_id, geometry, taxonomy_class_id, image_id, status, review_requested, operation)
+                VALUES (
+                    NEW.id,
+                    CASE WHEN tg_op = 'INSERT' THEN NEW.annotator_id
+                         WHEN OLD.annotator_id = NEW.annotator_id THEN NULL
+                         ELSE NEW.annotator_id
+                    END,
+                    CASE WHEN tg_op = 'INSERT' THEN NEW.geometry
+                         ELSE NULL
+                    END,
+                    CASE WHEN tg_op = 'INSERT' THEN NEW.taxonomy_class_id
+                         WHEN OLD.taxonomy_class_id = NEW.taxonomy_class_id THEN NULL
+                         ELSE NEW.taxonomy_class_id
+                    END,
+                    CASE WHEN tg_op = 'INSERT' THEN NEW.image_id
+                         WHEN OLD.image_id = NEW.image_id THEN NULL
+                         ELSE NEW.image_id
+                    END,
+                    CASE WHEN tg_op = 'INSERT' THEN NEW.status::annotation_status_enum
+                         WHEN OLD.status = NEW.status THEN NULL
+                         ELSE NEW.status
+                    END,
+                    CASE WHEN tg_op = 'INSERT' THEN NEW.review_requested
+                         WHEN OLD.review_requested = NEW.review_requested THEN NULL
+                         ELSE NEW.review_requested
+                    END,
+                    lower(tg_op)::annotation_log_operation_enum
+                );
+            END IF;
+            RETURN NULL;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE TRIGGER log_annotation_action AFTER INSERT OR UPDATE ON annotation
+    FOR EACH ROW EXECUTE PROCEDURE annotation_save_event();
+"""
+
+# as created in fba33e3dbe70_03_indices_and_annotation_status
+trigger_annotation_delete_row = """
+    CREATE OR REPLACE FUNCTION annotation_delete_event() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO annotation_log
+                (
+                    annotation_id,
+                    operation
+                )
+            VALUES (
+                OLD.id,
+                'delete'::annotation_log_operation_enum
+            );
+            RETURN NEW;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE TRIGGER log_annotation_action_delete AFTER DELETE ON annotation
+    FOR EACH ROW EXECUTE PROCEDURE annotation_delete_event();
+"""
+
+
+def _drop_row_triggers():
+    op.execute("drop trigger if exists log_annotation_action on annotation cascade;")
+    op.execute(
+        "drop trigger if exists log_annotation_action_delete on annotation cascade;"
+    )
+
+
+def _drop_statement_triggers():
+    op.execute("drop trigger if exists log_annotation_insert on annotation cascade;")
+    op.execute("drop trigger if exists log_annotation_update on annotation cascade;")
+    op.execute("drop trigger if exists log_annotation_delete on annotation cascade;")
+    op.execute("drop function if exists annotation_log_insert_event();")
+    op.execute("drop function if exists annotation_log_update_event();")
+    op.execute("drop function if exists annotation_log_delete_event();")
+
+
+def upgrade():
+    # ---------
+    # Triggers
+    # ---------
+    server_version = op.get_bind().dialect.server_version_info
+    if server_version >= TRANSITION_TABLES_SERVER_VERSION:
+        _drop_row_triggers()
+        op.execute("drop function if exists annotation_save_event();")
+        op.execute("drop function if exists annotation_delete_event();")
+        op.execute(trigger_annotation_log_statement)
+    else:
+        op.execute(
+            "drop trigger if exists log_annotation_action on annotation cascade;"
+        )
+        op.execute(trigger_annotation_save_row)
+
+
+def downgrade():
+    # ---------
+    # Triggers
+    # ---------
+    _drop_statement_triggers()
+    _drop_row_triggers()
+
+    sys.path.append(str(Path(__file__).parent))
+    from d714ede8fd71_14_dont_log_geometry_updates import (
+        trigger_annotation_save as old_trigger_annotation,
+    )
+
+    op.execute(old_trigger_annotation)
+    op.execute(trigger_annotation_delete_row)
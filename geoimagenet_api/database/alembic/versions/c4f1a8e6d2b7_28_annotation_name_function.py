@@ -0,0 +1,90 @@
+"""28_annotation_name_function
+
+Revision ID: c4f1a8e6d2b7
+Revises: e3a7c1d9b462
+Create Date: 2020-08-26 14:03:29.915724
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision = "c4f1a8e6d2b7"
+down_revision = "e3a7c1d9b462"
+branch_labels = None
+depends_on = None
+
+# Name of the setting telling the insert trigger that the names are already
+# computed with annotation_name, set with SET LOCAL by the bulk insert of
+# post_annotations. The codes are joined from taxonomy_class in that insert,
+# so the names are the same as the trigger's.
+BULK_NAMES_SETTING = "geoimagenet.annotation_names_computed"
+
+# The name computation is in its own function, so that bulk inserts can compute
+# the names set-wise. It's STABLE and not IMMUTABLE, because ST_Transform reads
+# spatial_ref_sys.
+# The names are identical to the ones of migration 2dd1abf5cb94.
+function_annotation_name = """
+    CREATE OR REPLACE FUNCTION annotation_name(geometry geometry, code text)
+    RETURNS text AS $$
+        SELECT COALESCE(code, '') || '_' ||
+               to_char(ST_Y(centroid), 'SG099.999999') || '_' ||
+               to_char(ST_X(centroid), 'SG099.999999')
+        FROM (SELECT ST_Centroid(ST_Transform(geometry, 4326)) AS centroid) AS c;
+    $$ LANGUAGE sql STABLE;
+"""
+
+# The insert trigger runs for every row, except in the transactions of the bulk
+# inserts setting BULK_NAMES_SETTING. A name given in any other insert is replaced.
+trigger_annotation_name = f"""
+    CREATE OR REPLACE FUNCTION annotation_update_name() RETURNS trigger AS $$
+        BEGIN
+            NEW.name := annotation_name(
+                NEW.geometry,
+                (SELECT code FROM taxonomy_class WHERE id = NEW.taxonomy_class_id)
+            );
+            RETURN NEW;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE TRIGGER annotation_name_on_insert BEFORE INSERT ON annotation
+    FOR EACH ROW
+    WHEN (current_setting('{BULK_NAMES_SETTING}', true) IS DISTINCT FROM 'on')
+    EXECUTE PROCEDURE annotation_update_name();
+"""
+
+# as created in 2dd1abf5cb94_10_annotation_friendly_name
+old_trigger_annotation_name = """
+    CREATE OR REPLACE FUNCTION annotation_update_name() RETURNS trigger AS $$
+        DECLARE
+            centroid geometry;
+        BEGIN
+            centroid := ST_Centroid(ST_Transform(NEW.geometry, 4326));
+            NEW.name := (SELECT COALESCE(code, '') FROM taxonomy_class WHERE id=NEW.taxonomy_class_id) || '_' ||
+                        to_char(ST_Y(centroid), 'SG099.999999') || '_' ||
+                        to_char(ST_X(centroid), 'SG099.999999');
+            RETURN NEW;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE TRIGGER annotation_name_on_insert BEFORE INSERT ON annotation
+    FOR EACH ROW EXECUTE PROCEDURE annotation_update_name();
+"""
+
+
+def upgrade():
+    # ---------
+    # Triggers
+    # ---------
+    op.execute(function_annotation_name)
+    op.execute("drop trigger if exists annotation_name_on_insert on annotation cascade;")
+    # the annotation_name_on_update trigger uses the new function as is
+    op.execute(trigger_annotation_name)
+
+
+def downgrade():
+    op.execute("drop trigger if exists annotation_name_on_insert on annotation cascade;")
+    op.execute(old_trigger_annotation_name)
+    op.execute("drop function if exists annotation_name(geometry, text);")
@@ -0,0 +1,51 @@
+"""27_annotation_updated_at
+
+Revision ID: e3a7c1d9b462
+Revises: b5e8f2a4c913
+Create Date: 2020-08-24 09:12:53.481307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision = "e3a7c1d9b462"
+down_revision = "b5e8f2a4c913"
+branch_labels = None
+depends_on = None
+
+# updated_at was assigned in the AFTER trigger annotation_save_event, where it had no
+# effect. It's now set before the row is written, only when a value really changed.
+trigger_annotation_updated_at = """
+    CREATE OR REPLACE FUNCTION annotation_set_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at = now();
+            RETURN NEW;
+        END;
+    $$ LANGUAGE 'plpgsql';
+
+    CREATE TRIGGER annotation_updated_at BEFORE UPDATE ON annotation
+    FOR EACH ROW
+    WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE PROCEDURE annotation_set_updated_at();
+"""
+
+
+def upgrade():
+    op.create_index(
+        op.f("ix_annotation_updated_at"), "annotation", ["updated_at"], unique=False
+    )
+
+    # ---------
+    # Triggers
+    # ---------
+    op.execute(trigger_annotation_updated_at)
+
+
+def downgrade():
+    op.execute("drop trigger if exists annotation_updated_at on annotation cascade;")
+    op.execute("drop function if exists annotation_set_updated_at();")
+
+    op.drop_index(op.f("ix_annotation_updated_at"), table_name="annotation")
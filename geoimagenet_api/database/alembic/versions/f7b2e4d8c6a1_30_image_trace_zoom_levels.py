@@ -0,0 +1,90 @@
+"""30_image_trace_zoom_levels
+
+Revision ID: f7b2e4d8c6a1
+Revises: a3d9f5c7e1b8
+Create Date: 2020-09-02 15:41:08.204617
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision = "f7b2e4d8c6a1"
+down_revision = "a3d9f5c7e1b8"
+branch_labels = None
+depends_on = None
+
+# Size of a web mercator pixel at zoom level 0, in meters
+ZOOM_0_RESOLUTION = 156543.03392804097
+
+# The trace_zoom_<zoom> columns hold the traces simplified to a tolerance of one
+# pixel at this zoom level, for the image search at low zoom levels.
+# They must match TRACE_ZOOM_LEVELS in geoimagenet_api.endpoints.images
+TRACE_ZOOM_LEVELS = (3, 6, 9, 12)
+
+
+def _simplified_traces(prefix: str, separator: str) -> str:
+    """Assignments of the trace_zoom_<zoom> columns, from trace_simplified."""
+    # preserve topology, so that small traces don't collapse to an empty geometry
+    return separator.join(
+        f"{prefix}trace_zoom_{zoom} = ST_SimplifyPreserveTopology("
+        f"{prefix}trace_simplified, {ZOOM_0_RESOLUTION / 2 ** zoom})"
+        for zoom in TRACE_ZOOM_LEVELS
+    )
+
+
+set_new_traces = _simplified_traces("NEW.", ";\n                ")
+trigger_trace_simplified = f"""
+    CREATE OR REPLACE FUNCTION set_trace_simplified_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.trace NOTNULL THEN
+                NEW.trace_simplified = st_simplify(NEW.trace, 5);
+                {set_new_traces};
+            END IF;
+            RETURN NEW;
+        END;
+    $$ LANGUAGE 'plpgsql';
+"""
+
+# as created in 2d7013cf6647_19_add_trace_simplified
+old_trigger_trace_simplified = """
+    CREATE OR REPLACE FUNCTION set_trace_simplified_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.trace NOTNULL THEN
+                NEW.trace_simplified = st_simplify(NEW.trace, 5);
+            END IF;
+            RETURN NEW;
+        END;
+    $$ LANGUAGE 'plpgsql';
+"""
+
+
+def upgrade():
+    for zoom in TRACE_ZOOM_LEVELS:
+        op.add_column(
+            "image",
+            sa.Column(
+                f"trace_zoom_{zoom}",
+                geoalchemy2.types.Geometry(
+                    geometry_type="POLYGON", srid=3857, spatial_index=False
+                ),
+                nullable=True,
+            ),
+        )
+
+    # ---------
+    # Triggers
+    # ---------
+    op.execute(trigger_trace_simplified)
+
+    set_traces = _simplified_traces("", ", ")
+    op.execute(f"UPDATE image SET {set_traces} WHERE trace_simplified NOTNULL;")
+
+
+def downgrade():
+    op.execute(old_trigger_trace_simplified)
+
+    for zoom in TRACE_ZOOM_LEVELS:
+        op.drop_column("image", f"trace_zoom_{zoom}")
@@ -0,0 +1,100 @@
+"""
+Command line script to verify and rebuild the annotation_count table.
+
+The annotation_count table is kept up to date by triggers on the annotation table.
+It should never be necessary to rebuild it, unless the triggers were
+disabled or the table was modified by hand.
+"""
+from typing import List
+
+import click
+from sqlalchemy.orm import Session
+
+from geoimagenet_api.database.connection import connection_manager
+
+grouping_columns = (
+    "taxonomy_class_id",
+    "image_id",
+    "annotator_id",
+    "status",
+    "review_requested",
+)
+
+_columns = ", ".join(grouping_columns)
+
+differences_query = f"""
+    WITH expected AS (
+        SELECT {_columns}, count(*) AS annotation_count
+        FROM annotation
+        GROUP BY {_columns}
+    )
+    SELECT {", ".join(f"COALESCE(e.{c}, s.{c}) AS {c}" for c in grouping_columns)},
+        COALESCE(e.annotation_count, 0) AS expected,
+        COALESCE(s.annotation_count, 0) AS stored
+    FROM expected e
+        FULL OUTER JOIN annotation_count s ON
+            {" AND ".join(f"e.{c} IS NOT DISTINCT FROM s.{c}" for c in grouping_columns)}
+    WHERE COALESCE(e.annotation_count, 0) != COALESCE(s.annotation_count, 0);
+"""
+
+
+def annotation_count_differences(session: Session) -> List:
+    """Compare the annotation_count table with the counts computed from the annotation table.
+
+    Returns the rows that don't match, with the `expected` and `stored` counts.
+    An empty list means the table is consistent.
+    """
+    return session.execute(differences_query).fetchall()
+
+
+def rebuild_annotation_counts(session: Session):
+    """Recompute the whole annotation_count table from the annotation table.
+
+    The annotation table is locked against writes during the rebuild, so that
+    no trigger can modify the counts while they are being recomputed.
+    """
+    session.execute("LOCK TABLE annotation IN SHARE MODE;")
+    session.execute("DELETE FROM annotation_count;")
+    session.execute(
+        f"""
+        INSERT INTO annotation_count ({_columns}, annotation_count)
+        SELECT {_columns}, count(*)
+        FROM annotation
+        GROUP BY {_columns};
+        """
+    )
+    session.commit()
+
+
+@click.command()
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    help="Rebuild the table when differences are found.",
+)
+def cli(rebuild):
+    """Verify that the annotation_count table matches the annotation table.
+
+    Exits with a non-zero status code if differences are found and
+    the table was not rebuilt.
+    """
+    with connection_manager.get_db_session() as session:
+        differences = annotation_count_differences(session)
+        for row in differences:
+            group = ", ".join(f"{c}={row[c]}" for c in grouping_columns)
+            click.echo(f"{group}: expected={row.expected} stored={row.stored}")
+
+        if not differences:
+            click.echo("annotation_count is consistent.")
+            return
+
+        click.echo(f"{len(differences)} differences found.")
+        if not rebuild:
+            raise SystemExit(1)
+
+        rebuild_annotation_counts(session)
+        click.echo("annotation_count rebuilt.")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,205 @@
+"""Asynchronous database access for the read-only endpoints.
+
+When `async_database` is enabled in the configuration, the queries are executed
+with asyncpg, using one connection pool per event loop. Otherwise, they are executed
+with the sqlalchemy engine in the threadpool.
+
+In both cases, the queries are built with sqlalchemy. Queries built with
+`sqlalchemy.orm.Query` don't need to be bound to a session.
+
+All the queries executed here are read-only: they are sent to the read replica
+when one is configured and up to date, see `connection_manager.use_replica`.
+"""
+
+import asyncio
+import re
+import time
+import weakref
+from typing import Any, Callable, Dict, Hashable, List, Optional, Union
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Query
+from sqlalchemy.sql import ClauseElement
+from sqlalchemy.util import LRUCache
+from starlette.concurrency import run_in_threadpool
+
+from geoimagenet_api import config
+from geoimagenet_api.database.connection import connection_manager
+from geoimagenet_api.metrics import record_db_query
+
+# asyncpg uses $1, $2, ... placeholders
+_dialect = postgresql.dialect(paramstyle="numeric")
+_numeric_param = re.compile(r"(?<![:\w]):(\d+)")
+
+_pools = weakref.WeakKeyDictionary()
+_pool_locks = weakref.WeakKeyDictionary()
+
+
+class Row(tuple):
+    """A result row that can be accessed by index or by attribute,
+    like the rows returned by sqlalchemy."""
+
+    def __new__(cls, record):
+        row = super().__new__(cls, record.values())
+        row._keys = list(record.keys())
+        return row
+
+    def __getattr__(self, name):
+        try:
+            return self[self._keys.index(name)]
+        except ValueError:
+            raise AttributeError(name)
+
+    def keys(self):
+        return self._keys
+
+
+class CachedStatement:
+    """A statement compiled once, and executed many times with different parameters.
+
+    The values that change between executions must be `bindparam` objects,
+    and their values are given to `fetch_all` in `params`.
+
+    With asyncpg, the same sql string is sent for each execution, so the server-side
+    prepared statement of each connection is reused. With sqlalchemy,
+    the compiled form is kept in the `compiled_cache` of the connection.
+    """
+
+    def __init__(self, statement: Union[Query, ClauseElement]):
+        if isinstance(statement, Query):
+            statement = statement.statement
+        self.statement = statement
+        self._compiled = statement.compile(dialect=_dialect)
+        self.sql = _numeric_param.sub(r"$\1", self._compiled.string)
+
+    def args(self, params: Dict = None) -> List:
+        values = self._compiled.construct_params(params)
+        processors = self._compiled._bind_processors
+
+        args = []
+        for name in self._compiled.positiontup or []:
+            value = values[name]
+            if name in processors:
+                value = processors[name](value)
+            args.append(value)
+        return args
+
+
+_cached_statements: Dict[Hashable, CachedStatement] = {}
+
+# compiled forms of the cached statements, for the sqlalchemy engine
+_sqlalchemy_compiled_cache = LRUCache(1000)
+
+
+def cached_statement(
+    key: Hashable, build: Callable[[], Union[Query, ClauseElement]]
+) -> CachedStatement:
+    """Get the statement stored under `key`, or build and compile it.
+
+    The key must identify the structure of the query built by `build`
+    (for example, which filters are applied), not the values of its parameters.
+    """
+    statement = _cached_statements.get(key)
+    if statement is None:
+        statement = CachedStatement(build())
+        _cached_statements[key] = statement
+    return statement
+
+
+def compile_statement(statement: Union[Query, ClauseElement]):
+    """Compile a sqlalchemy statement to an asyncpg query and its arguments."""
+    compiled = CachedStatement(statement)
+    return compiled.sql, compiled.args()
+
+
+async def _get_pool(replica=False):
+    import asyncpg
+
+    loop = asyncio.get_event_loop()
+    pools = _pools.setdefault(loop, {})
+    pool = pools.get(replica)
+    if pool is None:
+        # only one pool is created per loop, even when the first requests
+        # arrive concurrently
+        lock = _pool_locks.setdefault(loop, asyncio.Lock())
+        async with lock:
+            pool = pools.get(replica)
+            if pool is None:
+                if replica:
+                    url = config.get_replica_database_url()
+                else:
+                    url = config.get_database_url()
+                pool = await asyncpg.create_pool(
+                    url,
+                    min_size=1,
+                    max_size=config.settings.async_database_pool_size,
+                    server_settings={
+                        "statement_timeout": str(config.settings.db_statement_timeout)
+                    },
+                )
+                pools[replica] = pool
+    return pool
+
+
+async def close_pool():
+    loop = asyncio.get_event_loop()
+    _pool_locks.pop(loop, None)
+    pools = _pools.pop(loop, {})
+    for pool in pools.values():
+        await pool.close()
+
+
+async def _use_replica() -> bool:
+    if connection_manager.replica_lag_check_due():
+        await run_in_threadpool(connection_manager.check_replica_lag)
+    return connection_manager.use_replica(check_lag=False)
+
+
+def _fetch_all_sync(statement, params: Dict = None, replica=False) -> List:
+    if replica:
+        engine = connection_manager.replica_engine
+    else:
+        engine = connection_manager.engine
+    with engine.connect() as connection:
+        if isinstance(statement, CachedStatement):
+            connection = connection.execution_options(
+                compiled_cache=_sqlalchemy_compiled_cache
+            )
+            statement = statement.statement
+        elif isinstance(statement, Query):
+            statement = statement.statement
+        return connection.execute(statement, params or {}).fetchall()
+
+
+async def fetch_all(
+    statement: Union[CachedStatement, Query, ClauseElement], params: Dict = None
+) -> List:
+    """Execute a query and return all the rows.
+
+    `params` are the values of the `bindparam` objects of the statement.
+    """
+    replica = await _use_replica()
+    if not config.settings.async_database:
+        return await run_in_threadpool(_fetch_all_sync, statement, params, replica)
+
+    if not isinstance(statement, CachedStatement):
+        statement = CachedStatement(statement)
+    pool = await _get_pool(replica)
+    async with pool.acquire() as connection:
+        start = time.perf_counter()
+        records = await connection.fetch(statement.sql, *statement.args(params))
+        # queries executed with sqlalchemy are recorded by engine events
+        record_db_query(time.perf_counter() - start, statement.sql)
+    return [Row(r) for r in records]
+
+
+async def fetch_one(statement, params: Dict = None) -> Optional[Any]:
+    """Execute a query and return the first row, or None."""
+    rows = await fetch_all(statement, params)
+    return rows[0] if rows else None
+
+
+async def fetch_scalar(statement, params: Dict = None) -> Optional[Any]:
+    """Execute a query and return the first column of the first row, or None."""
+    row = await fetch_one(statement, params)
+    return row[0] if row is not None else None
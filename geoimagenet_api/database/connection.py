@@ -1,13 +1,117 @@
 from contextlib import contextmanager
+import contextvars
 import logging
+import threading
+import time
+from typing import Dict, Optional
 
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
 from geoimagenet_api import config
 from sqlalchemy import create_engine
 from sqlalchemy.orm import scoped_session, sessionmaker, Session
+from sqlalchemy.pool import QueuePool
 
 logger = logging.getLogger(__name__)
 
+# 0 on the primary, the time since the last replayed transaction when
+# the replica is behind, and NULL when the replica has never replayed anything
+_replica_lag_query = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_{wal}_receive_{lsn}() = pg_last_{wal}_replay_{lsn}() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END;
+"""
+
+# the xlog functions were renamed in postgresql 10
+WAL_FUNCTIONS_SERVER_VERSION = (10,)
+
+
+def replica_lag_query(server_version_info) -> str:
+    """The replication lag query, using the function names of the server version."""
+    if server_version_info >= WAL_FUNCTIONS_SERVER_VERSION:
+        return _replica_lag_query.format(wal="wal", lsn="lsn")
+    return _replica_lag_query.format(wal="xlog", lsn="location")
+
+
+_primary_reads = contextvars.ContextVar("primary_reads", default=False)
+
+
+@contextmanager
+def primary_reads():
+    """Send the read-only sessions to the primary database, in this context.
+
+    This is used for requests that write, and for the reads that follow them,
+    so that the written data is always visible.
+    """
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that records the time spent waiting for a connection on checkout.
+
+    The checkout is timed in `connect`, which is called once per checkout.
+    `_do_get` can call itself again when the overflow can't be increased.
+
+    `database` is the name of the database of the pool ('primary' or 'replica').
+    """
+
+    # functions called with the pool, the wait in seconds and whether the checkout
+    # failed, after each checkout (see `geoimagenet_api.metrics`)
+    checkout_listeners = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.database = None
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_errors = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        error = False
+        try:
+            return super().connect()
+        except Exception:
+            error = True
+            with self._stats_lock:
+                self.checkout_errors += 1
+            raise
+        finally:
+            wait = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.checkout_wait_total += wait
+                self.checkout_wait_max = max(self.checkout_wait_max, wait)
+            for listener in self.checkout_listeners:
+                listener(self, wait, error)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.database = self.database
+        return pool
+
+    def stats(self) -> Dict:
+        capacity = self.size() + self._max_overflow
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_out": self.checkedout(),
+                "overflow": max(self.overflow(), 0),
+                "saturation": self.checkedout() / capacity if capacity > 0 else 0,
+                "checkouts": self.checkouts,
+                "checkout_errors": self.checkout_errors,
+                "checkout_wait_total": self.checkout_wait_total,
+                "checkout_wait_max": self.checkout_wait_max,
+            }
+
 
 class _ConnectionManager:
     """Handles the creation of the engine and sessions.
@@ -21,38 +125,139 @@ class _ConnectionManager:
     def __init__(self):
         self._engine = None
         self._session_maker = None
+        self._replica_engine = None
+        self._replica_session_maker = None
+        self._replica_lag = None
+        self._replica_checked_at = None
         self.reload_config()
 
     @property
     def engine(self):
         return self._engine
 
+    @property
+    def replica_engine(self):
+        """The engine of the read replica, None when no replica is configured."""
+        return self._replica_engine
+
     @contextmanager
-    def get_db_session(self) -> Session:
-        session = self._session_maker()
+    def get_db_session(self, export=False, read_only=False) -> Session:
+        """Get a database session.
+
+        Statements are limited by the `db_statement_timeout` configuration.
+        For long running exports, use `export=True` to use the
+        `db_export_statement_timeout` instead, for the first transaction of the session.
+
+        With `read_only=True`, the session is bound to the read replica when it
+        is configured and up to date (see `use_replica`).
+        """
+        session_maker = self._session_maker
+        if read_only and self.use_replica():
+            session_maker = self._replica_session_maker
+
+        session = session_maker()
         try:
+            if export:
+                timeout = config.settings.db_export_statement_timeout
+                session.execute(f"SET LOCAL statement_timeout = {timeout};")
             yield session
         finally:
-            self._session_maker.remove()
+            session_maker.remove()
 
-    def reload_config(self):
-        """This function is mostly useful for unit tests.
-        When calling it, there shouldn't be any checked-out connections.
+    def replica_lag_check_due(self) -> bool:
+        if self._replica_engine is None:
+            return False
+        if self._replica_checked_at is None:
+            return True
+        interval = config.settings.replica_lag_check_interval
+        return time.monotonic() - self._replica_checked_at >= interval
+
+    def check_replica_lag(self) -> Optional[float]:
+        """Query the replication lag in seconds. None if the replica can't be reached."""
+        # set first, so that concurrent requests don't all check the lag
+        self._replica_checked_at = time.monotonic()
+        try:
+            with self._replica_engine.connect() as connection:
+                query = replica_lag_query(connection.dialect.server_version_info)
+                lag = connection.execute(query).scalar()
+        except SQLAlchemyError:
+            logger.exception("Could not query the replication lag of the replica")
+            lag = None
+
+        self._replica_lag = float(lag) if lag is not None else None
+        return self._replica_lag
+
+    def use_replica(self, check_lag=True) -> bool:
+        """Whether the read-only queries of the current context go to the replica.
+
+        The primary is used when no replica is configured, inside `primary_reads`,
+        and when the replication lag is over `replica_max_lag` or unknown.
+        The lag is checked at most every `replica_lag_check_interval` seconds.
         """
-        if self._engine is not None:
-            self._engine.dispose()
+        if self._replica_engine is None or _primary_reads.get():
+            return False
+        if check_lag and self.replica_lag_check_due():
+            self.check_replica_lag()
+        max_lag = config.settings.replica_max_lag
+        return self._replica_lag is not None and self._replica_lag <= max_lag
+
+    def pool_stats(self) -> Dict:
+        """Connection pool usage and checkout wait times, since the engine creation."""
+        stats = self._engine.pool.stats()
+        if self._replica_engine is not None:
+            stats["replica"] = dict(
+                self._replica_engine.pool.stats(), lag=self._replica_lag
+            )
+        return stats
+
+    def _create_engine(self, url, database: str):
         verbose_sqlalchemy = config.get("verbose_sqlalchemy", bool)
-        self._engine = create_engine(
-            config.get_database_url(),
+        statement_timeout = config.get("db_statement_timeout", int)
+        engine = create_engine(
+            url,
             echo=verbose_sqlalchemy,
+            poolclass=_TimedQueuePool,
+            pool_size=config.get("db_pool_size", int),
+            max_overflow=config.get("db_max_overflow", int),
+            pool_timeout=config.get("db_pool_timeout", int),
+            pool_recycle=config.get("db_pool_recycle", int),
             # ping connection status before checkout
             # to avoid connection errors on database restarts
-            pool_pre_ping=True,
+            pool_pre_ping=config.get("db_pool_pre_ping", bool),
+            connect_args={"options": f"-c statement_timeout={statement_timeout}"},
         )
+        engine.pool.database = database
+        return engine
+
+    def reload_config(self):
+        """This function is mostly useful for unit tests.
+        When calling it, there shouldn't be any checked-out connections.
+
+        The configuration is read again from the ini files and the environment.
+        """
+        config.reload()
+        for engine in (self._engine, self._replica_engine):
+            if engine is not None:
+                engine.dispose()
+
+        self._engine = self._create_engine(config.get_database_url(), "primary")
         self._session_maker = scoped_session(
             sessionmaker(autocommit=False, autoflush=False, bind=self._engine)
         )
 
+        self._replica_engine = None
+        self._replica_session_maker = None
+        self._replica_lag = None
+        self._replica_checked_at = None
+        replica_url = config.get_replica_database_url()
+        if replica_url:
+            self._replica_engine = self._create_engine(replica_url, "replica")
+            self._replica_session_maker = scoped_session(
+                sessionmaker(
+                    autocommit=False, autoflush=False, bind=self._replica_engine
+                )
+            )
+
 
 connection_manager = _ConnectionManager()
 
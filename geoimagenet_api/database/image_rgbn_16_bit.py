@@ -0,0 +1,61 @@
+"""
+Maintenance of the image_rgbn_16_bit table.
+
+Each image is paired with the 16 bits RGBN image of the same sensor
+that has the closest filename (using the levenshtein distance).
+The table is kept up to date by triggers on the image table, so that
+the batch export doesn't have to compare every pair of filenames.
+"""
+import os
+
+from sqlalchemy import func, String, cast
+from sqlalchemy.orm import Query, Session
+
+from geoimagenet_api.database.models import Image, ImageRgbn16Bit
+
+pairings_query = """
+    SELECT DISTINCT ON (i.id) i.id AS image_id, i16.id AS rgbn_16_bit_image_id
+    FROM image i
+        JOIN image i16 ON i16.sensor_name = i.sensor_name
+            AND i16.bits = 16
+            AND i16.bands = 'RGBN'
+    ORDER BY i.id, levenshtein(i.filename, i16.filename), i16.id
+"""
+
+
+def rebuild_image_rgbn_16_bit(session: Session):
+    """Recompute every pairing of the image_rgbn_16_bit table.
+
+    The image table is locked against writes during the rebuild.
+    """
+    session.execute("LOCK TABLE image IN SHARE MODE;")
+    session.execute("DELETE FROM image_rgbn_16_bit;")
+    session.execute(
+        f"""
+        INSERT INTO image_rgbn_16_bit (image_id, rgbn_16_bit_image_id)
+        {pairings_query};
+        """
+    )
+    session.commit()
+
+
+def query_image_rgbn_16_bit(session: Session) -> Query:
+    """Query the image ids, and the path of their 16 bits RGBN image.
+
+    The path is formatted as {sensor_name}_{bands}_{bits}/{filename}{extension}
+    Example: PLEIADES_RGBN_16/Pleiades_20141012_RGBN_50cm_16bits_AOI_14_Prespatou_BC.tif
+    """
+    image_name = func.concat(
+        Image.sensor_name,
+        "_",
+        Image.bands,
+        "_",
+        cast(Image.bits, String),
+        os.path.sep,
+        Image.filename,
+        Image.extension,
+    ).label("image_name")
+
+    return session.query(ImageRgbn16Bit.image_id, image_name).join(
+        Image, Image.id == ImageRgbn16Bit.rgbn_16_bit_image_id
+    )
@@ -2,6 +2,7 @@ import enum
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
     String,
     ForeignKey,
     DateTime,
@@ -10,6 +11,7 @@ from sqlalchemy import (
     UniqueConstraint,
     CheckConstraint,
     Index,
+    JSON,
 )
 from sqlalchemy import Enum
 from sqlalchemy.orm import relationship, backref
@@ -67,7 +69,10 @@ class Annotation(Base):
     geometry = Column(
         Geometry("GEOMETRY", srid=3857, spatial_index=False), nullable=False
     )  # see __table_args__ for index
-    updated_at = Column(DateTime, server_default=text("NOW()"), nullable=False)
+    # This is updated automatically by a trigger
+    updated_at = Column(
+        DateTime, server_default=text("NOW()"), nullable=False, index=True
+    )
     taxonomy_class_id = Column(
         Integer, ForeignKey("taxonomy_class.id"), nullable=False, index=True
     )
@@ -88,6 +93,30 @@ class Annotation(Base):
     )
 
 
+class AnnotationCount(Base):
+    """Number of annotations for each distinct set of grouping columns.
+
+    This table is maintained by triggers on the annotation table,
+    it must not be written to directly.
+    See :mod:`geoimagenet_api.database.annotation_counts` to verify or rebuild it.
+    """
+
+    __tablename__ = "annotation_count"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    taxonomy_class_id = Column(Integer, nullable=False, index=True)
+    image_id = Column(Integer, nullable=True, index=True)
+    annotator_id = Column(Integer, nullable=False, index=True)
+    status = Column(
+        Enum(AnnotationStatus, name="annotation_status_enum"), nullable=False
+    )
+    review_requested = Column(Boolean, nullable=False)
+    annotation_count = Column(Integer, server_default="0", nullable=False)
+
+    # the unique index 'uc_annotation_count' on the grouping columns is created
+    # in the migrations, it uses coalesce(image_id, 0) because image_id is nullable
+
+
 class AnnotationLogOperation(enum.Enum):
     insert = 1
     update = 2
@@ -192,6 +221,11 @@ class Image(Base):
     )
     trace = Column(Geometry("POLYGON", srid=3857, spatial_index=False))
     trace_simplified = Column(Geometry("POLYGON", srid=3857, spatial_index=False))
+    # trace_simplified, simplified again to one pixel at each zoom level, by a trigger
+    trace_zoom_3 = Column(Geometry("POLYGON", srid=3857, spatial_index=False))
+    trace_zoom_6 = Column(Geometry("POLYGON", srid=3857, spatial_index=False))
+    trace_zoom_9 = Column(Geometry("POLYGON", srid=3857, spatial_index=False))
+    trace_zoom_12 = Column(Geometry("POLYGON", srid=3857, spatial_index=False))
     __table_args__ = (
         UniqueConstraint("sensor_name", "bands", "bits", "filename", name="uc_image"),
         Index("idx_image_trace", trace, postgresql_using="gist"),
@@ -202,6 +236,66 @@ class Image(Base):
         return f"Image<info={self.sensor_name} {self.bands} {self.bits}, filename={self.filename}>"
 
 
+class ImageRgbn16Bit(Base):
+    """The 16 bits RGBN image corresponding to each image.
+
+    The closest 16 bits RGBN image of the same sensor is found using the
+    levenshtein distance of the filenames.
+    This table is maintained by triggers on the image table.
+    See :mod:`geoimagenet_api.database.image_rgbn_16_bit` to rebuild it.
+    """
+
+    __tablename__ = "image_rgbn_16_bit"
+
+    image_id = Column(
+        Integer, ForeignKey("image.id", ondelete="CASCADE"), primary_key=True
+    )
+    # no foreign key, when a 16 bits image is deleted the images are paired again
+    rgbn_16_bit_image_id = Column(Integer, nullable=False, index=True)
+
+
+class DataVersion(Base):
+    """Version number of a group of tables, incremented by triggers on every change.
+
+    This is used to invalidate in-process caches of data that rarely changes.
+    """
+
+    __tablename__ = "data_version"
+
+    name = Column(String, primary_key=True)
+    version = Column(BigInteger, server_default="0", nullable=False)
+
+
+class BatchSubmissionStatus(enum.Enum):
+    pending = "pending"
+    sent = "sent"
+    failed = "failed"
+
+
+class BatchSubmission(Base):
+    """A request forwarded to the batch creation service.
+
+    The request is sent in the background, after `POST /batches` returned.
+    """
+
+    __tablename__ = "batch_submission"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    status = Column(
+        Enum(BatchSubmissionStatus, name="batch_submission_status_enum"),
+        nullable=False,
+        index=True,
+        server_default=BatchSubmissionStatus.pending.name,
+    )
+    batch_url = Column(String, nullable=False)
+    sent_to_ml = Column(JSON, nullable=False)
+    response_from_ml = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, server_default="0", nullable=False)
+    created_at = Column(DateTime, server_default=text("NOW()"), nullable=False)
+    updated_at = Column(DateTime, server_default=text("NOW()"), nullable=False)
+
+
 class SpatialRefSys(Base):
     """This class is mostly present to help `alembic revision --autogenerate`
 
@@ -1,8 +1,10 @@
 from fastapi import APIRouter
 from starlette.requests import Request
-from starlette.responses import RedirectResponse
+from starlette.responses import RedirectResponse, Response
 
 from geoimagenet_api import __version__, __author__, __email__
+from geoimagenet_api.database.connection import connection_manager
+from geoimagenet_api.metrics import latest_metrics, CONTENT_TYPE_LATEST
 from geoimagenet_api.openapi_schemas import ApiInfo
 from geoimagenet_api.endpoints import (
     taxonomy,
@@ -15,6 +17,15 @@ from geoimagenet_api.endpoints import (
 
 router = APIRouter()
 
+# Routes serving reference data, which changes only on deploys and geoserver setup.
+# Their responses are cached by `ResponseCacheMiddleware` until the data version
+# of the tables they read changes.
+cached_routes = [
+    (r"/taxonomy(/[^/]+/[^/]+)?", "taxonomy"),
+    (r"/taxonomy_classes(/\d+)?", "taxonomy"),
+    (r"/images", "image"),
+]
+
 router.include_router(users.router, tags=["Users"])
 router.include_router(taxonomy.router, tags=["Taxonomy"])
 router.include_router(taxonomy_classes.router, tags=["Taxonomy Classes"])
@@ -42,3 +53,15 @@ def get(request: Request):
 @router.get("/ui/", include_in_schema=False)
 def redirect_ui(request: Request):
     return RedirectResponse(url=request.url.path.replace("ui/", "redoc"))
+
+
+@router.get("/status/database_pool", include_in_schema=False)
+def database_pool():
+    """Usage of the connection pool of this worker process."""
+    return connection_manager.pool_stats()
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics, aggregated over all the worker processes."""
+    return Response(latest_metrics(), media_type=CONTENT_TYPE_LATEST)
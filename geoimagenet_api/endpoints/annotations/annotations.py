@@ -1,24 +1,39 @@
+import math
 from collections import defaultdict
-from datetime import datetime
-from typing import Tuple, Dict, Union, List
+from datetime import datetime, timezone
+from typing import Tuple, Dict, Union, List, Iterable
 
 import psycopg2
 import psycopg2.extras
 import sqlalchemy.exc
 from fastapi import APIRouter, Query, Body
-from sqlalchemy import and_, or_
+from sqlalchemy import (
+    and_,
+    any_,
+    cast,
+    or_,
+    tuple_,
+    tablesample,
+    text,
+    bindparam,
+    Float,
+    Integer,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import aliased, Query as OrmQuery
 from sqlalchemy.sql import func
+from starlette.concurrency import run_in_threadpool
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
 from starlette.responses import Response
 
-from geoimagenet_api.endpoints.images import (
-    image_id_from_image_name,
-    image_id_from_properties,
-)
+from geoimagenet_api.config import config
+
+from geoimagenet_api.endpoints.images import image_id_from_properties
 from geoimagenet_api.endpoints.users import get_logged_user_id
 from geoimagenet_api.openapi_schemas import (
     AnnotationCountByStatus,
+    TaxonomyClassCounts,
     GeoJsonFeature,
     GeoJsonFeatureCollection,
     AnnotationRequestReview,
@@ -28,6 +43,7 @@ from geoimagenet_api.openapi_schemas import (
 )
 from geoimagenet_api.database.models import (
     Annotation as DBAnnotation,
+    AnnotationCount,
     AnnotationStatus,
     TaxonomyClass as DBTaxonomyClass,
     ValidationEvent,
@@ -35,12 +51,21 @@ from geoimagenet_api.database.models import (
     Image,
     Person,
 )
+from geoimagenet_api.endpoints.taxonomy import get_latest_taxonomy_ids
 from geoimagenet_api.endpoints.taxonomy_classes import (
+    fetch_taxonomy_classes_tree,
     flatten_taxonomy_classes_ids,
-    get_taxonomy_classes_tree,
     get_all_taxonomy_classes_ids,
+    query_taxonomy_classes_closure,
+)
+from geoimagenet_api.database.async_connection import (
+    cached_statement,
+    fetch_all,
+    fetch_one,
+    fetch_scalar,
 )
 from geoimagenet_api.database.connection import connection_manager
+from geoimagenet_api.responses import FastJSONResponse
 from geoimagenet_api.utils import geojson_stream
 
 from .utils import DEFAULT_SRID, geojson_features_from_body, get_annotation_ids_integers
@@ -60,10 +85,73 @@ def _serialize_geometry(geometry: AnyGeojsonGeometry, crs: int):
     return geom
 
 
+_annotations_fields = [
+    DBAnnotation.id,
+    DBAnnotation.taxonomy_class_id,
+    DBTaxonomyClass.code.label("taxonomy_class_code"),
+    DBAnnotation.annotator_id,
+    DBAnnotation.image_id,
+    Image.layer_name.label("image_name"),
+    DBAnnotation.name,
+    DBAnnotation.review_requested,
+    DBAnnotation.status,
+    DBAnnotation.updated_at,
+]
+
+_annotations_filters = {
+    "image_id": lambda: DBAnnotation.image_id == bindparam("image_id"),
+    "status": lambda: DBAnnotation.status == bindparam("status"),
+    "taxonomy_class_id": lambda: DBAnnotation.taxonomy_class_id
+    == bindparam("taxonomy_class_id"),
+    "review_requested": lambda: DBAnnotation.review_requested
+    == bindparam("review_requested"),
+    "annotator_id": lambda: DBAnnotation.annotator_id == bindparam("annotator_id"),
+    "last_updated_since": lambda: DBAnnotation.updated_at
+    >= bindparam("last_updated_since"),
+    "last_updated_before": lambda: DBAnnotation.updated_at
+    <= bindparam("last_updated_before"),
+}
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """The `updated_at` column has no time zone and is in UTC.
+
+    Time zone aware datetimes are converted to naive UTC datetimes,
+    because asyncpg refuses to bind them to a timestamp without time zone.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _annotations_query(with_geometry: bool, filter_names: Iterable[str]) -> OrmQuery:
+    fields = list(_annotations_fields)
+    if with_geometry:
+        fields.append(func.ST_AsGeoJSON(DBAnnotation.geometry).label("geometry"))
+    query = OrmQuery(fields).outerjoin(Image).join(DBTaxonomyClass)
+    for name in filter_names:
+        query = query.filter(_annotations_filters[name]())
+    return query
+
+
+def _image_id_by_name_statement():
+    return cached_statement(
+        "image_id_by_name",
+        lambda: OrmQuery(Image.id).filter(Image.layer_name == bindparam("name")),
+    )
+
+
+def _person_exists_statement():
+    return cached_statement(
+        "person_exists",
+        lambda: OrmQuery(Person.id).filter(Person.id == bindparam("id")),
+    )
+
+
 @router.get(
     "/annotations", response_model=GeoJsonFeatureCollection, summary="Get as GeoJson"
 )
-def get(
+async def get(
     request: Request,
     image_name: str = None,
     status: str = None,
@@ -75,51 +163,43 @@ def get(
     last_updated_since: datetime = None,
     last_updated_before: datetime = None,
 ):
-    with connection_manager.get_db_session() as session:
-        fields = [
-            DBAnnotation.id,
-            DBAnnotation.taxonomy_class_id,
-            DBTaxonomyClass.code.label("taxonomy_class_code"),
-            DBAnnotation.annotator_id,
-            DBAnnotation.image_id,
-            Image.layer_name.label("image_name"),
-            DBAnnotation.name,
-            DBAnnotation.review_requested,
-            DBAnnotation.status,
-            DBAnnotation.updated_at,
-        ]
-        if with_geometry:
-            fields.append(func.ST_AsGeoJSON(DBAnnotation.geometry).label("geometry"))
-        query = session.query(*fields).outerjoin(Image).join(DBTaxonomyClass)
-        if image_name:
-            image_id = image_id_from_image_name(session, image_name)
-            query = query.filter(DBAnnotation.image_id == image_id)
-        if status:
-            query = query.filter(DBAnnotation.status == status)
-        if taxonomy_class_id is not None:
-            query = query.filter(DBAnnotation.taxonomy_class_id == taxonomy_class_id)
-        if review_requested is not None:
-            query = query.filter(DBAnnotation.review_requested == review_requested)
-        if current_user_only:
-            logged_user_id = get_logged_user_id(request)
-            query = query.filter(DBAnnotation.annotator_id == logged_user_id)
-        elif annotator_id:
-            if not session.query(Person.id).filter_by(id=annotator_id).first():
-                raise HTTPException(404, f"annotator_id not found: {annotator_id}")
-            query = query.filter(DBAnnotation.annotator_id == annotator_id)
-
-        if last_updated_since:
-            query = query.filter(DBAnnotation.updated_at >= last_updated_since)
-        if last_updated_before:
-            query = query.filter(DBAnnotation.updated_at <= last_updated_before)
-
-        properties = [f.key for f in fields if f.key not in ["geometry", "id"]]
-        stream = geojson_stream(
-            query, properties=properties, with_geometry=with_geometry
+    params = {}
+    if image_name:
+        image_id = await fetch_scalar(
+            _image_id_by_name_statement(), {"name": image_name}
         )
-        data = "".join(stream)
-
-        return Response(data, media_type="application/json")
+        if not image_id:
+            raise HTTPException(404, f"Image layer name not found: {image_name}")
+        params["image_id"] = image_id
+    if status:
+        params["status"] = status
+    if taxonomy_class_id is not None:
+        params["taxonomy_class_id"] = taxonomy_class_id
+    if review_requested is not None:
+        params["review_requested"] = review_requested
+    if current_user_only:
+        params["annotator_id"] = await run_in_threadpool(get_logged_user_id, request)
+    elif annotator_id:
+        if not await fetch_one(_person_exists_statement(), {"id": annotator_id}):
+            raise HTTPException(404, f"annotator_id not found: {annotator_id}")
+        params["annotator_id"] = annotator_id
+    if last_updated_since:
+        params["last_updated_since"] = _naive_utc(last_updated_since)
+    if last_updated_before:
+        params["last_updated_before"] = _naive_utc(last_updated_before)
+
+    # the statement is compiled once for each combination of filters
+    key = ("annotations.get", with_geometry) + tuple(sorted(params))
+    statement = cached_statement(
+        key, lambda: _annotations_query(with_geometry, params.keys())
+    )
+    rows = await fetch_all(statement, params)
+
+    properties = [c.key for c in _annotations_fields if c.key != "id"]
+    stream = geojson_stream(rows, properties=properties, with_geometry=with_geometry)
+    data = "".join(stream)
+
+    return Response(data, media_type="application/json")
 
 
 @router.put("/annotations", status_code=204, summary="Modify")
@@ -177,13 +257,141 @@ def post(
     return post_annotations(request, body, srid)
 
 
+approximate_query = Query(
+    False,
+    description="Estimate the counts from a random sample of the annotation counts. "
+    "The sampling percentage and the largest error margin of the returned counts "
+    "(95% confidence) are given in the 'X-Counts-Sample-Percent' and "
+    "'X-Counts-Error-Margin' response headers.",
+)
+
+
+estimated_annotation_count_rows = (
+    "SELECT reltuples FROM pg_class WHERE oid = 'annotation_count'::regclass"
+)
+
+
+def _annotation_counts_source(estimated_rows: float, approximate: bool):
+    """Returns the entity to aggregate annotation counts from, and its sampling fraction.
+
+    The exact counts come from the whole annotation_count table. Approximate counts
+    come from a block sample (TABLESAMPLE SYSTEM) of the same table, so only
+    the sampled pages are read.
+    The sample size is chosen from the planner's row estimate (`estimated_rows`),
+    so that about `approximate_counts_sample_rows` rows of annotation_count are read.
+    The sample percentage must be given in the `sample_percent` parameter.
+    """
+    if not approximate:
+        return AnnotationCount, 1.0
+
+    sample_rows = config.settings.approximate_counts_sample_rows
+    if not estimated_rows or estimated_rows <= sample_rows:
+        return AnnotationCount, 1.0
+
+    fraction = sample_rows / estimated_rows
+    # the percentage is a parameter, so that the compiled statements can be reused
+    sample_percent = bindparam("sample_percent", type_=Float)
+    sample = tablesample(
+        AnnotationCount.__table__,
+        func.system(sample_percent),
+        name="annotation_count_sample",
+    )
+    return aliased(AnnotationCount, sample), fraction
+
+
+def _count_fields(source, sampled: bool) -> list:
+    """The sum of the counts, and for a sample, the sum of their squares."""
+    fields = [func.sum(source.annotation_count).label("annotation_count")]
+    if sampled:
+        count = cast(source.annotation_count, Float)
+        fields.append(func.sum(count * count).label("annotation_count_squares"))
+    return fields
+
+
+def _estimate_sampled_counts(
+    sampled_counts: Iterable[Tuple[AnnotationCountByStatus, AnnotationCountByStatus]],
+    fraction: float,
+) -> float:
+    """Scale counts taken from a sample to the whole table, in place.
+
+    `sampled_counts` are pairs of sampled counts and the sums of the squares of
+    the annotation_count values they add up. Returns the largest 95% error margin
+    of the estimated counts.
+
+    The variance of an estimated count is (1 - f) / f^2 * sum(c^2), considering each
+    sampled row of annotation_count independently. When no row was sampled,
+    the margin is the rule of three upper bound, 3 / f.
+    """
+    margin = 0.0
+    if fraction >= 1:
+        return margin
+    for count, squares in sampled_counts:
+        for status in AnnotationStatus:
+            sampled = getattr(count, status.name)
+            setattr(count, status.name, round(sampled / fraction))
+            if sampled:
+                sum_squares = getattr(squares, status.name)
+                status_margin = (
+                    1.96 * math.sqrt((1 - fraction) * sum_squares) / fraction
+                )
+            else:
+                status_margin = 3 / fraction
+            margin = max(margin, status_margin)
+    return margin
+
+
+def _approximate_counts_response(content, fraction: float, margin: float):
+    headers = {
+        "X-Counts-Sample-Percent": f"{fraction * 100:.4g}",
+        "X-Counts-Error-Margin": str(math.ceil(margin)),
+    }
+    return FastJSONResponse(content, headers=headers)
+
+
+def _counts_query(
+    estimated_rows: float,
+    approximate: bool,
+    group_by_image: bool,
+    filter_annotator: bool,
+    filter_review_requested: bool,
+) -> OrmQuery:
+    """Aggregate the annotation counts of the taxonomy classes, by class or by image.
+
+    The values are given as parameters: `taxonomy_class_ids`, and depending on
+    the options, `sample_percent`, `annotator_id` and `review_requested`.
+    """
+    source, fraction = _annotation_counts_source(estimated_rows, approximate)
+
+    if group_by_image:
+        group_by_field = Image.layer_name
+    else:
+        group_by_field = source.taxonomy_class_id
+
+    fields = [group_by_field.label("group_by"), source.status]
+    query = OrmQuery(fields + _count_fields(source, sampled=fraction < 1))
+    if group_by_image:
+        query = query.select_from(source).join(Image, Image.id == source.image_id)
+
+    taxonomy_class_ids = bindparam("taxonomy_class_ids", type_=ARRAY(Integer))
+    query = (
+        query.filter(source.taxonomy_class_id == any_(taxonomy_class_ids))
+        .group_by(group_by_field)
+        .group_by(source.status)
+    )
+    if filter_annotator:
+        query = query.filter(source.annotator_id == bindparam("annotator_id"))
+    if filter_review_requested:
+        query = query.filter(source.review_requested == bindparam("review_requested"))
+    return query
+
+
 @router.get(
     "/annotations/counts/{taxonomy_class_id}",
     response_model=Dict[str, AnnotationCountByStatus],
     status_code=200,
     summary="Get counts",
 )
-def counts(
+async def counts(
     request: Request,
     taxonomy_class_id: int,
     group_by_image: bool = Query(
@@ -198,66 +406,257 @@ def counts(
     review_requested: bool = Query(
         None, description="Filter annotations by the review_requested attribute"
     ),
+    approximate: bool = approximate_query,
 ):
     """Return annotation counts for the given taxonomy class along with its children.
     If group_by_image is True, the counts are grouped by image name instead of
     taxonomy class.
     """
+    taxo = await fetch_taxonomy_classes_tree(taxonomy_class_id)
+    if not taxo:
+        raise HTTPException(404, f"Taxonomy class id not found: {taxonomy_class_id}")
+
+    if with_taxonomy_children:
+        taxonomy_class_ids = flatten_taxonomy_classes_ids(taxo)
+    else:
+        taxonomy_class_ids = [taxonomy_class_id]
+
+    # the exact counts are maintained by triggers in the annotation_count table
+    estimated_rows = None
+    if approximate:
+        statement = cached_statement(
+            "estimated_annotation_count_rows",
+            lambda: text(estimated_annotation_count_rows),
+        )
+        estimated_rows = await fetch_scalar(statement)
+    _, fraction = _annotation_counts_source(estimated_rows, approximate)
+
+    params = {"taxonomy_class_ids": taxonomy_class_ids}
+    if fraction < 1:
+        params["sample_percent"] = fraction * 100
+    if current_user_only:
+        params["annotator_id"] = await run_in_threadpool(get_logged_user_id, request)
+    if review_requested is not None:
+        params["review_requested"] = review_requested
+
+    # the statement is compiled once for each combination of options
+    options = (group_by_image, current_user_only, review_requested is not None)
+    key = ("annotations.counts", fraction < 1) + options
+    statement = cached_statement(
+        key, lambda: _counts_query(estimated_rows, approximate, *options)
+    )
+
+    annotation_count_dict = defaultdict(AnnotationCountByStatus)
+    # sums of the squares of the sampled counts, for the error margin
+    squares_dict = defaultdict(AnnotationCountByStatus)
+    for row in await fetch_all(statement, params):
+        # enums are returned as strings by asyncpg
+        status = AnnotationStatus(row.status)
+        key = str(row.group_by)
+        setattr(annotation_count_dict[key], status.name, row.annotation_count)
+        if fraction < 1:
+            setattr(squares_dict[key], status.name, row.annotation_count_squares)
+
+    if not group_by_image:
+        # add annotation count to parent objects
+        def recurse_add_counts(obj):
+            for o in obj.children:
+                annotation_count_dict[str(obj.id)] += recurse_add_counts(o)
+                squares_dict[str(obj.id)] += squares_dict[str(o.id)]
+            return annotation_count_dict[str(obj.id)]
+
+        recurse_add_counts(taxo)
+
+    if approximate:
+        sampled_counts = [
+            (c, squares_dict[k]) for k, c in annotation_count_dict.items()
+        ]
+        margin = _estimate_sampled_counts(sampled_counts, fraction)
+        return _approximate_counts_response(annotation_count_dict, fraction, margin)
 
-    with connection_manager.get_db_session() as session:
-        taxo = get_taxonomy_classes_tree(session, taxonomy_class_id=taxonomy_class_id)
-        if not taxo:
-            raise HTTPException(
-                404, f"Taxonomy class id not found: {taxonomy_class_id}"
-            )
-
-        if with_taxonomy_children:
-            taxonomy_class_ids = flatten_taxonomy_classes_ids(taxo)
-        else:
-            taxonomy_class_ids = [taxonomy_class_id]
+    return FastJSONResponse(annotation_count_dict)
 
-        annotation_count_dict = defaultdict(AnnotationCountByStatus)
 
-        if group_by_image:
-            group_by_field = Image.layer_name
-        else:
-            group_by_field = DBAnnotation.taxonomy_class_id
+def _taxonomy_counts_query(
+    estimated_rows: float,
+    approximate: bool,
+    by_image: bool,
+    by_annotator: bool,
+    filter_annotator: bool,
+    filter_review_requested: bool,
+) -> OrmQuery:
+    """Aggregate the annotation counts of whole taxonomies, in a single query.
 
-        query = session.query(
-            group_by_field,
-            DBAnnotation.status.name,
-            func.count(DBAnnotation.id).label("annotation_count"),
+    The values are given as parameters: `taxonomy_ids`, and depending on the options,
+    `sample_percent`, `annotator_id` and `review_requested`.
+    """
+    taxonomy_ids = bindparam("taxonomy_ids", type_=ARRAY(Integer))
+    closure = query_taxonomy_classes_closure(taxonomy_ids)
+    source, fraction = _annotation_counts_source(estimated_rows, approximate)
+
+    # filters are in the join clause, so that classes without annotations are kept
+    join_filters = [source.taxonomy_class_id == closure.c.taxonomy_class_id]
+    if filter_annotator:
+        join_filters.append(source.annotator_id == bindparam("annotator_id"))
+    if filter_review_requested:
+        join_filters.append(source.review_requested == bindparam("review_requested"))
+
+    fields = [closure.c.ancestor_id, source.status]
+    fields += _count_fields(source, sampled=fraction < 1)
+    grouping_sets = [tuple_(closure.c.ancestor_id, source.status)]
+    if by_image:
+        fields.append(Image.layer_name.label("image_name"))
+        fields.append(func.grouping(Image.layer_name).label("image_grouping"))
+        grouping_sets.append(
+            tuple_(closure.c.ancestor_id, Image.layer_name, source.status)
         )
-        if group_by_image:
-            query = query.select_from(DBAnnotation).join(
-                Image, Image.id == DBAnnotation.image_id
-            )
-        query = (
-            query.filter(DBAnnotation.taxonomy_class_id.in_(taxonomy_class_ids))
-            .group_by(group_by_field)
-            .group_by(DBAnnotation.status.name)
+    if by_annotator:
+        fields.append(source.annotator_id)
+        fields.append(func.grouping(source.annotator_id).label("annotator_grouping"))
+        grouping_sets.append(
+            tuple_(closure.c.ancestor_id, source.annotator_id, source.status)
         )
 
-        if current_user_only:
-            logged_user_id = get_logged_user_id(request)
-            query = query.filter(DBAnnotation.annotator_id == logged_user_id)
+    return (
+        OrmQuery(fields)
+        .select_from(closure)
+        .outerjoin(source, and_(*join_filters))
+        .outerjoin(Image, Image.id == source.image_id)
+        .group_by(func.grouping_sets(*grouping_sets))
+    )
 
-        if review_requested is not None:
-            query = query.filter(DBAnnotation.review_requested == review_requested)
 
-        for group_by_field_name, status, count in query:
-            setattr(annotation_count_dict[str(group_by_field_name)], status, count)
-
-        if not group_by_image:
-            # add annotation count to parent objects
-            def recurse_add_counts(obj):
-                for o in obj.children:
-                    annotation_count_dict[str(obj.id)] += recurse_add_counts(o)
-                return annotation_count_dict[str(obj.id)]
-
-            recurse_add_counts(taxo)
+@router.get(
+    "/annotations/counts",
+    response_model=Dict[str, TaxonomyClassCounts],
+    status_code=200,
+    summary="Get counts for whole taxonomies",
+)
+async def taxonomy_counts(
+    request: Request,
+    taxonomy_id: List[int] = Query(
+        None,
+        description="Ids of the taxonomies to count. "
+        "Defaults to the latest version of each taxonomy.",
+    ),
+    by_image: bool = Query(
+        False, description="Also return the counts of each class by image name"
+    ),
+    by_annotator: bool = Query(
+        False, description="Also return the counts of each class by annotator id"
+    ),
+    current_user_only: bool = Query(
+        False, description="If true, count only the current user's annotations"
+    ),
+    review_requested: bool = Query(
+        None, description="Filter annotations by the review_requested attribute"
+    ),
+    approximate: bool = approximate_query,
+):
+    """Return annotation counts for every taxonomy class of one or several taxonomies.
 
-        return annotation_count_dict
+    The counts of each taxonomy class include the counts of all its children.
+    They are aggregated in a single query using grouping sets.
+    """
+    if not taxonomy_id:
+        latest_taxonomy_ids = await run_in_threadpool(get_latest_taxonomy_ids)
+        taxonomy_id = list(latest_taxonomy_ids.values())
+
+    estimated_rows = None
+    if approximate:
+        statement = cached_statement(
+            "estimated_annotation_count_rows",
+            lambda: text(estimated_annotation_count_rows),
+        )
+        estimated_rows = await fetch_scalar(statement)
+    _, fraction = _annotation_counts_source(estimated_rows, approximate)
+
+    params = {"taxonomy_ids": taxonomy_id}
+    if fraction < 1:
+        params["sample_percent"] = fraction * 100
+    if current_user_only:
+        params["annotator_id"] = await run_in_threadpool(get_logged_user_id, request)
+    if review_requested is not None:
+        params["review_requested"] = review_requested
+
+    # the statement is compiled once for each combination of options
+    options = (by_image, by_annotator, current_user_only, review_requested is not None)
+    key = ("annotations.taxonomy_counts", fraction < 1) + options
+    statement = cached_statement(
+        key, lambda: _taxonomy_counts_query(estimated_rows, approximate, *options)
+    )
+
+    counts_dict = {}
+    # sums of the squares of the sampled counts, by id of the counts object
+    squares_dict = defaultdict(AnnotationCountByStatus)
+    for row in await fetch_all(statement, params):
+        key = str(row.ancestor_id)
+        if key not in counts_dict:
+            counts_dict[key] = TaxonomyClassCounts(
+                total=AnnotationCountByStatus(),
+                by_image={} if by_image else None,
+                by_annotator={} if by_annotator else None,
+            )
+        if row.status is None:
+            # taxonomy class without any annotation
+            continue
+
+        class_counts = counts_dict[key]
+        if by_image and row.image_grouping == 0:
+            if row.image_name is None:
+                # annotations that are not on an image
+                continue
+            counts = class_counts.by_image.setdefault(
+                row.image_name, AnnotationCountByStatus()
+            )
+        elif by_annotator and row.annotator_grouping == 0:
+            counts = class_counts.by_annotator.setdefault(
+                str(row.annotator_id), AnnotationCountByStatus()
+            )
+        else:
+            counts = class_counts.total
+        # enums are returned as strings by asyncpg
+        status = AnnotationStatus(row.status)
+        setattr(counts, status.name, row.annotation_count)
+        if fraction < 1:
+            squares = squares_dict[id(counts)]
+            setattr(squares, status.name, row.annotation_count_squares)
+
+    if not counts_dict:
+        ids = ", ".join(map(str, taxonomy_id))
+        raise HTTPException(404, f"Taxonomy id not found: {ids}")
+
+    if approximate:
+        all_counts = []
+        for class_counts in counts_dict.values():
+            all_counts.append(class_counts.total)
+            all_counts.extend((class_counts.by_image or {}).values())
+            all_counts.extend((class_counts.by_annotator or {}).values())
+        sampled_counts = [(c, squares_dict[id(c)]) for c in all_counts]
+        margin = _estimate_sampled_counts(sampled_counts, fraction)
+        return _approximate_counts_response(counts_dict, fraction, margin)
+
+    return FastJSONResponse(counts_dict)
+
+
+# Set in the transaction of the bulk insert, so that the annotation_name_on_insert
+# trigger doesn't compute the names again (see migration c4f1a8e6d2b7)
+BULK_ANNOTATION_NAMES_SETTING = "geoimagenet.annotation_names_computed"
+
+# The codes are joined from taxonomy_class, like in the trigger, so the names
+# are the same. The ids are returned in the order of the values.
+_bulk_insert_annotations = """
+    INSERT INTO annotation
+    (annotator_id, geometry, taxonomy_class_id, status, review_requested, image_id, name)
+    SELECT v.annotator_id, v.geometry, v.taxonomy_class_id,
+           v.status::annotation_status_enum, v.review_requested, v.image_id,
+           annotation_name(v.geometry, taxonomy_class.code)
+    FROM (VALUES %s) AS v
+    (annotator_id, geometry, taxonomy_class_id, status, review_requested, image_id, sort_order)
+    LEFT JOIN taxonomy_class ON taxonomy_class.id = v.taxonomy_class_id
+    ORDER BY v.sort_order
+    RETURNING id;
+"""
 
 
 def post_annotations(
@@ -375,7 +774,8 @@ def post_annotations(
                 400, f"One of the annotations is not contained within an image"
             )
 
-    def _make_values(feature: GeoJsonFeature):
+    def _make_values(sort_order_and_feature: Tuple[int, GeoJsonFeature]):
+        sort_order, feature = sort_order_and_feature
         return (
             feature.properties.annotator_id,
             feature.geometry.json(),
@@ -383,18 +783,21 @@ def post_annotations(
             feature.properties.status,
             feature.properties.review_requested,
             feature.properties.image_id,
+            sort_order,
         )
 
-    template = f"(%s, {geom_template}, %s, %s, %s, %s)"
+    template = f"(%s, {geom_template}, %s, %s, %s, %s::integer, %s)"
 
     connection = connection_manager.engine.raw_connection()
     try:
         with connection.cursor() as cursor:
-            fields = "annotator_id, geometry, taxonomy_class_id, status, review_requested, image_id"
+            # the names of each page are computed in the insert, the
+            # annotation_name_on_insert trigger is skipped in this transaction
+            cursor.execute(f"SET LOCAL {BULK_ANNOTATION_NAMES_SETTING} = on;")
             result = psycopg2.extras.execute_values(
                 cursor,
-                f"INSERT INTO annotation ({fields}) VALUES %s RETURNING id;",
-                map(_make_values, features),
+                _bulk_insert_annotations,
+                map(_make_values, enumerate(features)),
                 template=template,
                 page_size=100,
                 fetch=True,
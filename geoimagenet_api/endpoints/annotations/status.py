@@ -6,7 +6,8 @@ import psycopg2
 import psycopg2.extras
 import sqlalchemy.exc
 from fastapi import APIRouter, Query, Body
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, bindparam
+from sqlalchemy.ext import baked
 from sqlalchemy.sql import func
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
@@ -49,16 +50,22 @@ from .utils import record_validation_events, get_annotation_ids_integers
 router = APIRouter()
 
 
+# these queries are run on every status update, their compiled form is cached
+bakery = baked.bakery()
+
+
+def _existing_annotation_ids(session, annotation_ids: List[int]) -> List[int]:
+    query = bakery(lambda s: s.query(DBAnnotation.id))
+    query += lambda q: q.filter(DBAnnotation.id.in_(bindparam("ids", expanding=True)))
+    return [o[0] for o in query(session).params(ids=list(annotation_ids))]
+
+
 def _ensure_annotations_exists(annotation_ids: List[int]):
     """Makes sure the requested annotation ids, else return a 404 response."""
     with connection_manager.get_db_session() as session:
-        ids_exists = session.query(DBAnnotation.id).filter(
-            DBAnnotation.id.in_(annotation_ids)
-        )
+        ids_exists = _existing_annotation_ids(session, annotation_ids)
 
-        count_not_found = len(
-            set(annotation_ids).difference((o[0] for o in ids_exists))
-        )
+        count_not_found = len(set(annotation_ids).difference(ids_exists))
         if count_not_found:
             raise HTTPException(
                 404, f"{count_not_found} annotation ids could not be found."
@@ -68,15 +75,17 @@ def _ensure_annotations_exists(annotation_ids: List[int]):
 def _ensure_annotation_owner(annotation_ids: List[int], logged_user: int):
     """Makes sure the requested annotation ids belong to the logged in user, else return a 403 response."""
     with connection_manager.get_db_session() as session:
-        count_not_owned = (
-            session.query(DBAnnotation.id)
-            .filter(
-                and_(
-                    DBAnnotation.id.in_(annotation_ids),
-                    DBAnnotation.annotator_id != logged_user,
-                )
+        query = bakery(lambda s: s.query(func.count(DBAnnotation.id)))
+        query += lambda q: q.filter(
+            and_(
+                DBAnnotation.id.in_(bindparam("ids", expanding=True)),
+                DBAnnotation.annotator_id != bindparam("logged_user"),
             )
-            .count()
+        )
+        count_not_owned = (
+            query(session)
+            .params(ids=list(annotation_ids), logged_user=logged_user)
+            .scalar()
         )
 
         if count_not_owned:
@@ -128,10 +137,7 @@ def _update_status(
         def _filter_annotation_ids(query) -> Union[Query, Tuple]:
             annotation_ids = get_annotation_ids_integers(update_info.annotation_ids)
 
-            existing_ids = session.query(DBAnnotation.id).filter(
-                DBAnnotation.id.in_(annotation_ids)
-            )
-            existing_ids = [a.id for a in existing_ids]
+            existing_ids = _existing_annotation_ids(session, annotation_ids)
             missing_ids = set(annotation_ids).difference(existing_ids)
             if missing_ids:
                 raise HTTPException(
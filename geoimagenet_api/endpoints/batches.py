@@ -1,20 +1,34 @@
+import asyncio
 import datetime
+import hashlib
+import json
+import os
+import tempfile
+import weakref
+from pathlib import Path
+from typing import BinaryIO
 
 from fastapi import APIRouter
+from starlette.background import BackgroundTasks
+from starlette.concurrency import run_in_threadpool
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
-from starlette.responses import StreamingResponse
-import requests
-import sentry_sdk
+from starlette.responses import Response
+import httpx
 from sqlalchemy import func, and_
 
+from geoimagenet_api import profiling
+from geoimagenet_api.cache import get_data_version
 from geoimagenet_api.config import config
+from geoimagenet_api.sentry import capture_message
 from geoimagenet_api.endpoints.images import query_rgbn_16_bit_image
 from geoimagenet_api.endpoints.taxonomy import get_adjusted_taxonomy_ids
 from geoimagenet_api.endpoints.taxonomy_classes import get_all_taxonomy_classes_ids
 from geoimagenet_api.database.models import (
     Annotation as DBAnnotation,
     AnnotationStatus,
+    BatchSubmission as DBBatchSubmission,
+    BatchSubmissionStatus,
     Taxonomy
 )
 from geoimagenet_api.database.connection import connection_manager
@@ -24,53 +38,208 @@ from geoimagenet_api.openapi_schemas import (
     BatchPostForwarded,
     ExecuteIOHref,
     ExecuteIOValue,
-    BatchPostResult)
+    BatchPostResult,
+    BatchSubmission)
+from geoimagenet_api.responses import FileRangeResponse
 from geoimagenet_api.utils import geojson_stream, get_config_url
 
 router = APIRouter()
 
 
+def _export_cache_dir() -> Path:
+    cache_dir = config.get("batch_export_cache_dir", str)
+    if not cache_dir:
+        cache_dir = os.path.join(tempfile.gettempdir(), "geoimagenet_batch_export")
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def _export_snapshot_key(session) -> str:
+    """Identifies the state of the data returned by the batch export.
+
+    The validated annotations, taxonomy and image tables have their own data versions,
+    incremented by triggers on every change.
+    """
+    key = (
+        get_data_version(session, "validated_annotation"),
+        get_data_version(session, "taxonomy"),
+        get_data_version(session, "image"),
+    )
+    return hashlib.md5(repr(key).encode()).hexdigest()
+
+
+def _write_snapshot(path: Path, stream) -> BinaryIO:
+    """Write the stream to a temporary file, and move it to `path` atomically.
+
+    Older snapshots in the same directory are removed.
+    Returns the written file, opened for reading before it's moved,
+    so that it can't be removed by a concurrent export before it's read.
+    """
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, prefix=".annotations_", delete=False
+    ) as f:
+        for data in stream:
+            f.write(data)
+    snapshot = open(f.name, "rb")
+    os.replace(f.name, path)
+
+    for old_snapshot in path.parent.glob("annotations_*.json"):
+        if old_snapshot != path:
+            try:
+                old_snapshot.unlink()
+            except FileNotFoundError:  # pragma: no cover
+                pass
+    return snapshot
+
+
 @router.get(
     "/batches/annotations",
     response_model=GeoJsonFeatureCollection,
     summary="Get validated annotations",
 )
-def get_annotations():
-    """Get annotations for the latest taxonomy version."""
+def get_annotations(request: Request):
+    """Get annotations for the latest taxonomy version.
+
+    The export is written to disk once, and served from the file
+    until the annotations, taxonomies or images change.
+    Range requests are supported.
+    """
 
     adjusted_ids = get_adjusted_taxonomy_ids()
     
-    with connection_manager.get_db_session() as session:
-        
-        taxonomy_ids = []
-        for taxonomy_id in adjusted_ids.values():
-            taxonomy_ids += get_all_taxonomy_classes_ids(session, taxonomy_id)
-
-        subquery = query_rgbn_16_bit_image(session)
-
-        query = session.query(
-            DBAnnotation.id,
-            func.ST_AsGeoJSON(DBAnnotation.geometry).label("geometry"),
-            subquery.c.image_name,
-            DBAnnotation.taxonomy_class_id,
-        ).outerjoin(subquery, subquery.c.image_id == DBAnnotation.image_id).filter(
-            and_(
-                DBAnnotation.status == AnnotationStatus.validated,
-                DBAnnotation.taxonomy_class_id.in_(taxonomy_ids),
+    with connection_manager.get_db_session(export=True, read_only=True) as session:
+        snapshot_key = _export_snapshot_key(session)
+        path = _export_cache_dir() / f"annotations_{snapshot_key}.json"
+
+        etag = f'"{snapshot_key}"'
+        if request.headers.get("if-none-match") == etag:
+            # the file is not needed, and could be removed by a concurrent export
+            return Response(status_code=304, headers={"etag": etag})
+
+        try:
+            # opened here, as a concurrent export can remove it at any time
+            snapshot = open(path, "rb")
+        except FileNotFoundError:
+            taxonomy_ids = []
+            for taxonomy_id in adjusted_ids.values():
+                taxonomy_ids += get_all_taxonomy_classes_ids(session, taxonomy_id)
+
+            subquery = query_rgbn_16_bit_image(session)
+
+            query = session.query(
+                DBAnnotation.id,
+                func.ST_AsGeoJSON(DBAnnotation.geometry).label("geometry"),
+                subquery.c.image_name,
+                DBAnnotation.taxonomy_class_id,
+            ).outerjoin(subquery, subquery.c.image_id == DBAnnotation.image_id).filter(
+                and_(
+                    DBAnnotation.status == AnnotationStatus.validated,
+                    DBAnnotation.taxonomy_class_id.in_(taxonomy_ids),
+                )
             )
-        )
 
-        properties = ["image_name", "taxonomy_class_id"]
-        stream = geojson_stream(
-            query, properties=properties, with_geometry=True)
+            properties = ["image_name", "taxonomy_class_id"]
+            stream = geojson_stream(
+                query, properties=properties, with_geometry=True)
+
+            snapshot = _write_snapshot(path, stream)
+
+    return FileRangeResponse(
+        snapshot, request.headers, media_type="application/json", etag=etag
+    )
+
+
+# seconds to wait before the first retry, doubled after each attempt
+RETRY_BACKOFF = 0.5
+
+# one client per event loop, so that connections are reused between submissions
+_http_clients = weakref.WeakKeyDictionary()
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_event_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        timeout = config.settings.batch_creation_timeout
+        client = httpx.AsyncClient(timeout=timeout)
+        _http_clients[loop] = client
+    return client
+
 
-        return StreamingResponse(stream, media_type="application/json")
+async def close_http_client():
+    client = _http_clients.pop(asyncio.get_event_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _update_submission(submission_id: int, **values):
+    with connection_manager.get_db_session() as session:
+        values["updated_at"] = func.now()
+        session.query(DBBatchSubmission).filter_by(id=submission_id).update(values)
+        session.commit()
+
+
+async def forward_batch_submission(submission_id: int, batch_url: str, payload: str):
+    """Send a batch submission to the batch creation service.
+
+    Connection errors, timeouts and server errors are retried
+    `batch_creation_retries` times, with an exponential backoff.
+    """
+    retries = config.settings.batch_creation_retries
+    client = _get_http_client()
+
+    error = None
+    attempt = 0
+    while attempt <= retries:
+        if attempt:
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+        attempt += 1
+
+        try:
+            with profiling.timed("ml"):
+                r = await client.post(batch_url, json=payload)
+        except httpx.HTTPError as e:
+            error = f"{type(e).__name__}: {e}"
+            continue
+
+        if r.status_code >= 500:
+            error = f"The batch creation service returned: {r.status_code}"
+            continue
+        if r.status_code >= 400:
+            error = f"The batch creation service returned: {r.status_code}"
+            break
+
+        try:
+            response_from_ml = r.json()
+        except ValueError:
+            response_from_ml = {"content": r.text}
+
+        await run_in_threadpool(
+            _update_submission,
+            submission_id,
+            status=BatchSubmissionStatus.sent,
+            attempts=attempt,
+            response_from_ml=response_from_ml,
+            error=None,
+        )
+        return
+
+    capture_message(f"Batch submission {submission_id} failed: {error}")
+    await run_in_threadpool(
+        _update_submission,
+        submission_id,
+        status=BatchSubmissionStatus.failed,
+        attempts=attempt,
+        error=error,
+    )
 
 
 post_description = (
-    "Forwards information to the batch creation process. On success, "
-    "the returned body is the same as the one forwarded to the batch "
-    "creation service."
+    "Forwards information to the batch creation process. "
+    "The request is sent in the background, the returned body contains "
+    "the submission id and the body forwarded to the batch creation service. "
+    "Use `GET /batches/{id}` to follow the status of the submission."
 )
 
 
@@ -81,7 +250,7 @@ post_description = (
     summary="Create",
     description=post_description,
 )
-def post(batch_post: BatchPost, request: Request):
+def post(batch_post: BatchPost, request: Request, background_tasks: BackgroundTasks):
 
     url = f"{request.url}/annotations"
 
@@ -98,16 +267,39 @@ def post(batch_post: BatchPost, request: Request):
 
     batch_url = get_config_url(request, "batch_creation_url")
 
-    try:
-        r = requests.post(batch_url, json=execute.json())
-        r.raise_for_status()
-    except requests.exceptions.RequestException:
-        sentry_sdk.capture_exception()
-        message = (
-            "Could't forward the request to the batch creation service. "
-            "This error was reported to the developers."
+    with connection_manager.get_db_session() as session:
+        submission = DBBatchSubmission(
+            batch_url=batch_url, sent_to_ml=json.loads(execute.json())
         )
-        raise HTTPException(503, message)
+        session.add(submission)
+        session.commit()
+        submission_id = submission.id
+
+    background_tasks.add_task(
+        forward_batch_submission, submission_id, batch_url, execute.json()
+    )
+
+    return BatchPostResult(
+        id=submission_id, status=BatchSubmissionStatus.pending, sent_to_ml=execute
+    )
 
-    result = BatchPostResult(sent_to_ml=execute, response_from_ml=r.json())
-    return result
+
+@router.get(
+    "/batches/{id}", response_model=BatchSubmission, summary="Get a submission status"
+)
+def get_submission(id: int):
+    with connection_manager.get_db_session() as session:
+        submission = session.query(DBBatchSubmission).filter_by(id=id).first()
+        if submission is None:
+            raise HTTPException(404, "Batch submission id not found.")
+
+        return BatchSubmission(
+            id=submission.id,
+            status=submission.status,
+            attempts=submission.attempts,
+            error=submission.error,
+            created_at=submission.created_at,
+            updated_at=submission.updated_at,
+            sent_to_ml=submission.sent_to_ml,
+            response_from_ml=submission.response_from_ml,
+        )
@@ -1,42 +1,180 @@
-import os
 from typing import List
 
-from fastapi import APIRouter
-from sqlalchemy import func, String, cast
-from sqlalchemy.orm import Query, Session, aliased
+from fastapi import APIRouter, Body, Query as QueryParam
+from sqlalchemy import func, select
+from sqlalchemy.orm import Query, Session
 from starlette.exceptions import HTTPException
+from starlette.responses import Response
 
-from geoimagenet_api.database.connection import connection_manager
+from geoimagenet_api.database.async_connection import fetch_all, fetch_one, fetch_scalar
+from geoimagenet_api.database.image_rgbn_16_bit import query_image_rgbn_16_bit
 from geoimagenet_api.database.models import Image as DBImage
-from geoimagenet_api.openapi_schemas import Image, AnnotationProperties
+from geoimagenet_api.responses import FastJSONResponse
+from geoimagenet_api.openapi_schemas import (
+    Image,
+    AnnotationProperties,
+    AnyGeojsonGeometry,
+    ImageFeatureCollection,
+)
+from geoimagenet_api.utils import geojson_stream
 
 router = APIRouter()
 
+image_columns = [
+    DBImage.id,
+    DBImage.sensor_name,
+    DBImage.bands,
+    DBImage.bits,
+    DBImage.filename,
+    DBImage.extension,
+    DBImage.layer_name,
+]
+
+IMAGE_SRID = 3857
+
+# Zoom levels of the trace_zoom_<zoom> columns of the image table, which hold
+# the traces simplified to a tolerance of one pixel at this zoom level
+TRACE_ZOOM_LEVELS = (3, 6, 9, 12)
+
+
+def _trace_for_zoom(zoom: int):
+    """The most simplified trace column that is still exact to a pixel at `zoom`."""
+    if zoom is not None:
+        for trace_zoom in TRACE_ZOOM_LEVELS:
+            if zoom <= trace_zoom:
+                return getattr(DBImage, f"trace_zoom_{trace_zoom}")
+    return DBImage.trace_simplified
+
+
+def _filter_images(query: Query, sensor_name: str, bands: str, bits: int) -> Query:
+    # sensor_name and bands are stored in upper case by a trigger
+    if sensor_name:
+        query = query.filter(DBImage.sensor_name == sensor_name.upper())
+    if bands:
+        query = query.filter(DBImage.bands == bands.upper())
+    if bits is not None:
+        query = query.filter(DBImage.bits == bits)
+    return query
+
 
 @router.get("/images", response_model=List[Image], summary="Get images list with properties")
-def get():
-    with connection_manager.get_db_session() as session:
-        images = []
-        for image in session.query(DBImage):
-            images.append(Image(
-                id=image.id,
-                sensor_name=image.sensor_name,
-                bands=image.bands,
-                bits=image.bits,
-                filename=image.filename,
-                extension=image.extension,
-                layer_name=image.layer_name,
-            ))
-
-    return images
+async def get(
+    sensor_name: str = None,
+    bands: str = None,
+    bits: int = None,
+    limit: int = QueryParam(
+        None, ge=1, description="Maximum number of images to return"
+    ),
+    offset: int = QueryParam(0, ge=0, description="Number of images to skip"),
+):
+    """The total number of images matching the filters is in the 'X-Total-Count' header."""
+    query = Query(image_columns).order_by(DBImage.id)
+    query = _filter_images(query, sensor_name, bands, bits)
+
+    count = select([func.count()]).select_from(query.order_by(None).statement.alias())
+    total = await fetch_scalar(count)
+    keys = [c.key for c in image_columns]
+    rows = await fetch_all(query.offset(offset).limit(limit))
+    images = [dict(zip(keys, row)) for row in rows]
+
+    return FastJSONResponse(images, headers={"X-Total-Count": str(total)})
+
+
+async def _search_images(geometry, zoom: int, sensor_name: str, bands: str, bits: int):
+    """Get the images intersecting `geometry` as a geojson FeatureCollection.
+
+    The intersection is computed on `trace_simplified`, so that the
+    `idx_image_trace_simplified` spatial index is used.
+
+    When a zoom level is given, the traces are the ones stored simplified for
+    the next zoom level in `TRACE_ZOOM_LEVELS`. At low zoom levels, this makes
+    the response a lot smaller, without any visible difference on a map.
+    """
+    trace = _trace_for_zoom(zoom)
+    fields = image_columns + [func.ST_AsGeoJSON(trace).label("geometry")]
+
+    query = (
+        Query(fields)
+        .filter(DBImage.trace_simplified.isnot(None))
+        .filter(func.ST_Intersects(DBImage.trace_simplified, geometry))
+        .order_by(DBImage.id)
+    )
+    query = _filter_images(query, sensor_name, bands, bits)
+
+    properties = [c.key for c in image_columns]
+    rows = await fetch_all(query)
+    stream = geojson_stream(rows, properties=properties, id_prefix="image")
+    data = "".join(stream)
+
+    return Response(data, media_type="application/json")
+
+
+def _transform_to_image_srid(geometry, srid: int):
+    geometry = func.ST_SetSRID(geometry, srid)
+    if srid != IMAGE_SRID:
+        geometry = func.ST_Transform(geometry, IMAGE_SRID)
+    return geometry
+
+
+zoom_description = (
+    "Web mercator zoom level at which the traces will be displayed. "
+    "The traces are simplified to at most one pixel at this zoom level."
+)
+
+
+@router.get(
+    "/images/search",
+    response_model=ImageFeatureCollection,
+    summary="Search images in a bounding box",
+)
+async def search(
+    bbox: str = QueryParam(..., description="Comma separated: minx,miny,maxx,maxy"),
+    srid: int = IMAGE_SRID,
+    zoom: int = QueryParam(None, ge=0, le=30, description=zoom_description),
+    sensor_name: str = None,
+    bands: str = None,
+    bits: int = None,
+):
+    """Returns the images whose trace intersects the bounding box.
+
+    The geometries are the simplified traces of the images, in EPSG:3857.
+    """
+    try:
+        minx, miny, maxx, maxy = map(float, bbox.split(","))
+    except ValueError:
+        raise HTTPException(400, "bbox must be formatted as: minx,miny,maxx,maxy")
+
+    envelope = func.ST_MakeEnvelope(minx, miny, maxx, maxy)
+    geometry = _transform_to_image_srid(envelope, srid)
+    return await _search_images(geometry, zoom, sensor_name, bands, bits)
+
+
+@router.post(
+    "/images/search",
+    response_model=ImageFeatureCollection,
+    summary="Search images intersecting a geometry",
+)
+async def search_geometry(
+    geometry: AnyGeojsonGeometry = Body(..., description="A geojson geometry"),
+    srid: int = IMAGE_SRID,
+    zoom: int = QueryParam(None, ge=0, le=30, description=zoom_description),
+    sensor_name: str = None,
+    bands: str = None,
+    bits: int = None,
+):
+    """Returns the images whose trace intersects the geometry.
+
+    The geometries are the simplified traces of the images, in EPSG:3857.
+    """
+    geom = _transform_to_image_srid(func.ST_GeomFromGeoJSON(geometry.json()), srid)
+    return await _search_images(geom, zoom, sensor_name, bands, bits)
 
 
 @router.get("/images/{id}", response_model=Image, summary="Get an image by id")
-def get_by_id(id: int):
-    with connection_manager.get_db_session() as session:
-        image = session.query(DBImage).filter_by(id=id).first()
-        if image is None:
-            raise HTTPException(404, "Image id not found.")
+async def get_by_id(id: int):
+    image = await fetch_one(Query(image_columns).filter(DBImage.id == id))
+    if image is None:
+        raise HTTPException(404, "Image id not found.")
 
     return Image(
         id=image.id,
@@ -50,70 +188,23 @@ def get_by_id(id: int):
 
 
 def query_rgbn_16_bit_image(session: Session) -> Query:
-    """Get an image filename in another bit format, using levenshtein distance and folder names.
+    """Get the corresponding 16 bit RGBN image filename of every image.
 
     The image table contains one row for each file.
     The with the filename, the row also contains information about:
       - sensor_name
       - bands
       - number of bits
-    Given an image id, this function finds the corresponding 16 bit image file path.
-    The returned value is a sqlalchemy Query object, so it can be used as a subquery.
+    The pairing between an image and its 16 bit RGBN image (using the levenshtein
+    distance of the filenames) is stored in the image_rgbn_16_bit table,
+    which is maintained by triggers on the image table.
+    The returned value is a sqlalchemy subquery with the columns `image_id` and `image_name`.
 
     The folder name will always be of the format {sensor_name}_{bands}_{bits}.
     Example: PLEIADES_RGBN_16
     See: :class:`geoimagenet_api.geoserver_setup.main.ImageData`
     """
-    image_alias1 = aliased(DBImage)
-    image_alias2 = aliased(DBImage)
-
-    # subquery = (
-    #     session.query(
-    #         func.concat(
-    #             image_alias2.sensor_name,
-    #             "_",
-    #             image_alias2.bands,
-    #             "_",
-    #             cast(image_alias2.bits, String),
-    #             os.path.sep,
-    #             image_alias2.filename,
-    #         ).label("image_name_16_bits")
-    #     )
-    #     .filter(image_alias2.bits == 16)
-    #     .filter(image_alias2.bands == "RGBN")
-    #     .filter(image_alias2.sensor_name == DBImage.sensor_name)
-    #     .order_by(func.levenshtein(image_alias1.filename, image_alias2.filename))
-    #     .limit(1)
-    #     .subquery()
-    # )
-    #
-    # query = session.query(
-    #     image_alias1.id.label("image_id"), subquery.c.image_name_16_bits
-    # )
-
-    image_name_16_bits = func.concat(
-        image_alias2.sensor_name,
-        "_",
-        image_alias2.bands,
-        "_",
-        cast(image_alias2.bits, String),
-        os.path.sep,
-        image_alias2.filename,
-        image_alias2.extension,
-    ).label("image_name")
-
-    id_with_16_bit_name = (
-        session.query(image_alias1.id.label("image_id"), image_name_16_bits)
-            .filter(image_alias2.bits == 16)
-            .filter(image_alias2.bands == "RGBN")
-            .filter(image_alias2.sensor_name == image_alias1.sensor_name)
-            .distinct(image_alias1.id)
-            .order_by(
-            image_alias1.id,
-            func.levenshtein(image_alias1.filename, image_alias2.filename),
-        )
-    ).subquery("id_with_16_bit_name")
-    return id_with_16_bit_name
+    return query_image_rgbn_16_bit(session).subquery("id_with_16_bit_name")
 
 
 def image_id_from_properties(session: Session, properties: AnnotationProperties) -> int:
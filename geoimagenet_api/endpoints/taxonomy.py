@@ -1,19 +1,23 @@
-from typing import List, Dict
+from collections import defaultdict
+from typing import List, Dict, Optional
 
 from fastapi import APIRouter, Query, Path
 from slugify import slugify
 from sqlalchemy import func
-
-
-import sentry_sdk
+from sqlalchemy.orm import Query as OrmQuery
 from starlette.exceptions import HTTPException
 
+from geoimagenet_api.cache import VersionedCache, fetch_data_version
 from geoimagenet_api.openapi_schemas import Taxonomy, TaxonomyVersion, TaxonomyGroup
 from geoimagenet_api.database.models import (
     Taxonomy as DBTaxonomy,
     TaxonomyClass as DBTaxonomyClass,
 )
+from geoimagenet_api.database.async_connection import fetch_all
 from geoimagenet_api.database.connection import connection_manager
+from geoimagenet_api.responses import FastJSONResponse
+from geoimagenet_api.sentry import capture_exception
+from geoimagenet_api.utils import get_latest_version_number
 
 router = APIRouter()
 
@@ -24,7 +28,7 @@ def get_latest_taxonomy_ids() -> Dict[str, int]:
     Returns the taxonomy ids from the Taxonomy database, which are the
     root classes for the TaxonomyClass database.
     """
-    with connection_manager.get_db_session() as session:
+    with connection_manager.get_db_session(read_only=True) as session:
         query = session.query(
             DBTaxonomy.name_fr,
             func.array_agg(DBTaxonomy.id).label("ids"),
@@ -40,7 +44,7 @@ def get_adjusted_taxonomy_ids() -> Dict[str, int]:
     """
     latest_taxonomy_ids = get_latest_taxonomy_ids()
 
-    with connection_manager.get_db_session() as session:
+    with connection_manager.get_db_session(read_only=True) as session:
 
         adjust_query = session.query(
             DBTaxonomyClass.name_fr,
@@ -51,22 +55,104 @@ def get_adjusted_taxonomy_ids() -> Dict[str, int]:
         
         return {q.name_fr: q.ids[q.taxids.index(latest_taxonomy_ids[q.name_fr])] for q in adjust_query}
 
-def aggregated_taxonomies():
-    with connection_manager.get_db_session() as session:
-        query = (
-            session.query(
+def aggregated_taxonomies_query() -> OrmQuery:
+    """The taxonomies grouped by name, with the ids and root classes of each version."""
+    return (
+        OrmQuery(
+            [
                 func.array_agg(DBTaxonomy.id),
                 DBTaxonomy.name_fr,
                 DBTaxonomy.name_en,
                 func.array_agg(DBTaxonomyClass.id.label("root_taxonomy_class_id")),
                 func.array_agg(DBTaxonomy.version),
-            )
-            .join(DBTaxonomyClass)
-            .filter(DBTaxonomyClass.parent_id.is_(None))
-            .group_by(DBTaxonomy.name_fr, DBTaxonomy.name_en)
-            .order_by(DBTaxonomy.name_fr)
+            ]
         )
-        return query.all()
+        .join(DBTaxonomyClass)
+        .filter(DBTaxonomyClass.parent_id.is_(None))
+        .group_by(DBTaxonomy.name_fr, DBTaxonomy.name_en)
+        .order_by(DBTaxonomy.name_fr)
+    )
+
+
+class TaxonomyIndex:
+    """The taxonomies by name, slug and version, so that lookups don't query or slugify.
+
+    Each group contains the versions of the taxonomies having the same names.
+    """
+
+    def __init__(self, rows):
+        self.groups = []
+        self.versions = set()
+        self._groups_by_name = defaultdict(list)
+        self._taxonomies = {}
+        self._ids_by_version = defaultdict(list)
+
+        for ids, name_fr, name_en, root_taxonomy_class_ids, versions in rows:
+            slug = slugify(name_fr)
+            group = TaxonomyGroup(
+                name_fr=name_fr,
+                name_en=name_en,
+                slug=slug,
+                versions=[
+                    TaxonomyVersion(taxonomy_id=i, root_taxonomy_class_id=c, version=v)
+                    for i, c, v in zip(ids, root_taxonomy_class_ids, versions)
+                ],
+            )
+            self.groups.append(group)
+
+            for name in {name_fr, slug, name_en, slugify(name_en or "")}:
+                if name is not None:
+                    self._groups_by_name[name].append(group)
+
+            for taxonomy_version in group.versions:
+                version = taxonomy_version.version
+                self.versions.add(version)
+                self._ids_by_version[version].append(taxonomy_version.taxonomy_id)
+                self._taxonomies[slug, version] = Taxonomy(
+                    id=taxonomy_version.taxonomy_id,
+                    name_fr=name_fr,
+                    name_en=name_en,
+                    slug=slug,
+                    version=version,
+                    root_taxonomy_class_id=taxonomy_version.root_taxonomy_class_id,
+                )
+
+        self.latest_version = None
+        if self.versions:
+            self.latest_version = get_latest_version_number(self.versions)
+
+    def find(self, name: str) -> List[TaxonomyGroup]:
+        """The groups matching a french or english name, or their slugs."""
+        return self._groups_by_name.get(name, [])
+
+    def get(self, slug: str, version: str) -> Optional[Taxonomy]:
+        """The taxonomy from the slug of its french name and its version."""
+        return self._taxonomies.get((slug, version))
+
+    def taxonomy_ids(self, version: str, name: str = None) -> List[int]:
+        """The ids of the taxonomies of a version, optionally matching a name."""
+        if name is None:
+            return self._ids_by_version.get(version, [])
+        return [
+            v.taxonomy_id
+            for group in self.find(name)
+            for v in group.versions
+            if v.version == version
+        ]
+
+
+# The taxonomies change only when a new taxonomy is loaded.
+# The index is rebuilt when the 'taxonomy' data version changes.
+_taxonomy_index_cache = VersionedCache(maxsize=1)
+
+
+async def fetch_taxonomy_index() -> TaxonomyIndex:
+    version = await fetch_data_version("taxonomy")
+    index = _taxonomy_index_cache.get("index", version)
+    if index is None:
+        index = TaxonomyIndex(await fetch_all(aggregated_taxonomies_query()))
+        _taxonomy_index_cache.set("index", version, index)
+    return index
 
 
 name_query = Query(
@@ -80,48 +166,34 @@ name_query = Query(
 
 
 @router.get("/taxonomy", response_model=List[TaxonomyGroup], summary="Search")
-def search(name: str = name_query, version: str = None):
+async def search(name: str = name_query, version: str = None):
     if version and not name:
         raise HTTPException(400, "Please provide a `name` if you provide a `version`.")
 
+    index = await fetch_taxonomy_index()
+    groups = index.groups if name is None else index.find(name)
+
     taxonomy_list = []
-    for taxonomy in aggregated_taxonomies():
-        ids, name_fr, name_en, root_taxonomy_class_ids, taxonomy_versions = taxonomy
-        taxonomy_infos = list(zip(ids, root_taxonomy_class_ids, taxonomy_versions))
-        if name is not None:
-            if name not in (name_fr, slugify(name_fr), name_en, slugify(name_en or "")):
-                continue
+    for group in groups:
         if version is not None:
-            if version in taxonomy_versions:
-                index = taxonomy_versions.index(version)
-                taxonomy_infos = taxonomy_infos[index : index + 1]
-            else:
+            versions = [v for v in group.versions if v.version == version]
+            if not versions:
                 raise HTTPException(
                     404, f"Version not found name={name} version={version}"
                 )
+            group = group.copy(update={"versions": versions})
 
-        versions = [
-            TaxonomyVersion(taxonomy_id=i, root_taxonomy_class_id=c, version=v)
-            for i, c, v in taxonomy_infos
-        ]
-        taxonomy_group = TaxonomyGroup(
-            name_fr=taxonomy.name_fr,
-            name_en=taxonomy.name_en,
-            slug=slugify(taxonomy.name_fr),
-            versions=versions,
-        )
-
-        taxonomy_list.append(taxonomy_group)
+        taxonomy_list.append(group)
 
     if not taxonomy_list:  # pragma: no cover
         message = (
             "Could't find any taxonomy. " "The data is not loaded in the database yet."
         )
-        sentry_sdk.capture_exception(error=ValueError(message))
+        capture_exception(error=ValueError(message))
         raise HTTPException(
             503, message + " This error was reported to the developers."
         )
-    return taxonomy_list
+    return FastJSONResponse(taxonomy_list)
 
 
 name_slug_path = Path(
@@ -132,19 +204,9 @@ name_slug_path = Path(
 @router.get(
     "/taxonomy/{name_slug}/{version}", response_model=Taxonomy, summary="Get by slug"
 )
-def get_by_slug(version: str, name_slug: str = name_slug_path):
-    for taxonomy in aggregated_taxonomies():
-        ids, name_fr, name_en, root_taxonomy_class_ids, taxonomy_versions = taxonomy
-        if slugify(name_fr) == name_slug and version in taxonomy_versions:
-            index = taxonomy_versions.index(version)
-            taxonomy_id = ids[index]
-            taxonomy_class_root = root_taxonomy_class_ids[index]
-            return Taxonomy(
-                id=taxonomy_id,
-                name_fr=taxonomy.name_fr,
-                name_en=taxonomy.name_en,
-                slug=name_slug,
-                version=version,
-                root_taxonomy_class_id=taxonomy_class_root,
-            )
+async def get_by_slug(version: str, name_slug: str = name_slug_path):
+    index = await fetch_taxonomy_index()
+    taxonomy = index.get(name_slug, version)
+    if taxonomy is not None:
+        return taxonomy
     raise HTTPException(404, "No taxonomy found")
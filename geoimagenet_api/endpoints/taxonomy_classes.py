@@ -1,14 +1,18 @@
 from typing import List, Union, Optional
 
 from fastapi import APIRouter, HTTPException, Query
-from slugify import slugify
 from collections import defaultdict
 
+from sqlalchemy import any_, bindparam, literal, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import aliased, Query as OrmQuery
+from sqlalchemy.sql.elements import BindParameter
+
 from geoimagenet_api.openapi_schemas import TaxonomyClass
 from geoimagenet_api.database.models import TaxonomyClass as DBTaxonomyClass
-from geoimagenet_api.database.models import Taxonomy as DBTaxonomy
-from geoimagenet_api.database.connection import connection_manager
-from geoimagenet_api.utils import get_latest_version_number
+from geoimagenet_api.database.async_connection import cached_statement, fetch_all
+from geoimagenet_api.endpoints.taxonomy import fetch_taxonomy_index
+from geoimagenet_api.responses import FastJSONResponse
 
 router = APIRouter()
 
@@ -39,106 +43,57 @@ taxonomy_version_query = Query(
     ),
 )
 
+depth_query = Query(
+    -1,
+    description=(
+        "Number of levels of children to return. "
+        "0 returns the taxonomy classes without their children, "
+        "and a negative number returns all the levels."
+    ),
+)
+
 
 @router.get("/taxonomy_classes", response_model=List[TaxonomyClass], summary="Search")
-def search(
+async def search(
     name: str = name_query,
     taxonomy_name: str = taxonomy_name_query,
     taxonomy_version: str = taxonomy_version_query,
-    depth: int = -1,
+    depth: int = depth_query,
 ):
-    with connection_manager.get_db_session() as session:
-
-        if not taxonomy_version:
-            versions = [t.version for t in session.query(DBTaxonomy.version)]
-            taxonomy_version = get_latest_version_number(versions)
-
-        taxonomy_ids = []
-        for t in session.query(DBTaxonomy):
-            taxonomy_name_ok = True
-            taxonomy_version_ok = t.version == taxonomy_version
-
-            if taxonomy_name:
-                name_variations = (
-                    t.name_fr,
-                    slugify(t.name_fr),
-                    t.name_en,
-                    slugify(t.name_en or ""),
-                )
-                if taxonomy_name not in name_variations:
-                    taxonomy_name_ok = False
-
-            if taxonomy_name_ok and taxonomy_version_ok:
-                taxonomy_ids.append(t.id)
-
-        if not taxonomy_ids:
-            raise HTTPException(
-                404, f"Taxonomy name or slug not found: {taxonomy_name}"
-            )
-
-        taxonomy_classes = session.query(
-            DBTaxonomyClass.id,
-            DBTaxonomyClass.name_fr,
-            DBTaxonomyClass.name_en,
-            DBTaxonomyClass.taxonomy_id,
-            DBTaxonomyClass.code,
-        ).filter(DBTaxonomyClass.taxonomy_id.in_(taxonomy_ids))
-
-        if name:
-            taxonomy_classes = taxonomy_classes.filter_by(name_fr=name)
-        else:
-            taxonomy_classes = taxonomy_classes.filter_by(parent=None)
-
-        if not taxonomy_classes.count():
-            raise HTTPException(404, f"Taxonomy class name not found: {name}")
-
-        if depth != 0:
-            return [
-                get_taxonomy_classes_tree(session, taxonomy_class_id=taxo.id)
-                for taxo in taxonomy_classes
-            ]
-        else:
-            return [
-                TaxonomyClass(
-                    id=taxo.id,
-                    name_fr=taxo.name_fr,
-                    name_en=taxo.name_en,
-                    taxonomy_id=taxo.taxonomy_id,
-                    code=taxo.code,
-                )
-                for taxo in taxonomy_classes
-            ]
+    index = await fetch_taxonomy_index()
+    if not taxonomy_version:
+        taxonomy_version = index.latest_version
+    taxonomy_ids = index.taxonomy_ids(taxonomy_version, taxonomy_name)
+
+    if not taxonomy_ids:
+        raise HTTPException(404, f"Taxonomy name or slug not found: {taxonomy_name}")
+
+    statement = cached_statement(
+        "taxonomy_classes.search",
+        lambda: query_taxonomy_classes(
+            None, bindparam("taxonomy_ids", type_=ARRAY(Integer))
+        ),
+    )
+    rows = await fetch_all(statement, {"taxonomy_ids": taxonomy_ids})
+
+    if name:
+        root_ids = [row.id for row in rows if row.name_fr == name]
+    else:
+        root_ids = [row.id for row in rows if row.parent_id is None]
+
+    if not root_ids:
+        raise HTTPException(404, f"Taxonomy class name not found: {name}")
+
+    taxonomy_class_list = build_taxonomy_classes_trees(rows, root_ids, depth)
+    return FastJSONResponse(taxonomy_class_list)
 
 
 @router.get("/taxonomy_classes/{id}", response_model=TaxonomyClass, summary="Get by id")
-def get(id: int, depth: int = -1):
-    with connection_manager.get_db_session() as session:
-        taxonomy_class = (
-            session.query(
-                DBTaxonomyClass.id,
-                DBTaxonomyClass.name_fr,
-                DBTaxonomyClass.name_en,
-                DBTaxonomyClass.taxonomy_id,
-                DBTaxonomyClass.code,
-            )
-            .filter_by(id=id)
-            .first()
-        )
-        if not taxonomy_class:
-            raise HTTPException(404, "Taxonomy class id not found")
-        if depth != 0:
-            taxonomy_class = get_taxonomy_classes_tree(
-                session, taxonomy_class_id=taxonomy_class.id
-            )
-        else:
-            taxonomy_class = TaxonomyClass(
-                id=taxonomy_class.id,
-                name_fr=taxonomy_class.name_fr,
-                name_en=taxonomy_class.name_en,
-                taxonomy_id=taxonomy_class.taxonomy_id,
-                code=taxonomy_class.code,
-            )
-    return taxonomy_class
+async def get(id: int, depth: int = depth_query):
+    taxonomy_class = await fetch_taxonomy_classes_tree(id, depth)
+    if not taxonomy_class:
+        raise HTTPException(404, "Taxonomy class id not found")
+    return FastJSONResponse(taxonomy_class)
 
 
 def get_all_taxonomy_classes_ids(session, taxonomy_class_id: int) -> List[int]:
@@ -146,6 +101,36 @@ def get_all_taxonomy_classes_ids(session, taxonomy_class_id: int) -> List[int]:
     return flatten_taxonomy_classes_ids(taxo_tree)
 
 
+def query_taxonomy_classes_closure(taxonomy_ids: Union[List[int], BindParameter]):
+    """Recursive query pairing each taxonomy class with all of its descendants.
+
+    The returned CTE has the columns `ancestor_id` and `taxonomy_class_id`.
+    Each taxonomy class is also paired with itself, so joining on `taxonomy_class_id`
+    and grouping by `ancestor_id` rolls up the values of the children into their parents.
+
+    `taxonomy_ids` can be a bind parameter of type ARRAY(Integer).
+    """
+    if not isinstance(taxonomy_ids, BindParameter):
+        taxonomy_ids = literal(list(taxonomy_ids), ARRAY(Integer))
+    closure = (
+        OrmQuery(
+            [
+                DBTaxonomyClass.id.label("ancestor_id"),
+                DBTaxonomyClass.id.label("taxonomy_class_id"),
+            ]
+        )
+        .filter(DBTaxonomyClass.taxonomy_id == any_(taxonomy_ids))
+        .cte("taxonomy_closure", recursive=True)
+    )
+    children = aliased(DBTaxonomyClass)
+    closure = closure.union_all(
+        OrmQuery([closure.c.ancestor_id, children.id]).filter(
+            children.parent_id == closure.c.taxonomy_class_id
+        )
+    )
+    return closure
+
+
 def flatten_taxonomy_classes_ids(
     taxo: Union[TaxonomyClass, DBTaxonomyClass]
 ) -> List[int]:
@@ -160,68 +145,106 @@ def flatten_taxonomy_classes_ids(
     return queried_taxo_ids
 
 
-def get_taxonomy_classes_tree(
-    session, taxonomy_class_id: int
-) -> Union[TaxonomyClass, None]:
-    """Builds the taxonomy_class tree.
+taxonomy_class_columns = [
+    DBTaxonomyClass.id,
+    DBTaxonomyClass.name_fr,
+    DBTaxonomyClass.name_en,
+    DBTaxonomyClass.taxonomy_id,
+    DBTaxonomyClass.parent_id,
+    DBTaxonomyClass.code,
+]
 
-    Return the specified taxonomy_class_id and its children.
 
-    Be sure to use the TaxonomyClass.id as input, and not TaxonomyClass.taxonomy_id, else this
-    function will build the wrong taxonomy tree.
+def query_taxonomy_classes(session, taxonomy_ids) -> OrmQuery:
+    """All the taxonomy classes of the taxonomies, ordered by id.
+
+    `taxonomy_ids` can also be a scalar subquery returning a single taxonomy id,
+    or a bind parameter of type ARRAY(Integer). The session can be None
+    for the queries executed with `fetch_all`.
+    """
+    query = OrmQuery(taxonomy_class_columns, session)
+    if isinstance(taxonomy_ids, list):
+        query = query.filter(DBTaxonomyClass.taxonomy_id.in_(taxonomy_ids))
+    elif isinstance(taxonomy_ids, BindParameter):
+        query = query.filter(DBTaxonomyClass.taxonomy_id == any_(taxonomy_ids))
+    else:
+        query = query.filter(DBTaxonomyClass.taxonomy_id == taxonomy_ids)
+    return query.order_by(DBTaxonomyClass.id)
+
+
+def _query_taxonomy_classes_of_class(session, taxonomy_class_id) -> OrmQuery:
+    """All the taxonomy classes of the taxonomy of `taxonomy_class_id`."""
+    taxonomy_id = (
+        OrmQuery(DBTaxonomyClass.taxonomy_id, session)
+        .filter(DBTaxonomyClass.id == taxonomy_class_id)
+        .as_scalar()
+    )
+    return query_taxonomy_classes(session, taxonomy_id)
+
+
+def build_taxonomy_classes_trees(
+    rows, root_ids: List[int], depth: int = -1
+) -> List[TaxonomyClass]:
+    """Build the trees under each of `root_ids`, from the rows of their taxonomies.
+
+    The rows must have the columns of `taxonomy_class_columns`. The list of rows is
+    looped only once, so all the trees of a taxonomy are built from a single query.
 
-    This is the most effective solution I found to query this kind of nested elements.
+    Only `depth` levels of children are included, all of them if `depth` is negative.
+    `has_children` tells the classes cut off by the depth apart from the leaves.
+    """
+    rows_by_id = {}
+    children_rows = defaultdict(list)
+    for row in rows:
+        rows_by_id[row.id] = row
+        children_rows[row.parent_id].append(row)
+
+    def build(row, level):
+        children = []
+        if depth < 0 or level < depth:
+            children = [build(child, level + 1) for child in children_rows[row.id]]
+        return TaxonomyClass(
+            id=row.id,
+            name_fr=row.name_fr,
+            name_en=row.name_en,
+            taxonomy_id=row.taxonomy_id,
+            code=row.code,
+            children=children,
+            has_children=bool(children_rows[row.id]),
+        )
 
-    The methods tried are:
+    return [build(rows_by_id[id_], 0) for id_ in root_ids if id_ in rows_by_id]
 
-    - join parameters directly in the sqlalchemy model 'children' relationship
-    - join parameters in the sqlalchemy query
-    - recursive query using postgresql 'with recursive' instruction
 
-    The taxonomy class list is very small, and this algorithm loops the list only once.
+def get_taxonomy_classes_tree(
+    session, taxonomy_class_id: int, depth: int = -1
+) -> Union[TaxonomyClass, None]:
+    """Builds the taxonomy_class tree.
 
-    This query happens at multiple places, so it makes sense to keep it fast.
+    Return the specified taxonomy_class_id and its children, up to `depth` levels.
 
-    This should be the fastest based on my tests.
+    Be sure to use the TaxonomyClass.id as input, and not TaxonomyClass.taxonomy_id, else this
+    function will build the wrong taxonomy tree.
+
+    The taxonomy class list is very small, so the whole taxonomy is fetched in a
+    single query, and the tree is built in python.
+    See :func:`build_taxonomy_classes_trees`
     """
+    rows = _query_taxonomy_classes_of_class(session, taxonomy_class_id).all()
+    trees = build_taxonomy_classes_trees(rows, [taxonomy_class_id], depth)
+    return trees[0] if trees else None
 
-    taxonomy_class = (
-        session.query(DBTaxonomyClass.taxonomy_id)
-        .filter_by(id=taxonomy_class_id)
-        .first()
-    )
 
-    if taxonomy_class:
-        taxonomy_id = taxonomy_class.taxonomy_id
-
-        seen_classes = {}
-        missing_parents = defaultdict(list)
-
-        taxonomy_query = session.query(
-            DBTaxonomyClass.id,
-            DBTaxonomyClass.name_fr,
-            DBTaxonomyClass.name_en,
-            DBTaxonomyClass.parent_id,
-            DBTaxonomyClass.code,
-        ).filter_by(taxonomy_id=taxonomy_id)
-
-        for taxo in taxonomy_query:
-            taxonomy_class = TaxonomyClass(
-                id=taxo.id,
-                name_fr=taxo.name_fr,
-                name_en=taxo.name_en,
-                taxonomy_id=taxonomy_id,
-                code=taxo.code,
-            )
-            seen_classes[taxo.id] = taxonomy_class
-
-            if taxo.id in missing_parents:
-                for child in missing_parents[taxo.id]:
-                    taxonomy_class.children.append(child)
-
-            if taxo.parent_id in seen_classes:
-                seen_classes[taxo.parent_id].children.append(taxonomy_class)
-            else:
-                missing_parents[taxo.parent_id].append(taxonomy_class)
-
-        return seen_classes[taxonomy_class_id]
+async def fetch_taxonomy_classes_tree(
+    taxonomy_class_id: int, depth: int = -1
+) -> Union[TaxonomyClass, None]:
+    """Same as `get_taxonomy_classes_tree`, for asynchronous endpoints."""
+    statement = cached_statement(
+        "taxonomy_classes.tree",
+        lambda: _query_taxonomy_classes_of_class(
+            None, bindparam("taxonomy_class_id", type_=Integer)
+        ),
+    )
+    rows = await fetch_all(statement, {"taxonomy_class_id": taxonomy_class_id})
+    trees = build_taxonomy_classes_trees(rows, [taxonomy_class_id], depth)
+    return trees[0] if trees else None
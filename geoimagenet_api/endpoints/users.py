@@ -1,18 +1,20 @@
 from typing import Optional, List
 
 import requests
-import sentry_sdk
 from sqlalchemy.exc import IntegrityError
 from starlette.responses import Response
 
 from geoimagenet_api.database.connection import connection_manager
 from starlette.requests import Request
 
+from geoimagenet_api import profiling
 from geoimagenet_api.config import config
+from geoimagenet_api.sentry import capture_exception
 
 from fastapi import APIRouter, HTTPException
 
 from geoimagenet_api.database.models import Person, PersonFollower
+from geoimagenet_api.metrics import MAGPIE_REQUEST_DURATION
 from geoimagenet_api.openapi_schemas import User, Follower
 from geoimagenet_api.utils import get_config_url
 
@@ -27,10 +29,11 @@ def _get_magpie_user(request: Request) -> User:
     magpie_url = get_config_url(request, "magpie_url")
     user_url = f"{magpie_url}/users/current"
 
-    verify_ssl = config.get("magpie_verify_ssl", bool)
-    response = requests.get(
-        user_url, cookies=request.cookies, verify=verify_ssl, timeout=5
-    )
+    verify_ssl = config.settings.magpie_verify_ssl
+    with MAGPIE_REQUEST_DURATION.time(), profiling.timed("magpie"):
+        response = requests.get(
+            user_url, cookies=request.cookies, verify=verify_ssl, timeout=5
+        )
     response.raise_for_status()
 
     data = response.json()
@@ -79,7 +82,7 @@ def get_logged_user_id(request: Request, raise_if_logged_out=True) -> Optional[i
     try:
         logged_user = _get_magpie_user(request)
     except requests.exceptions.RequestException:  # pragma: no cover
-        sentry_sdk.capture_exception()
+        capture_exception()
         raise HTTPException(
             503,
             "There was a problem connecting to magpie. This error was reported to the developers.",
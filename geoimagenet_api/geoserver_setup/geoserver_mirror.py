@@ -6,6 +6,7 @@ import csv
 from loguru import logger
 
 from geoimagenet_api.database.connection import connection_manager
+from geoimagenet_api.database.image_rgbn_16_bit import rebuild_image_rgbn_16_bit
 from geoimagenet_api.database.models import Image
 from geoimagenet_api.geoserver_setup import images_names_utils
 from geoimagenet_api.geoserver_setup.geoserver_datastore import GeoServerDatastore
@@ -139,6 +140,20 @@ class GeoServerMirror(GeoServerDatastore):
             if not self.dry_run:
                 session.commit()
 
+    def write_postgis_image_16_bits_info(self):
+        """Pair every image with its 16 bits RGBN image in the postgis database.
+
+        The pairings are kept up to date by triggers when images are written,
+        this recomputes all of them from scratch.
+        """
+        logger.info(f"Writing 16 bits images information in database")
+
+        if self.dry_run:
+            return
+
+        with connection_manager.get_db_session() as session:
+            rebuild_image_rgbn_16_bit(session)
+
     def _get_ewkt(self, sensor_name, layer_name):
         traces_layer_names = [
             layer["name"]
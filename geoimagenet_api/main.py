@@ -0,0 +1,115 @@
+"""The asgi application.
+
+Use `create_app` as an application factory, for example with gunicorn:
+`gunicorn --preload -k uvicorn.workers.UvicornWorker 'geoimagenet_api.main:create_app()'`
+
+No database connection is opened when the application is created, so it can be
+created before the workers are forked.
+"""
+import logging
+from pathlib import Path
+from typing import Tuple
+
+from fastapi import FastAPI
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse, RedirectResponse
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from geoimagenet_api import config, endpoints
+from geoimagenet_api.__about__ import __version__
+from geoimagenet_api.database import async_connection, connection
+from geoimagenet_api.metrics import MetricsMiddleware
+from geoimagenet_api.middleware import (
+    ReadYourWritesMiddleware,
+    ResponseCacheMiddleware,
+    ServerTimingMiddleware,
+)
+from geoimagenet_api.sentry import init_sentry
+
+logger = logging.getLogger(__name__)
+
+
+def _create_apps() -> Tuple[FastAPI, FastAPI]:
+    """Returns the application served at the root, and the api mounted at /api/v1."""
+    if config.settings.wait_for_db_connection_on_import:  # pragma: no cover
+        connection.wait_for_db_connection()
+
+    init_sentry()
+
+    application = FastAPI()
+
+    application.add_middleware(ProxyHeadersMiddleware)
+    application.add_middleware(ReadYourWritesMiddleware)
+    application.add_middleware(ServerTimingMiddleware)
+
+    if config.settings.allow_cors:  # pragma: no cover
+        application.add_middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_methods=["*"],
+            allow_headers=["*"],
+            allow_credentials=True,
+        )
+
+    app = FastAPI(
+        openapi_prefix="/api/v1",
+        title="GeoImageNet Annotations API",
+        description="API for the GeoImageNet platform",
+        version=__version__,
+    )
+    app.add_middleware(ResponseCacheMiddleware, routes=endpoints.cached_routes)
+    app.add_middleware(MetricsMiddleware, routes=app.routes)
+    application.mount("/api/v1", app)
+
+    @application.get("/api/", include_in_schema=False)
+    def redirect_v1():
+        return RedirectResponse(url="/api/v1")
+
+    @app.get("/changelog/", include_in_schema=False, response_class=PlainTextResponse)
+    def changelog():
+        return Path(__file__).with_name("CHANGELOG.rst").read_text()
+
+    app.include_router(endpoints.router)
+
+    application.add_event_handler("shutdown", endpoints.batches.close_http_client)
+    application.add_event_handler("shutdown", async_connection.close_pool)
+
+    logger.info("App initialized")
+
+    return application, app
+
+
+_apps = None
+
+
+def _get_apps() -> Tuple[FastAPI, FastAPI]:
+    global _apps
+    if _apps is None:
+        _apps = _create_apps()
+    return _apps
+
+
+def create_app() -> FastAPI:
+    """Application factory, returns the application served at the root.
+
+    The applications are built only once, and shared with the `application`
+    and `app` attributes of this module.
+    """
+    application, _ = _get_apps()
+    return application
+
+
+def __getattr__(name):
+    # `application` and `app` are built when they are first requested,
+    # so that importing this module for `create_app` doesn't build them twice
+    if name == "application":
+        return _get_apps()[0]
+    if name == "app":
+        return _get_apps()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    import uvicorn
+
+    uvicorn.run(create_app(), host="0.0.0.0", port=8080)
@@ -0,0 +1,269 @@
+"""Prometheus metrics, served at `/metrics`.
+
+With multiple worker processes (gunicorn), the `prometheus_multiproc_dir`
+environment variable must point to an empty directory shared by the workers,
+and the gunicorn configuration must call `mark_process_dead` when a worker exits
+(see `gunicorn.conf.py`). The metrics of all the workers are then aggregated
+when `/metrics` is requested. The connection pool gauges are updated on each
+checkout and checkin, and summed over the workers (the saturation is the maximum).
+"""
+import contextvars
+import os
+import time
+import weakref
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from geoimagenet_api import profiling
+from geoimagenet_api.database.connection import _TimedQueuePool
+
+REQUEST_DURATION = Histogram(
+    "geoimagenet_api_request_duration_seconds",
+    "Duration of the requests, until the end of the response body.",
+    ["method", "route"],
+)
+REQUESTS = Counter(
+    "geoimagenet_api_requests_total",
+    "Number of requests, by response status code.",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "geoimagenet_api_requests_in_progress",
+    "Number of requests being handled.",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+
+DB_QUERY_DURATION = Histogram(
+    "geoimagenet_api_db_query_duration_seconds",
+    "Duration of each database query.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_QUERY_ERRORS = Counter(
+    "geoimagenet_api_db_query_errors",
+    "Database queries that raised an error.",
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "geoimagenet_api_db_queries_per_request",
+    "Number of database queries of each request.",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "geoimagenet_api_db_time_per_request_seconds",
+    "Time spent in database queries for each request.",
+    ["route"],
+)
+
+MAGPIE_REQUEST_DURATION = Histogram(
+    "geoimagenet_api_magpie_request_duration_seconds",
+    "Duration of the requests to magpie for the logged in user.",
+)
+
+GEOJSON_STREAM_ROWS = Counter(
+    "geoimagenet_api_geojson_stream_rows_total",
+    "Features written by geojson streams.",
+    ["feature"],
+)
+GEOJSON_STREAM_BYTES = Counter(
+    "geoimagenet_api_geojson_stream_bytes_total",
+    "Characters written by geojson streams.",
+    ["feature"],
+)
+GEOJSON_STREAM_DURATION = Histogram(
+    "geoimagenet_api_geojson_stream_duration_seconds",
+    "Duration of geojson streams, from the first to the last feature.",
+    ["feature"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+# database statistics of the current request, see `MetricsMiddleware`
+_request_db_stats = contextvars.ContextVar("request_db_stats", default=None)
+
+
+class _DbStats:
+    __slots__ = ("queries", "duration")
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+
+def record_db_query(duration: float, statement: str = None):
+    """Record the duration of a database query, for the current request."""
+    DB_QUERY_DURATION.observe(duration)
+    profiling.record("db", duration, statement)
+    stats = _request_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.duration += duration
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start_time"].pop()
+    record_db_query(time.perf_counter() - start, statement)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    """Record the queries that raised an error, timed from `before_cursor_execute`."""
+    DB_QUERY_ERRORS.inc()
+    conn = context.connection
+    if conn is None or context.cursor is None:
+        # the error happened before the query was sent
+        return
+    start_times = conn.info.get("query_start_time")
+    if start_times:
+        record_db_query(time.perf_counter() - start_times.pop(), context.statement)
+
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "geoimagenet_api_db_pool_checked_out",
+    "Connections checked out of the sqlalchemy pools.",
+    ["database"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "geoimagenet_api_db_pool_overflow",
+    "Connections opened over the size of the sqlalchemy pools.",
+    ["database"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_SATURATION = Gauge(
+    "geoimagenet_api_db_pool_saturation",
+    "Checked out connections over the capacity of the pool, of the busiest worker.",
+    ["database"],
+    multiprocess_mode="livemax",
+)
+DB_POOL_CHECKOUT_WAIT = Counter(
+    "geoimagenet_api_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool.",
+    ["database"],
+)
+DB_POOL_CHECKOUT_ERRORS = Counter(
+    "geoimagenet_api_db_pool_checkout_errors",
+    "Failed connection checkouts (ex: pool timeouts).",
+    ["database"],
+)
+
+# the pool of each connection record, as the checkin event is not given the pool
+_record_pools = weakref.WeakKeyDictionary()
+
+
+def _set_pool_gauges(pool: _TimedQueuePool, checkin: bool = False):
+    """Set the gauges of a pool, on a checkout or before a connection is checked in."""
+    checked_out = pool.checkedout()
+    overflow = pool.overflow()
+    if checkin:
+        checked_out -= 1
+        if pool.checkedin() >= pool.size():
+            # the pool is full, the connection is closed when it's returned
+            overflow -= 1
+    capacity = pool.size() + pool._max_overflow
+    DB_POOL_CHECKED_OUT.labels(pool.database).set(checked_out)
+    DB_POOL_OVERFLOW.labels(pool.database).set(max(overflow, 0))
+    saturation = checked_out / capacity if capacity > 0 else 0
+    DB_POOL_SATURATION.labels(pool.database).set(saturation)
+
+
+@event.listens_for(_TimedQueuePool, "checkout")
+def _pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool = connection_proxy._pool
+    _record_pools[connection_record] = pool
+    _set_pool_gauges(pool)
+
+
+@event.listens_for(_TimedQueuePool, "checkin")
+def _pool_checkin(dbapi_connection, connection_record):
+    pool = _record_pools.get(connection_record)
+    if pool is not None:
+        _set_pool_gauges(pool, checkin=True)
+
+
+def _record_pool_checkout(pool: _TimedQueuePool, wait: float, error: bool):
+    DB_POOL_CHECKOUT_WAIT.labels(pool.database).inc(wait)
+    if error:
+        DB_POOL_CHECKOUT_ERRORS.labels(pool.database).inc()
+
+
+_TimedQueuePool.checkout_listeners.append(_record_pool_checkout)
+
+
+def latest_metrics() -> bytes:
+    """The metrics in the prometheus text format, aggregated over all the workers."""
+    registry = REGISTRY
+    if "prometheus_multiproc_dir" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+class MetricsMiddleware:
+    """Record the latency, status code and database usage of each request.
+
+    The requests are labeled with the path of the matched route (ex: '/images/{id}'),
+    so that the number of labels stays bounded.
+    """
+
+    def __init__(self, app: ASGIApp, routes: list):
+        self.app = app
+        self.routes = routes
+
+    def _route_name(self, scope: Scope) -> str:
+        partial = None
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        return partial or "unmatched"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route_name(scope)
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        db_stats = _DbStats()
+        token = _request_db_stats.set(db_stats)
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, str(status_code)).inc()
+            in_progress.dec()
+            _request_db_stats.reset(token)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(db_stats.queries)
+            DB_TIME_PER_REQUEST.labels(route).observe(db_stats.duration)
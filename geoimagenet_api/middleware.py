@@ -0,0 +1,234 @@
+import gzip
+import hmac
+import json
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+from geoimagenet_api import config, profiling
+from geoimagenet_api.cache import VersionedCache, fetch_data_version, make_etag
+from geoimagenet_api.database.connection import connection_manager, primary_reads
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReadYourWritesMiddleware:
+    """Keep the reads of a client on the primary database for a while after it writes.
+
+    Requests that write are handled inside `primary_reads`, and their successful
+    responses set a cookie holding the time until which the client reads from
+    the primary (see the `replica_read_your_writes_delay` configuration).
+    Without a read replica, this middleware does nothing.
+    """
+
+    cookie_name = "geoimagenet_api_primary_until"
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or connection_manager.replica_engine is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] in SAFE_METHODS:
+            if self._primary_until(scope) > time.time():
+                with primary_reads():
+                    await self.app(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+            return
+
+        delay = config.settings.replica_read_your_writes_delay
+
+        async def send_with_cookie(message: Message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "set-cookie",
+                    f"{self.cookie_name}={time.time() + delay:.0f}; "
+                    f"Max-Age={delay}; Path=/; HttpOnly",
+                )
+            await send(message)
+
+        with primary_reads():
+            await self.app(scope, receive, send_with_cookie)
+
+    def _primary_until(self, scope: Scope) -> float:
+        try:
+            return float(Request(scope).cookies.get(self.cookie_name, 0))
+        except ValueError:
+            return 0
+
+
+class ServerTimingMiddleware:
+    """Profile the sql statements and external calls (magpie, ml) of a request.
+
+    Profiling is enabled for all requests with the `server_timing` configuration,
+    or for the requests sending the `server_timing_token` in the
+    `X-Server-Timing-Token` header.
+
+    The timings measured before the response starts are sent in the `Server-Timing`
+    header. The complete timings, including the streamed response body and the
+    background tasks, are logged at the end of the request, with the statements that
+    were executed more than once.
+    """
+
+    token_header = "x-server-timing-token"
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def _enabled(self, scope: Scope) -> bool:
+        if config.settings.server_timing:
+            return True
+        token = config.settings.server_timing_token
+        if not token:
+            return False
+        sent_token = Headers(scope=scope).get(self.token_header, "")
+        return hmac.compare_digest(sent_token.encode(), token.encode())
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._enabled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        with profiling.profile_request() as profile:
+
+            async def send_with_timing(message: Message):
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    headers = MutableHeaders(scope=message)
+                    headers.append("server-timing", profile.server_timing())
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                info = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_code,
+                }
+                info.update(profile.as_dict())
+                logger.info("request profile %s", json.dumps(info))
+
+
+class _CachedResponse:
+    __slots__ = ("headers", "body", "gzip_body")
+
+    # smaller bodies are not compressed
+    gzip_minimum_size = 500
+
+    def __init__(self, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.headers = headers
+        self.body = body
+        self.gzip_body = None
+        if len(body) >= self.gzip_minimum_size:
+            self.gzip_body = gzip.compress(body)
+
+
+class ResponseCacheMiddleware:
+    """Serve the responses of the reference data routes from memory.
+
+    Each route is tied to the data version of the tables it reads, for example
+    the 'taxonomy' version, which the database triggers increment on every write.
+    The successful GET responses are kept for each url, already encoded and
+    gzip compressed, until this data version changes.
+
+    The ETag is derived from the data version and the url, so the clients
+    revalidating with `If-None-Match` get a 304 response without running the
+    endpoint. The `Cache-Control` header comes from the `response_cache_max_age`
+    configuration. With 0, the clients must revalidate on each use.
+    """
+
+    def __init__(self, app: ASGIApp, routes: List[Tuple[str, str]]):
+        """:param routes: regular expressions matching paths, with their data version name"""
+        self.app = app
+        self.routes = [(re.compile(path), name) for path, name in routes]
+        self._caches: Dict[str, VersionedCache] = {}
+
+    def _data_version_name(self, path: str) -> Optional[str]:
+        for path_re, name in self.routes:
+            if path_re.fullmatch(path):
+                return name
+        return None
+
+    def _cache(self, name: str) -> VersionedCache:
+        if name not in self._caches:
+            maxsize = config.settings.response_cache_size
+            self._caches[name] = VersionedCache(maxsize=maxsize)
+        return self._caches[name]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        name = self._data_version_name(scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        version = await fetch_data_version(name)
+        key = (scope["path"], scope["query_string"])
+        cache = self._cache(name)
+
+        cached = cache.get(key, version)
+        if cached is None:
+            messages = []
+
+            async def collect(message: Message):
+                messages.append(message)
+
+            await self.app(scope, receive, collect)
+
+            start, body = messages[0], b"".join(m.get("body", b"") for m in messages)
+            if start["status"] != 200:
+                for message in messages:
+                    await send(message)
+                return
+
+            excluded = (b"content-length", b"content-encoding", b"etag")
+            headers = [h for h in start["headers"] if h[0].lower() not in excluded]
+            cached = _CachedResponse(headers, body)
+            cache.set(key, version, cached)
+
+        request_headers = Headers(scope=scope)
+        etag = make_etag(version, key)
+        body = cached.body
+        headers = list(cached.headers)
+        if cached.gzip_body is not None:
+            headers.append((b"vary", b"Accept-Encoding"))
+            if "gzip" in request_headers.get("accept-encoding", ""):
+                # each representation has its own strong etag
+                etag = etag[:-1] + '-gzip"'
+                body = cached.gzip_body
+                headers.append((b"content-encoding", b"gzip"))
+
+        max_age = config.settings.response_cache_max_age
+        cache_control = f"public, max-age={max_age}" if max_age else "no-cache"
+        headers.append((b"etag", etag.encode()))
+        headers.append((b"cache-control", cache_control.encode()))
+
+        if_none_match = request_headers.get("if-none-match", "")
+        if etag in (t.strip() for t in if_none_match.split(",")):
+            status = 304
+            body = b""
+        else:
+            status = 200
+            headers.append((b"content-length", str(len(body)).encode()))
+
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -1,11 +1,11 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Union, Any, Optional
+from typing import List, Union, Any, Optional, Dict
 
 from pydantic import BaseModel, Schema
 
-from geoimagenet_api.database.models import AnnotationStatus
+from geoimagenet_api.database.models import AnnotationStatus, BatchSubmissionStatus
 
 
 class ApiInfo(BaseModel):
@@ -40,6 +40,11 @@ class TaxonomyClass(BaseModel):
     code: str
     # Workaround OpenAPI recursive reference, using Any
     children: List[Any] = Schema([], description="A list of 'TaxonomyClass' objects.")
+    has_children: bool = Schema(
+        False,
+        description="Whether the class has children, "
+        "even when they are not returned because of the requested depth.",
+    )
 
 
 TaxonomyClass.update_forward_refs()
@@ -88,8 +93,21 @@ class BatchPostForwarded(BaseModel):
 
 
 class BatchPostResult(BaseModel):
+    id: int
+    status: BatchSubmissionStatus
     sent_to_ml: BatchPostForwarded
-    response_from_ml: dict
+    response_from_ml: dict = None
+
+
+class BatchSubmission(BaseModel):
+    id: int
+    status: BatchSubmissionStatus
+    attempts: int
+    error: str = None
+    created_at: datetime
+    updated_at: datetime
+    sent_to_ml: BatchPostForwarded
+    response_from_ml: dict = None
 
 
 class Image(BaseModel):
@@ -123,6 +141,16 @@ class AnnotationCountByStatus(BaseModel):
         )
 
 
+class TaxonomyClassCounts(BaseModel):
+    total: AnnotationCountByStatus
+    by_image: Dict[str, AnnotationCountByStatus] = Schema(
+        None, description="Counts by image name, when requested."
+    )
+    by_annotator: Dict[str, AnnotationCountByStatus] = Schema(
+        None, description="Counts by annotator id, when requested."
+    )
+
+
 annotation_ids_schema = Schema(
     ...,
     description="Must be an array of string like: "
@@ -207,3 +235,16 @@ class GeoJsonFeatureCollection(BaseModel):
     type: str = Schema(..., regex="FeatureCollection")
     crs: CRS = CRS(type="EPSG", properties=CRSCode(code=3857))
     features: List[GeoJsonFeature]
+
+
+class ImageFeature(BaseModel):
+    type: str = Schema(..., regex="Feature")
+    geometry: Polygon
+    properties: Image
+    id: str
+
+
+class ImageFeatureCollection(BaseModel):
+    type: str = Schema(..., regex="FeatureCollection")
+    crs: CRS = CRS(type="EPSG", properties=CRSCode(code=3857))
+    features: List[ImageFeature]
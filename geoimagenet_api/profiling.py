@@ -0,0 +1,100 @@
+"""Per-request timings of the sql statements and external calls.
+
+The timings are only collected inside `profile_request`, which is used by
+`ServerTimingMiddleware` when profiling is enabled for a request.
+"""
+
+import contextvars
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+_profile = contextvars.ContextVar("profile", default=None)
+
+
+class RequestProfile:
+    """Count and total duration of each kind of operation during a request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.counts = defaultdict(int)
+        self.durations = defaultdict(float)
+        self.statements = Counter()
+
+    def record(self, name: str, duration: float, statement: str = None):
+        self.counts[name] += 1
+        self.durations[name] += duration
+        if statement is not None:
+            self.statements[statement] += 1
+
+    def repeated_statements(self, limit=5) -> List[Dict]:
+        """The statements executed more than once, the most frequent first.
+
+        A statement repeated many times is often a query in a loop (N+1 queries).
+        """
+        return [
+            {"statement": statement[:200], "count": count}
+            for statement, count in self.statements.most_common(limit)
+            if count > 1
+        ]
+
+    def server_timing(self) -> str:
+        """The value of the `Server-Timing` header, durations in milliseconds."""
+        metrics = []
+        for name in sorted(self.counts):
+            duration = self.durations[name] * 1000
+            metrics.append(
+                f'{name};dur={duration:.1f};desc="{self.counts[name]} calls"'
+            )
+        total = time.perf_counter() - self.start
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def as_dict(self) -> Dict:
+        return {
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            "timings": {
+                name: {
+                    "count": self.counts[name],
+                    "duration_ms": round(self.durations[name] * 1000, 1),
+                }
+                for name in sorted(self.counts)
+            },
+            "repeated_statements": self.repeated_statements(),
+        }
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _profile.get()
+
+
+@contextmanager
+def profile_request():
+    """Collect the timings of the current context in a new `RequestProfile`."""
+    profile = RequestProfile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+def record(name: str, duration: float, statement: str = None):
+    """Add an operation to the profile of the current request, if any."""
+    profile = _profile.get()
+    if profile is not None:
+        profile.record(name, duration, statement)
+
+
+@contextmanager
+def timed(name: str):
+    """Time the enclosed block, for the profile of the current request."""
+    if _profile.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
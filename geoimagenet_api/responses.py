@@ -0,0 +1,195 @@
+import json
+import os
+import re
+from enum import Enum
+from typing import Any, BinaryIO, Optional, Tuple, Union
+
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+_range_re = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes' Range header into an inclusive (start, end) tuple.
+
+    Returns None when the header should be ignored (multiple ranges or an other unit),
+    and raises ValueError when the range can't be satisfied.
+    """
+    match = _range_re.match(range_header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range: the last bytes of the file
+        suffix_length = int(end)
+        if suffix_length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - suffix_length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact utf-8 json, with orjson when it's installed.
+
+    Pydantic models and enums can be nested anywhere in `content`.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """Json response that is not validated against the `response_model` of the route.
+
+    FastAPI returns Response instances as is, so an endpoint returning this
+    skips the second validation of its content, and the slower `jsonable_encoder`.
+    The `response_model` of the route is still used for the OpenAPI schema,
+    so the content must already be built from the response model.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FileRangeResponse(Response):
+    """Serve a file from disk, with support for single range requests.
+
+    When the ASGI server supports the 'http.response.zerocopysend' extension,
+    the file is sent using the file descriptor (sendfile), otherwise it is read
+    in chunks in a thread.
+
+    `file` is a path, or a binary file already opened by the caller. A path is
+    opened when the response is created, and only if it has a body (not for a 304).
+    Once opened, the file can still be read when it's replaced or removed
+    before the body is sent.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        file: Union[str, BinaryIO],
+        request_headers: Headers,
+        media_type: str = None,
+        etag: str = None,
+    ):
+        self.media_type = media_type
+        self.background = None
+        self.file = None
+        self.start, self.end = 0, -1
+
+        headers = {"accept-ranges": "bytes"}
+        if etag:
+            headers["etag"] = etag
+
+        if etag and request_headers.get("if-none-match") == etag:
+            self.status_code = 304
+            if not isinstance(file, str):
+                file.close()
+            self.init_headers(headers)
+            return
+
+        self.file = open(file, "rb") if isinstance(file, str) else file
+        size = os.fstat(self.file.fileno()).st_size
+        self.start, self.end = 0, size - 1
+        self.status_code = 200
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and if_range in (None, etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.status_code = 416
+                self.start, self.end = 0, -1
+                headers["content-range"] = f"bytes */{size}"
+            else:
+                if byte_range is not None:
+                    self.status_code = 206
+                    self.start, self.end = byte_range
+                    headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+
+        headers["content-length"] = str(self.end - self.start + 1)
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.file is None:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        with self.file as f:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+
+            count = self.end - self.start + 1
+            if count <= 0 or scope.get("method") == "HEAD":
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": f.fileno(),
+                        "offset": self.start,
+                        "count": count,
+                        "more_body": False,
+                    }
+                )
+                return
+
+            await run_in_threadpool(f.seek, self.start)
+            while count > 0:
+                chunk = await run_in_threadpool(f.read, min(self.chunk_size, count))
+                count -= len(chunk)
+                more_body = count > 0 and len(chunk) > 0
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": more_body,
+                    }
+                )
+                if not chunk:
+                    break
@@ -0,0 +1,40 @@
+"""Error reporting to sentry.
+
+`sentry_sdk` is only imported when a sentry url is configured, so that it stays out
+of the import graph of the api otherwise.
+"""
+from geoimagenet_api import config
+
+
+def init_sentry():
+    """Initialize sentry, if `sentry_url` is configured."""
+    settings = config.settings
+    if not settings.sentry_url:
+        return
+
+    import sentry_sdk
+
+    kwargs = {}
+    if settings.sentry_environment:
+        kwargs["environment"] = settings.sentry_environment
+    if settings.sentry_server_name:
+        kwargs["server_name"] = settings.sentry_server_name
+
+    sentry_sdk.init(dsn=settings.sentry_url, **kwargs)
+
+    with sentry_sdk.configure_scope() as scope:
+        scope.set_extra("config", dict(config.get_all_config()))
+
+
+def capture_exception(error=None):
+    if config.settings.sentry_url:
+        import sentry_sdk
+
+        sentry_sdk.capture_exception(error)
+
+
+def capture_message(message: str):
+    if config.settings.sentry_url:
+        import sentry_sdk
+
+        sentry_sdk.capture_message(message)
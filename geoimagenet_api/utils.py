@@ -1,6 +1,7 @@
 import enum
 import json
 import re
+import time
 from datetime import datetime
 from typing import List
 
@@ -8,10 +9,18 @@ import sqlalchemy.orm
 from starlette.requests import Request
 
 from geoimagenet_api.config import config
+from geoimagenet_api.metrics import (
+    GEOJSON_STREAM_BYTES,
+    GEOJSON_STREAM_DURATION,
+    GEOJSON_STREAM_ROWS,
+)
 
 
 def geojson_stream(
-    query: sqlalchemy.orm.Query, properties: List[str], with_geometry: bool = True
+    query: sqlalchemy.orm.Query,
+    properties: List[str],
+    with_geometry: bool = True,
+    id_prefix: str = "annotation",
 ):
     """Stream the geojson features from the database.
 
@@ -19,6 +28,8 @@ def geojson_stream(
     The bulk of the json serialization (the geometries) takes place in the database
     doing all the serialization in the database is a very small
     performance improvement and I prefer to build the json in python than in sql.
+
+    The feature ids are formatted as `{id_prefix}.{id}`.
     """
 
     feature_collection = {"type": "FeatureCollection"}
@@ -32,29 +43,38 @@ def geojson_stream(
     ending_brackets = feature_collection[-2:]
 
     yield before_ending_brackets
-    first_result = True
-    for r in query:
-        if not first_result:
-            yield ","
-        else:
-            first_result = False
-
-        data = {
-            "type": "Feature",
-            "id": f"annotation.{r.id}",
-            "properties": {p: _get_attr_str(r, p) for p in properties},
-        }
-
-        if with_geometry:
-            # geometry is already serialized
-            data["geometry"] = "__geometry"
-            data = json.dumps(data).replace('"__geometry"', r.geometry)
-        else:
-            data = json.dumps(data)
-
-        yield data
-
-    yield ending_brackets
+    rows, written = 0, len(before_ending_brackets)
+    start = time.perf_counter()
+    try:
+        for r in query:
+            if rows:
+                yield ","
+                written += 1
+
+            data = {
+                "type": "Feature",
+                "id": f"{id_prefix}.{r.id}",
+                "properties": {p: _get_attr_str(r, p) for p in properties},
+            }
+
+            if with_geometry:
+                # geometry is already serialized
+                data["geometry"] = "__geometry"
+                data = json.dumps(data).replace('"__geometry"', r.geometry)
+            else:
+                data = json.dumps(data)
+
+            yield data
+            rows += 1
+            written += len(data)
+
+        yield ending_brackets
+        written += len(ending_brackets)
+    finally:
+        # also recorded when the client disconnects before the end
+        GEOJSON_STREAM_ROWS.labels(id_prefix).inc(rows)
+        GEOJSON_STREAM_BYTES.labels(id_prefix).inc(written)
+        GEOJSON_STREAM_DURATION.labels(id_prefix).observe(time.perf_counter() - start)
 
 
 def _get_attr_str(object, name):
@@ -0,0 +1,19 @@
+# gunicorn configuration, used by the docker image
+from prometheus_client import multiprocess
+
+# the application is imported once, before the workers are forked
+preload_app = True
+
+
+def post_fork(server, worker):
+    # don't share the connections of the parent process, if any were opened
+    from geoimagenet_api.database.connection import connection_manager
+
+    connection_manager.engine.dispose()
+    if connection_manager.replica_engine is not None:
+        connection_manager.replica_engine.dispose()
+
+
+def child_exit(server, worker):
+    # the gauges of the exited worker are removed from the aggregated metrics
+    multiprocess.mark_process_dead(worker.pid)
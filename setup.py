@@ -69,6 +69,7 @@ setup(
         "console_scripts": [
             "migrate = geoimagenet_api.database.migrations:migrate",
             "geoserver_setup = geoimagenet_api.geoserver_setup.main:cli",
+            "annotation_counts = geoimagenet_api.database.annotation_counts:cli",
         ]
     },
 )
@@ -0,0 +1,127 @@
+"""
+Compare the annotation_log triggers on bulk operations:
+
+- row: the row level trigger, comparing the geometries with st_equals (migration 14)
+- row_bytea: the row level fallback for postgresql < 10 (migration 26)
+- statement: the statement level triggers using transition tables (migration 26)
+
+Each measure runs in a transaction that is rolled back, so any migrated database
+can be used, for example the one created by `tests.benchmarks.endpoints`::
+
+    GEOIMAGENET_API_POSTGIS_DB=geoimagenet_benchmark \\
+        python -m tests.benchmarks.annotation_log_triggers --annotations 50000
+"""
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import click
+
+import geoimagenet_api.database
+
+sys.path.append(
+    str(Path(geoimagenet_api.database.__file__).parent / "alembic" / "versions")
+)
+from d714ede8fd71_14_dont_log_geometry_updates import trigger_annotation_save
+import b5e8f2a4c913_26_statement_level_annotation_log as migration_26
+
+TRIGGERS = {
+    "row": trigger_annotation_save + migration_26.trigger_annotation_delete_row,
+    "row_bytea": migration_26.trigger_annotation_save_row
+    + migration_26.trigger_annotation_delete_row,
+    "statement": migration_26.trigger_annotation_log_statement,
+}
+
+DROP_TRIGGERS = """
+    DROP TRIGGER IF EXISTS log_annotation_action ON annotation;
+    DROP TRIGGER IF EXISTS log_annotation_action_delete ON annotation;
+    DROP TRIGGER IF EXISTS log_annotation_insert ON annotation;
+    DROP TRIGGER IF EXISTS log_annotation_update ON annotation;
+    DROP TRIGGER IF EXISTS log_annotation_delete ON annotation;
+"""
+
+# small squares on a line, in EPSG:3857
+INSERT_ANNOTATIONS = """
+    INSERT INTO annotation (annotator_id, geometry, taxonomy_class_id, status)
+    SELECT %(annotator_id)s,
+           ST_MakeEnvelope(i * 20, 0, i * 20 + 10, 10, 3857),
+           %(taxonomy_class_id)s,
+           'new'
+    FROM generate_series(1, %(n)s) AS i
+    RETURNING id;
+"""
+
+OPERATIONS = [
+    ("release", "UPDATE annotation SET status = 'released' WHERE id = ANY(%(ids)s);"),
+    ("validate", "UPDATE annotation SET status = 'validated' WHERE id = ANY(%(ids)s);"),
+    ("delete", "DELETE FROM annotation WHERE id = ANY(%(ids)s);"),
+]
+
+
+def _timed(cursor, sql, params):
+    start = time.perf_counter()
+    cursor.execute(sql, params)
+    return time.perf_counter() - start
+
+
+def measure(connection, triggers: str, n_annotations: int):
+    """Durations of the bulk insert, release, validate and delete of annotations."""
+    durations = {}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(DROP_TRIGGERS)
+            cursor.execute(triggers)
+
+            # the person ids are not always taken from the sequence
+            cursor.execute(
+                "INSERT INTO person (id, username, email) "
+                "SELECT coalesce(max(id), 0) + 1, 'log_benchmark', 'log_benchmark' "
+                "FROM person RETURNING id;"
+            )
+            params = {"annotator_id": cursor.fetchone()[0], "n": n_annotations}
+            cursor.execute("SELECT min(id) FROM taxonomy_class;")
+            params["taxonomy_class_id"] = cursor.fetchone()[0]
+
+            durations["insert"] = _timed(cursor, INSERT_ANNOTATIONS, params)
+            params["ids"] = [r[0] for r in cursor.fetchall()]
+
+            for name, sql in OPERATIONS:
+                durations[name] = _timed(cursor, sql, params)
+    finally:
+        connection.rollback()
+    return durations
+
+
+@click.command()
+@click.option("--annotations", default=50000, help="Number of annotations.")
+@click.option("--repeat", default=3, help="Number of measures of each variant.")
+@click.option(
+    "--triggers",
+    "variants",
+    multiple=True,
+    default=list(TRIGGERS),
+    type=click.Choice(list(TRIGGERS)),
+)
+def main(annotations, repeat, variants):
+    from geoimagenet_api.database.connection import connection_manager
+
+    connection = connection_manager.engine.raw_connection()
+    try:
+        for variant in variants:
+            measures = [
+                measure(connection, TRIGGERS[variant], annotations)
+                for _ in range(repeat)
+            ]
+            medians = {
+                name: statistics.median(m[name] for m in measures) * 1000
+                for name in measures[0]
+            }
+            timings = "  ".join(f"{k} {v:9.1f} ms" for k, v in medians.items())
+            click.echo(f"{variant:10} {timings}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
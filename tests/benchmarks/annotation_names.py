@@ -0,0 +1,100 @@
+"""
+Compare the ways of computing the annotation names on a bulk insert:
+
+- trigger: the annotation_name_on_insert trigger computes each name,
+  with a taxonomy_class lookup for each row
+- bulk: the names are computed in the insert of `post_annotations`,
+  and the trigger is skipped (migration 28)
+
+The values are inserted in pages, like in `post_annotations`. Each measure runs
+in a transaction that is rolled back, so any migrated database can be used::
+
+    GEOIMAGENET_API_POSTGIS_DB=geoimagenet_benchmark \\
+        python -m tests.benchmarks.annotation_names --annotations 50000
+"""
+
+import statistics
+import time
+
+import click
+import psycopg2.extras
+
+from geoimagenet_api.endpoints.annotations.annotations import (
+    BULK_ANNOTATION_NAMES_SETTING,
+    _bulk_insert_annotations,
+)
+
+TRIGGER_INSERT = """
+    INSERT INTO annotation
+    (annotator_id, geometry, taxonomy_class_id, status, review_requested, image_id)
+    SELECT annotator_id, geometry, taxonomy_class_id,
+           status::annotation_status_enum, review_requested, image_id
+    FROM (VALUES %s) AS v
+    (annotator_id, geometry, taxonomy_class_id, status, review_requested, image_id, sort_order)
+    ORDER BY sort_order
+    RETURNING id;
+"""
+
+# small squares on a line, in EPSG:3857
+TEMPLATE = (
+    "(%s, ST_MakeEnvelope(%s * 20, 0, %s * 20 + 10, 10, 3857), "
+    "%s, 'new', false, NULL::integer, %s)"
+)
+
+
+def measure(connection, variant: str, n_annotations: int, taxonomy_class_ids):
+    """Duration of the insert of `n_annotations` annotations."""
+    try:
+        with connection.cursor() as cursor:
+            # the person ids are not always taken from the sequence
+            cursor.execute(
+                "INSERT INTO person (id, username, email) "
+                "SELECT coalesce(max(id), 0) + 1, 'names_benchmark', 'names_benchmark' "
+                "FROM person RETURNING id;"
+            )
+            annotator_id = cursor.fetchone()[0]
+            values = (
+                (annotator_id, i, i, taxonomy_class_ids[i % len(taxonomy_class_ids)], i)
+                for i in range(n_annotations)
+            )
+
+            start = time.perf_counter()
+            if variant == "bulk":
+                cursor.execute(f"SET LOCAL {BULK_ANNOTATION_NAMES_SETTING} = on;")
+                sql = _bulk_insert_annotations
+            else:
+                sql = TRIGGER_INSERT
+            psycopg2.extras.execute_values(
+                cursor, sql, values, template=TEMPLATE, page_size=100, fetch=True
+            )
+            return time.perf_counter() - start
+    finally:
+        connection.rollback()
+
+
+@click.command()
+@click.option("--annotations", default=50000, help="Number of annotations.")
+@click.option("--repeat", default=3, help="Number of measures of each variant.")
+def main(annotations, repeat):
+    from geoimagenet_api.database.connection import connection_manager
+
+    connection = connection_manager.engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM taxonomy_class ORDER BY id;")
+            taxonomy_class_ids = [r[0] for r in cursor.fetchall()]
+        connection.rollback()
+
+        for variant in ("trigger", "bulk"):
+            durations = [
+                measure(connection, variant, annotations, taxonomy_class_ids)
+                for _ in range(repeat)
+            ]
+            median = statistics.median(durations) * 1000
+            click.echo(f"{variant:8} {median:9.1f} ms")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
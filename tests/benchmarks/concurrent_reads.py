@@ -0,0 +1,76 @@
+"""
+Measure the throughput of the read-only endpoints under concurrent requests.
+
+Start the api once with ``GEOIMAGENET_API_ASYNC_DATABASE=false`` and once with
+``GEOIMAGENET_API_ASYNC_DATABASE=true`` to compare the threadpool and asyncpg paths::
+
+    uvicorn geoimagenet_api:application --port 8080
+    python -m tests.benchmarks.concurrent_reads --url http://localhost:8080/api/v1
+"""
+
+import asyncio
+import statistics
+import time
+
+import click
+import httpx
+
+PATHS = [
+    "/annotations?with_geometry=false",
+    "/annotations/counts",
+    "/images",
+    "/taxonomy",
+]
+
+
+async def _run(client: httpx.AsyncClient, url: str, n_requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one_request():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            r = await client.get(url)
+            latencies.append(time.perf_counter() - start)
+            if r.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests_per_second": n_requests / elapsed,
+        "median_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+async def _main(base_url: str, n_requests: int, concurrency: int):
+    async with httpx.AsyncClient(timeout=60) as client:
+        for path in PATHS:
+            result = await _run(client, base_url + path, n_requests, concurrency)
+            click.echo(
+                f"{path:40} {result['requests_per_second']:8.1f} req/s  "
+                f"median {result['median_ms']:8.1f} ms  "
+                f"p95 {result['p95_ms']:8.1f} ms  "
+                f"errors {result['errors']}"
+            )
+
+
+@click.command()
+@click.option(
+    "--url", default="http://localhost:8080/api/v1", help="Base url of the api"
+)
+@click.option("-n", "--n-requests", default=500, help="Requests for each endpoint")
+@click.option("-c", "--concurrency", default=100, help="Concurrent requests")
+def cli(url, n_requests, concurrency):
+    asyncio.get_event_loop().run_until_complete(_main(url, n_requests, concurrency))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,405 @@
+"""
+Measure the latency and throughput of the main endpoints on a synthetic dataset.
+
+The dataset is written to a separate database (``geoimagenet_benchmark`` by default),
+which is recreated, migrated and seeded unless ``--skip-seed`` is given.
+The requests are made in-process, with magpie replaced by a fixed user::
+
+    python -m tests.benchmarks.endpoints --images 200 --annotations 100000 \\
+        --users 20 --output before.json
+    python -m tests.benchmarks.endpoints --skip-seed --output after.json \\
+        --compare before.json
+"""
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from copy import copy
+from datetime import datetime
+from typing import Callable, Dict, List
+from unittest import mock
+
+import click
+import psycopg2.extras
+
+# relative proportions of the annotation statuses in the generated dataset
+STATUS_WEIGHTS = {
+    "new": 10,
+    "pre_released": 5,
+    "released": 20,
+    "review": 5,
+    "validated": 50,
+    "rejected": 7,
+    "deleted": 3,
+}
+
+# size of the images in meters (EPSG:3857), they are placed on a grid
+IMAGE_SIZE = 5000
+GRID_ORIGIN = (-8200000, 5600000)
+
+
+def _image_origin(index: int, n_images: int):
+    columns = max(int(n_images ** 0.5), 1)
+    x = GRID_ORIGIN[0] + (index % columns) * IMAGE_SIZE
+    y = GRID_ORIGIN[1] + (index // columns) * IMAGE_SIZE
+    return x, y
+
+
+def _square_wkt(x, y, size) -> str:
+    corners = [(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)]
+    return "POLYGON((" + ", ".join(f"{a} {b}" for a, b in corners) + "))"
+
+
+def _random_polygon_geojson(image_index: int, n_images: int) -> Dict:
+    x, y = _image_origin(image_index, n_images)
+    size = random.uniform(5, 50)
+    x += random.uniform(0, IMAGE_SIZE - size)
+    y += random.uniform(0, IMAGE_SIZE - size)
+    corners = [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+    return {"type": "Polygon", "coordinates": [corners]}
+
+
+def _reset_database():
+    from sqlalchemy_utils import create_database, database_exists, drop_database
+
+    from geoimagenet_api.database import migrations
+    from geoimagenet_api.database.connection import connection_manager
+
+    db_url = connection_manager.engine.url
+    if database_exists(db_url):
+        drop_database(db_url)
+    create_database(db_url, template="template_postgis")
+
+    old_argv = copy(sys.argv)
+    sys.argv = [sys.argv[0], "upgrade", "head"]
+    migrations.migrate()
+    sys.argv = old_argv
+
+
+def _insert(cursor, table: str, fields: str, rows, template=None) -> List[int]:
+    result = psycopg2.extras.execute_values(
+        cursor,
+        f"INSERT INTO {table} ({fields}) VALUES %s RETURNING id;",
+        rows,
+        template=template,
+        page_size=1000,
+        fetch=True,
+    )
+    return [r[0] for r in result]
+
+
+def seed(n_images: int, n_annotations: int, n_users: int):
+    """Write `n_users` persons, `n_images` images and `n_annotations` annotations.
+
+    The annotations are spread randomly over the taxonomy classes, the images
+    and the users, with the status proportions of `STATUS_WEIGHTS`.
+    """
+    from geoimagenet_api.database.connection import connection_manager
+
+    connection = connection_manager.engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            _insert(
+                cursor,
+                "person",
+                "id, username, email",
+                [
+                    (n, f"user_{n}", f"user_{n}@example.com")
+                    for n in range(1, n_users + 1)
+                ],
+            )
+
+            images = []
+            for n in range(n_images):
+                x, y = _image_origin(n, n_images)
+                trace = "SRID=3857;" + _square_wkt(x, y, IMAGE_SIZE)
+                images.append(
+                    ("PLEIADES", "RGB", 8, f"image_{n}", ".tif", trace, trace)
+                )
+            image_ids = _insert(
+                cursor,
+                "image",
+                "sensor_name, bands, bits, filename, extension, trace, trace_simplified",
+                images,
+            )
+
+            cursor.execute("SELECT id FROM taxonomy_class;")
+            taxonomy_class_ids = [r[0] for r in cursor.fetchall()]
+
+            statuses = list(STATUS_WEIGHTS)
+            weights = list(STATUS_WEIGHTS.values())
+            annotations = []
+            for _ in range(n_annotations):
+                image_index = random.randrange(n_images)
+                geometry = _random_polygon_geojson(image_index, n_images)
+                annotations.append(
+                    (
+                        random.randint(1, n_users),
+                        json.dumps(geometry),
+                        random.choice(taxonomy_class_ids),
+                        random.choices(statuses, weights)[0],
+                        random.random() < 0.05,
+                        image_ids[image_index],
+                    )
+                )
+            _insert(
+                cursor,
+                "annotation",
+                "annotator_id, geometry, taxonomy_class_id, status, "
+                "review_requested, image_id",
+                annotations,
+                template="(%s, ST_SetSRID(ST_GeomFromGeoJSON(%s), 3857), "
+                "%s, %s, %s, %s)",
+            )
+            cursor.execute("ANALYZE;")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _summary(latencies: List[float], elapsed: float, items: int = None) -> Dict:
+    latencies = sorted(latencies)
+    result = {
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed,
+        "min_ms": latencies[0] * 1000,
+        "median_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+    if items is not None:
+        result["items_per_second"] = items / elapsed
+    return result
+
+
+def measure(request: Callable, repeat: int, items: int = None) -> Dict:
+    """Call `request` `repeat` times, it must return a response with a 2xx status."""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        request_start = time.perf_counter()
+        r = request()
+        latencies.append(time.perf_counter() - request_start)
+        if not 200 <= r.status_code < 300:
+            raise RuntimeError(f"{r.request.url} returned {r.status_code}: {r.text}")
+    elapsed = time.perf_counter() - start
+    return _summary(latencies, elapsed, items * repeat if items else None)
+
+
+@contextlib.contextmanager
+def logged_in_as(user_id: int):
+    """Replace the magpie requests by a fixed logged in user."""
+    from geoimagenet_api.endpoints import batches
+    from geoimagenet_api.endpoints.annotations import annotations, import_export, status
+
+    with contextlib.ExitStack() as stack:
+        for module in (annotations, status, import_export, batches):
+            if hasattr(module, "get_logged_user_id"):
+                patch = mock.patch.object(
+                    module, "get_logged_user_id", lambda *a, **k: user_id
+                )
+                stack.enter_context(patch)
+        yield
+
+
+def run_benchmarks(repeat: int, batch_sizes: List[int], n_images: int) -> Dict:
+    from starlette.testclient import TestClient
+
+    from geoimagenet_api import app
+    from geoimagenet_api.database.connection import connection_manager
+
+    client = TestClient(app)
+    results = {}
+
+    with connection_manager.get_db_session() as session:
+        image_name = session.execute(
+            "SELECT layer_name FROM image ORDER BY id LIMIT 1;"
+        ).scalar()
+        taxonomy_class_id = session.execute(
+            "SELECT id FROM taxonomy_class WHERE parent_id IS NULL LIMIT 1;"
+        ).scalar()
+        leaf_class_id = session.execute(
+            "SELECT id FROM taxonomy_class c WHERE NOT EXISTS "
+            "(SELECT 1 FROM taxonomy_class p WHERE p.parent_id = c.id) LIMIT 1;"
+        ).scalar()
+    # the image with the smallest id is the first one of the grid
+    image_index = 0
+
+    def features(n):
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": _random_polygon_geojson(image_index, n_images),
+                    "properties": {"taxonomy_class_id": leaf_class_id},
+                }
+                for _ in range(n)
+            ],
+        }
+
+    with logged_in_as(1):
+        for with_geometry in ("true", "false"):
+            results[f"annotations_get_geometry_{with_geometry}"] = measure(
+                lambda: client.get(
+                    "/annotations",
+                    params={"image_name": image_name, "with_geometry": with_geometry},
+                ),
+                repeat,
+            )
+
+        results["annotations_counts"] = measure(
+            lambda: client.get("/annotations/counts"), repeat
+        )
+        results["annotations_counts_by_image"] = measure(
+            lambda: client.get("/annotations/counts", params={"by_image": True}),
+            repeat,
+        )
+        results["annotations_counts_taxonomy_class"] = measure(
+            lambda: client.get(f"/annotations/counts/{taxonomy_class_id}"), repeat
+        )
+
+        for batch_size in batch_sizes:
+            body = features(batch_size)
+            posted_ids = []
+
+            def post():
+                r = client.post("/annotations", json=body)
+                posted_ids.extend(r.json() if r.status_code == 201 else [])
+                return r
+
+            results[f"annotations_post_{batch_size}"] = measure(
+                post, repeat, items=batch_size
+            )
+
+            # release the annotations that were just written, one batch at a time
+            batches = iter(
+                [
+                    posted_ids[n : n + batch_size]
+                    for n in range(0, len(posted_ids), batch_size)
+                ]
+            )
+            results[f"annotations_release_{batch_size}"] = measure(
+                lambda: client.post(
+                    "/annotations/release",
+                    json={"annotation_ids": [f"annotation.{i}" for i in next(batches)]},
+                ),
+                repeat,
+                items=batch_size,
+            )
+
+        results["batches_annotations"] = measure(
+            lambda: client.get("/batches/annotations"), repeat
+        )
+
+    return results
+
+
+def _environment() -> Dict:
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.node(),
+    }
+
+
+def _compare(results: Dict, baseline: Dict):
+    click.echo(f"{'':40} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name, result in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        ratio = result["median_ms"] / previous["median_ms"]
+        click.echo(
+            f"{name:40} {previous['median_ms']:10.1f}ms {result['median_ms']:10.1f}ms "
+            f"{ratio:8.2f}"
+        )
+
+
+@click.command()
+@click.option("--database", default="geoimagenet_benchmark", help="Database name")
+@click.option("--images", "n_images", default=100, help="Number of images")
+@click.option("--annotations", "n_annotations", default=50000, help="Annotations")
+@click.option("--users", "n_users", default=10, help="Number of users")
+@click.option("--repeat", default=20, help="Requests for each endpoint")
+@click.option(
+    "--batch-size",
+    "batch_sizes",
+    multiple=True,
+    type=int,
+    default=[1, 10, 100, 1000],
+    help="Number of features for each annotation post, can be repeated",
+)
+@click.option("--seed", "random_seed", default=0, help="Random seed of the dataset")
+@click.option("--skip-seed", is_flag=True, help="Reuse the existing dataset")
+@click.option("--output", type=click.Path(dir_okay=False), help="Write the json here")
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Print the median latencies compared to a previous json output",
+)
+def cli(
+    database,
+    n_images,
+    n_annotations,
+    n_users,
+    repeat,
+    batch_sizes,
+    random_seed,
+    skip_seed,
+    output,
+    compare,
+):
+    os.environ["GEOIMAGENET_API_POSTGIS_DB"] = database
+    from geoimagenet_api.database.connection import connection_manager
+
+    connection_manager.reload_config()
+    random.seed(random_seed)
+
+    parameters = {
+        "images": n_images,
+        "annotations": n_annotations,
+        "users": n_users,
+        "repeat": repeat,
+        "batch_sizes": list(batch_sizes),
+        "seed": random_seed,
+    }
+
+    if not skip_seed:
+        click.echo(f"Seeding {database}: {parameters}")
+        _reset_database()
+        start = time.perf_counter()
+        seed(n_images, n_annotations, n_users)
+        click.echo(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+    results = run_benchmarks(repeat, list(batch_sizes), n_images)
+    for name, result in results.items():
+        click.echo(
+            f"{name:40} {result['requests_per_second']:8.1f} req/s  "
+            f"median {result['median_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms"
+        )
+
+    data = {"parameters": parameters, "environment": _environment(), "results": results}
+    if output:
+        with open(output, "w") as f:
+            json.dump(data, f, indent=2)
+
+    if compare:
+        with open(compare) as f:
+            _compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,69 @@
+"""
+Measure the import time of the api, with `python -X importtime`.
+
+Prints the slowest modules, and exits with an error when the import of the
+application takes longer than the budget::
+
+    python -m tests.benchmarks.startup --budget 2.5
+"""
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+import click
+
+APPLICATION_MODULE = "geoimagenet_api.main"
+
+
+def import_times(module: str) -> Dict[str, Dict[str, float]]:
+    """Import `module` in a new interpreter, and return the self and cumulative
+    import times in seconds of every imported module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times[name.strip()] = {
+            "self": int(self_us) / 1e6,
+            "cumulative": int(cumulative_us) / 1e6,
+        }
+    return times
+
+
+def slowest(times: Dict[str, Dict[str, float]], n: int) -> List[str]:
+    return sorted(times, key=lambda name: times[name]["self"], reverse=True)[:n]
+
+
+@click.command()
+@click.option("--module", default=APPLICATION_MODULE, help="Module to import")
+@click.option("--repeat", default=5, help="Number of imports, the median is used")
+@click.option("--top", default=15, help="Number of slowest modules to print")
+@click.option("--budget", type=float, help="Maximum import time, in seconds")
+def cli(module, repeat, top, budget):
+    runs = [import_times(module) for _ in range(repeat)]
+    total = statistics.median(run[module]["cumulative"] for run in runs)
+
+    last = runs[-1]
+    click.echo(f"{'module':50} {'self':>10} {'cumulative':>12}")
+    for name in slowest(last, top):
+        click.echo(
+            f"{name:50} {last[name]['self'] * 1000:8.1f}ms "
+            f"{last[name]['cumulative'] * 1000:10.1f}ms"
+        )
+    click.echo(f"\n{module}: {total:.3f}s (median of {repeat})")
+
+    if budget is not None and total > budget:
+        click.echo(f"Over the budget of {budget:.3f}s", err=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,47 @@
+"""
+Compare the cost of building and compiling the hot annotation queries on every request
+with a lookup in the statement cache.
+
+No database connection is needed::
+
+    python -m tests.benchmarks.statement_cache --repeat 1000
+"""
+
+import time
+
+import click
+
+from geoimagenet_api.database.async_connection import CachedStatement, cached_statement
+from geoimagenet_api.endpoints.annotations.annotations import (
+    _annotations_query,
+    _taxonomy_counts_query,
+)
+
+QUERIES = {
+    "annotations": lambda: _annotations_query(True, ["taxonomy_class_id", "status"]),
+    "taxonomy_counts": lambda: _taxonomy_counts_query(
+        None, False, True, True, False, False
+    ),
+}
+
+
+def _time(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+@click.command()
+@click.option("--repeat", default=1000, help="Number of times each query is built.")
+def main(repeat):
+    for name, build in QUERIES.items():
+        uncached = _time(lambda: CachedStatement(build()), repeat)
+        cached = _time(lambda: cached_statement(("benchmark", name), build), repeat)
+        click.echo(
+            f"{name:20} build+compile {uncached:10.1f} us  cached {cached:8.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
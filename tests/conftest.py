@@ -13,6 +13,24 @@ from geoimagenet_api import app, application
 from geoimagenet_api.database.connection import connection_manager
 
 
+@pytest.fixture(autouse=True)
+def reload_config_on_setenv(monkeypatch):
+    """The configuration is a snapshot, read it again when the environment changes."""
+    from geoimagenet_api import config
+
+    def reloading(function):
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            config.reload()
+            return result
+
+        return wrapper
+
+    monkeypatch.setenv = reloading(monkeypatch.setenv)
+    monkeypatch.delenv = reloading(monkeypatch.delenv)
+    monkeypatch.undo = reloading(monkeypatch.undo)
+
+
 @pytest.fixture
 def noisy_sqlalchemy(request):
     os.environ["GEOIMAGENET_API_VERBOSE_SQLALCHEMY"] = "True"
@@ -1,68 +1,260 @@
-from locust import HttpLocust, TaskSet
+"""
+Load test scenarios, modeling the users of the platform.
 
+- annotators create, edit and release annotations
+- validators validate and reject annotations, by ids or by taxonomy class
+- map viewers poll the annotation listings and counts
+- ml exports download the validated annotations
 
-def index(l):
-    l.client.get("/")
+The authenticated routes need magpie, use the stub to run offline::
 
+    python -m tests.magpie_stub --port 2001
+    GEOIMAGENET_API_MAGPIE_URL=http://localhost:2001 \\
+        uvicorn geoimagenet_api:application --port 8080
+    locust -f tests/locustfile.py --host http://localhost:8080/api/v1
 
-def taxo(l):
-    l.client.get("/taxonomy/objets/1", verify=False)
+The database must contain at least one image (see `tests/benchmarks/endpoints.py`
+to generate a synthetic dataset).
+"""
+import itertools
+import random
 
+from locust import HttpUser, between, task
 
-def classes(l):
-    l.client.get("/taxonomy_classes/1", verify=False)
+from tests.magpie_stub import user_cookie
 
+# the users of each kind have distinct ids
+_annotator_ids = itertools.count(1)
+_validator_ids = itertools.count(10001)
 
-def classes_search(l):
-    l.client.get("/taxonomy_classes", params={"taxonomy_name": "Objets", "id": 1}, verify=False)
+# a large bounding box, in EPSG:3857
+WORLD_BBOX = "-20037508,-20037508,20037508,20037508"
 
 
-def classes_depth_0(l):
-    l.client.get("/taxonomy_classes/1", verify=False)
+def _image_features(client):
+    r = client.get(
+        "/images/search",
+        params={"bbox": WORLD_BBOX, "zoom": 10},
+        name="/images/search",
+    )
+    return r.json()["features"] if r.ok else []
 
 
-def add_annotation_geojson(l):
-    data = {
-        "type": "Feature",
-        "geometry": {
-            "type": "Polygon",
-            "coordinates": [
-                [
-                    [-13621076.051761277, 6281028.872735048],
-                    [-13621052.165189937, 6280804.33896446],
-                    [-13621076.051761277, 6281028.872735048],
-                ]
-            ],
-        },
-        "properties": {
-            "taxonomy_class_id": 8,
-            "annotator_id": 1,
-            "image_name": "My Image",
-        },
-    }
-    l.client.post("/annotations", json=data, verify=False)
+def _taxonomy_class_ids(client):
+    """All the taxonomy class ids of the latest versions of the taxonomies."""
+    ids = []
+    for taxonomy in client.get("/taxonomy").json():
+        root_id = taxonomy["versions"][-1]["root_taxonomy_class_id"]
+        tree = client.get(
+            f"/taxonomy_classes/{root_id}", name="/taxonomy_classes/{id}"
+        ).json()
 
+        stack = [tree]
+        while stack:
+            taxonomy_class = stack.pop()
+            ids.append(taxonomy_class["id"])
+            stack.extend(taxonomy_class.get("children") or [])
+    return ids
+
+
+def _polygon_inside(image_feature, size=20.0):
+    """A small random square inside the bounding box of an image trace."""
+    coordinates = image_feature["geometry"]["coordinates"][0]
+    xs = [c[0] for c in coordinates]
+    ys = [c[1] for c in coordinates]
+    # stay near the center, the traces are not always rectangles
+    cx = (min(xs) + max(xs)) / 2 + random.uniform(-1, 1) * (max(xs) - min(xs)) / 8
+    cy = (min(ys) + max(ys)) / 2 + random.uniform(-1, 1) * (max(ys) - min(ys)) / 8
+    corners = [
+        [cx, cy],
+        [cx + size, cy],
+        [cx + size, cy + size],
+        [cx, cy + size],
+        [cx, cy],
+    ]
+    return {"type": "Polygon", "coordinates": [corners]}
+
+
+class Annotator(HttpUser):
+    """Draws annotations on an image, corrects some of them and releases them."""
+
+    weight = 5
+    wait_time = between(2, 10)
+
+    def on_start(self):
+        self.user_id = next(_annotator_ids)
+        self.client.cookies.update(user_cookie(self.user_id))
+        self.images = _image_features(self.client)
+        self.taxonomy_class_ids = _taxonomy_class_ids(self.client)
+        self.new_annotation_ids = []
+
+    def _feature(self, image):
+        return {
+            "type": "Feature",
+            "geometry": _polygon_inside(image),
+            "properties": {
+                "taxonomy_class_id": random.choice(self.taxonomy_class_ids),
+                "image_id": image["properties"]["id"],
+            },
+        }
+
+    @task(10)
+    def create(self):
+        if not self.images:
+            return
+        image = random.choice(self.images)
+        n_features = random.choice([1, 1, 1, 2, 5])
+        body = {
+            "type": "FeatureCollection",
+            "features": [self._feature(image) for _ in range(n_features)],
+        }
+        r = self.client.post("/annotations", json=body)
+        if r.status_code == 201:
+            self.new_annotation_ids.extend(r.json())
+
+    @task(3)
+    def edit(self):
+        if not self.new_annotation_ids or not self.images:
+            return
+        feature = self._feature(random.choice(self.images))
+        feature["id"] = f"annotation.{random.choice(self.new_annotation_ids)}"
+        self.client.put("/annotations", json=feature)
+
+    @task(2)
+    def release(self):
+        if not self.new_annotation_ids:
+            return
+        ids, self.new_annotation_ids = self.new_annotation_ids, []
+        self.client.post(
+            "/annotations/release",
+            json={"annotation_ids": [f"annotation.{i}" for i in ids]},
+        )
+
+    @task(5)
+    def view_own_annotations(self):
+        if not self.images:
+            return
+        image = random.choice(self.images)
+        self.client.get(
+            "/annotations",
+            params={
+                "image_name": image["properties"]["layer_name"],
+                "current_user_only": True,
+            },
+            name="/annotations?current_user_only",
+        )
+
+
+class Validator(HttpUser):
+    """Reviews the released annotations, by ids or a whole taxonomy class at once."""
+
+    weight = 2
+    wait_time = between(2, 10)
+
+    def on_start(self):
+        self.user_id = next(_validator_ids)
+        self.client.cookies.update(user_cookie(self.user_id))
+        self.taxonomy_class_ids = _taxonomy_class_ids(self.client)
+
+    def _released_ids(self, limit=20):
+        r = self.client.get(
+            "/annotations",
+            params={"status": "released", "with_geometry": False},
+            name="/annotations?status=released",
+        )
+        if not r.ok:
+            return []
+        features = r.json()["features"]
+        return [f["id"] for f in random.sample(features, min(limit, len(features)))]
+
+    @task(10)
+    def validate_by_ids(self):
+        ids = self._released_ids()
+        if ids:
+            self.client.post("/annotations/validate", json={"annotation_ids": ids})
+
+    @task(3)
+    def reject_by_ids(self):
+        ids = self._released_ids(limit=5)
+        if ids:
+            self.client.post("/annotations/reject", json={"annotation_ids": ids})
+
+    @task(1)
+    def validate_by_taxonomy_class(self):
+        body = {
+            "taxonomy_class_id": random.choice(self.taxonomy_class_ids),
+            "with_taxonomy_children": False,
+        }
+        self.client.post("/annotations/validate", json=body)
+
+    @task(5)
+    def counts(self):
+        self.client.get("/annotations/counts")
+
+
+class MapViewer(HttpUser):
+    """Browses the map, polling the annotations of the visible images and the counts."""
+
+    weight = 10
+    wait_time = between(1, 5)
+
+    def on_start(self):
+        self.images = _image_features(self.client)
+        self.taxonomy_class_ids = _taxonomy_class_ids(self.client)
+
+    @task(10)
+    def annotations_of_image(self):
+        if not self.images:
+            return
+        image = random.choice(self.images)
+        self.client.get(
+            "/annotations",
+            params={"image_name": image["properties"]["layer_name"]},
+            name="/annotations?image_name",
+        )
+
+    @task(5)
+    def counts(self):
+        self.client.get(
+            "/annotations/counts", params={"by_image": random.random() < 0.3}
+        )
+
+    @task(3)
+    def counts_taxonomy_class(self):
+        taxonomy_class_id = random.choice(self.taxonomy_class_ids)
+        self.client.get(
+            f"/annotations/counts/{taxonomy_class_id}",
+            name="/annotations/counts/{id}",
+        )
+
+    @task(2)
+    def search_images(self):
+        self.client.get(
+            "/images/search",
+            params={"bbox": WORLD_BBOX, "zoom": random.randint(2, 12)},
+            name="/images/search",
+        )
+
+    @task(1)
+    def taxonomy(self):
+        self.client.get("/taxonomy")
 
-def add_annotation_xml(l):
-    data = '<Transaction xmlns="http://www.opengis.net/wfs" service="WFS" version="1.1.0" xsi:schemaLocation="http://www.opengis.net/wfs http://schemas.opengis.net/wfs/1.1.0/wfs.xsd" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><Insert><annotation xmlns="geoimagenet"><geometry><Polygon xmlns="http://www.opengis.net/gml" srsName="EPSG:3857"><exterior><LinearRing srsName="EPSG:3857"><posList srsDimension="2">-13624202.803949567 6279980.252253259 -13624432.115034422 6279330.537512835 -13623725.072522784 6279483.411569405 -13624202.803949567 6279980.252253259</posList></LinearRing></exterior></Polygon></geometry><taxonomy_class_id>8</taxonomy_class_id><annotator_id>1</annotator_id><image_name>My Image</image_name></annotation></Insert></Transaction>'
-    l.client.post(
-        "/geoserver/wfs", data=data, headers={"Content-Type": "text/xml"}, verify=False
-    )
 
+class MLExport(HttpUser):
+    """The machine learning service, downloading the validated annotations."""
 
-class UserBehavior(TaskSet):
-    tasks = {
-        taxo: 1,
-        # add_annotation_geojson: 1,
-        # add_annotation_xml: 1,
-        # taxo: 1,
-        # classes: 1,
-        # classes_search: 1,
-        # classes_depth_0: 1
-    }
+    weight = 1
+    wait_time = between(30, 120)
 
+    def on_start(self):
+        self.etag = None
 
-class WebsiteUser(HttpLocust):
-    task_set = UserBehavior
-    min_wait = 700
-    max_wait = 1300
+    @task
+    def export(self):
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        with self.client.get(
+            "/batches/annotations", headers=headers, catch_response=True
+        ) as r:
+            if r.status_code in (200, 304):
+                self.etag = r.headers.get("etag", self.etag)
+                r.success()
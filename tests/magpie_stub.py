@@ -0,0 +1,77 @@
+"""
+Stand-in for magpie, to load test the authenticated routes without a magpie instance.
+
+The logged in user is read from the `auth_tkt` cookie, formatted as `user_<id>`.
+Requests without this cookie are anonymous. Start the stub, and point the api to it::
+
+    python -m tests.magpie_stub --port 2001
+    GEOIMAGENET_API_MAGPIE_URL=http://localhost:2001 uvicorn geoimagenet_api:application
+"""
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+
+COOKIE_NAME = "auth_tkt"
+
+_user_cookie = re.compile(COOKIE_NAME + r"=user_(\d+)")
+
+
+def user_cookie(user_id: int) -> dict:
+    """The cookies identifying `user_id` to the stub."""
+    return {COOKIE_NAME: f"user_{user_id}"}
+
+
+class MagpieStub(BaseHTTPRequestHandler):
+    """Answers `GET .../users/current` like magpie, after `latency` seconds."""
+
+    latency = 0.0
+
+    def do_GET(self):
+        if not self.path.rstrip("/").endswith("/users/current"):
+            self.send_error(404)
+            return
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        match = _user_cookie.search(self.headers.get("Cookie", ""))
+        if match:
+            user_id = int(match.group(1))
+            user = {
+                "user_id": user_id,
+                "user_name": f"user_{user_id}",
+                "email": f"user_{user_id}@example.com",
+            }
+        else:
+            user = {"user_name": "anonymous", "email": ""}
+
+        body = json.dumps({"user": user}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", default=2001)
+@click.option("--latency", default=0.0, help="Seconds to wait before each response")
+def cli(host, port, latency):
+    MagpieStub.latency = latency
+    server = ThreadingHTTPServer((host, port), MagpieStub)
+    click.echo(f"Magpie stub listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    cli()
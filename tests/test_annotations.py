@@ -1,15 +1,23 @@
 import contextlib
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
 from typing import Optional
 
 import pytest
 from geoalchemy2 import functions
 from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Query
 
 import geoimagenet_api
+from geoimagenet_api.config import config
+from geoimagenet_api.database.annotation_counts import (
+    annotation_count_differences,
+    rebuild_annotation_counts,
+)
 from geoimagenet_api.database.connection import connection_manager
 from geoimagenet_api.database.models import (
     Annotation,
+    AnnotationCount,
     AnnotationLog,
     AnnotationLogOperation,
     AnnotationStatus,
@@ -18,7 +26,15 @@ from geoimagenet_api.database.models import (
     ValidationEvent,
     ValidationValue,
 )
-from geoimagenet_api.openapi_schemas import AnnotationProperties
+from geoimagenet_api.endpoints.annotations.annotations import (
+    _annotation_counts_source,
+    _estimate_sampled_counts,
+    _naive_utc,
+)
+from geoimagenet_api.openapi_schemas import (
+    AnnotationProperties,
+    AnnotationCountByStatus,
+)
 
 test_bbox_4326_wkt = "SRID=4326;POLYGON ((-73 44, -72 44, -72 45, -73 45, -73 44))"
 test_bbox_4326_coords = [[-73, 44], [-72, 44], [-72, 45], [-73, 45], [-73, 44]]
@@ -361,6 +377,64 @@ def test_log_delete_annotation():
         )
 
 
+def test_annotation_log_bulk_update():
+    with _clean_annotation_session() as session:
+        ids = [write_annotation(session=session, user_id=1).id for _ in range(3)]
+        session.query(AnnotationLog).delete()
+        session.commit()
+
+        annotations = session.query(Annotation).filter(Annotation.id.in_(ids))
+        annotations.update(
+            {Annotation.status: AnnotationStatus.released}, synchronize_session=False
+        )
+        session.commit()
+        # only the geometries changed, nothing is logged
+        annotations.update(
+            {Annotation.geometry: func.ST_Translate(Annotation.geometry, 1, 1)},
+            synchronize_session=False,
+        )
+        session.commit()
+
+        logs = session.query(AnnotationLog).order_by(AnnotationLog.id).all()
+        assert [log.annotation_id for log in logs] == sorted(ids)
+        for log in logs:
+            assert_log_equals(
+                log, status=AnnotationStatus.released, annotation_id=log.annotation_id
+            )
+
+
+def test_annotation_updated_at_trigger():
+    with _clean_annotation_session() as session:
+        annotation = write_annotation(session=session, user_id=1)
+        annotations = session.query(Annotation).filter_by(id=annotation.id)
+
+        def updated_at():
+            return annotations.with_entities(Annotation.updated_at).scalar()
+
+        created_at = updated_at()
+
+        # an update that doesn't change anything keeps updated_at
+        annotations.update(
+            {Annotation.status: Annotation.status}, synchronize_session=False
+        )
+        session.commit()
+        assert updated_at() == created_at
+
+        annotations.update(
+            {Annotation.geometry: func.ST_Translate(Annotation.geometry, 1, 1)},
+            synchronize_session=False,
+        )
+        session.commit()
+        geometry_updated_at = updated_at()
+        assert geometry_updated_at > created_at
+
+        annotations.update(
+            {Annotation.status: AnnotationStatus.released}, synchronize_session=False
+        )
+        session.commit()
+        assert updated_at() > geometry_updated_at
+
+
 def test_annotations_put_not_found(client, geojson_geometry_3857):
     geojson_geometry_3857["id"] = "annotation.1234567"
     r = client.put(f"/annotations", json=geojson_geometry_3857)
@@ -571,6 +645,44 @@ def test_annotation_post(client, any_geojson_3857):
         assert session.query(Annotation.id).filter_by(id=written_ids[0]).one()
 
 
+def test_annotation_post_names(client, any_geojson_3857):
+    """The names computed on insert are the same as on update."""
+    r = client.post(f"/annotations", json=any_geojson_3857)
+    written_ids = r.json()
+    assert r.status_code == 201
+    with connection_manager.get_db_session() as session:
+        annotations = session.query(Annotation).filter(Annotation.id.in_(written_ids))
+        names = dict(annotations.with_entities(Annotation.id, Annotation.name))
+
+        # the annotation_name_on_update trigger computes the names again
+        annotations.update(
+            {Annotation.taxonomy_class_id: Annotation.taxonomy_class_id},
+            synchronize_session=False,
+        )
+        session.commit()
+        assert dict(annotations.with_entities(Annotation.id, Annotation.name)) == names
+        code = session.query(TaxonomyClass.code).filter_by(id=1).scalar()
+        assert all(name.startswith(code + "_") for name in names.values())
+
+
+def test_annotation_name_given_on_insert():
+    """A name given on insert is replaced by the computed name."""
+    with _clean_annotation_session() as session:
+        annotation = Annotation(
+            annotator_id=1,
+            geometry=f"SRID=3857;{wkt_string_3857['Polygon']}",
+            taxonomy_class_id=2,
+            name="some_other_name",
+        )
+        session.add(annotation)
+        session.commit()
+
+        code = session.query(TaxonomyClass.code).filter_by(id=2).scalar()
+        name = session.query(Annotation.name).filter_by(id=annotation.id).scalar()
+        assert name != "some_other_name"
+        assert name.startswith(code + "_")
+
+
 def test_annotation_count(client):
     """
     Taxonomy classes tree:
@@ -702,6 +814,34 @@ def test_annotation_get_last_updated(client):
         assert len(annotations) == 2
 
 
+def test_naive_utc():
+    naive = datetime(2020, 8, 20, 12, 30)
+    assert _naive_utc(naive) is naive
+
+    eastern = timezone(timedelta(hours=-4))
+    aware = datetime(2020, 8, 20, 8, 30, tzinfo=eastern)
+    assert _naive_utc(aware) == datetime(2020, 8, 20, 12, 30)
+    assert _naive_utc(aware).tzinfo is None
+
+
+def test_annotation_get_last_updated_time_zone(client):
+    with _clean_annotation_session() as session:
+        annotation_1 = write_annotation(session=session)
+        annotation_2 = write_annotation(session=session)
+        time_between = annotation_1.updated_at + timedelta(milliseconds=1)
+        # the same instant, in an other time zone
+        eastern = timezone(timedelta(hours=-4))
+        time_between = time_between.replace(tzinfo=timezone.utc).astimezone(eastern)
+
+        params = {"last_updated_since": time_between.isoformat()}
+        annotations = _get_annotations(client, params)
+        assert [a["id"] for a in annotations] == [f"annotation.{annotation_2.id}"]
+
+        params = {"last_updated_before": time_between.isoformat()}
+        annotations = _get_annotations(client, params)
+        assert [a["id"] for a in annotations] == [f"annotation.{annotation_1.id}"]
+
+
 def test_annotation_get_username_not_found(client, simple_annotation_user_2):
     params = {"annotator_id": 999}
     r = client.get(f"/annotations", params=params)
@@ -936,6 +1076,152 @@ def test_annotation_counts_review_requested(client):
         assert_count(2, review_requested=None, expected=3)
 
 
+def test_annotation_taxonomy_counts(client):
+    """
+    Taxonomy classes tree:
+    1
+    --2
+      --3
+    --9
+
+    """
+    with _clean_annotation_session() as session:
+        taxonomy_id = session.query(TaxonomyClass.taxonomy_id).filter_by(id=1).scalar()
+        write_annotation(session=session, taxonomy_class=3, status="released")
+        write_annotation(session=session, taxonomy_class=3, image_id=2, user_id=2)
+        write_annotation(session=session, taxonomy_class=2, status="validated")
+        write_annotation(session=session, taxonomy_class=9, image_id=None)
+
+        params = {"taxonomy_id": taxonomy_id, "by_image": True, "by_annotator": True}
+        r = client.get("/annotations/counts", params=params)
+        assert r.status_code == 200
+        counts = r.json()
+
+        assert counts["1"]["total"]["released"] == 1
+        assert counts["1"]["total"]["validated"] == 1
+        assert counts["1"]["total"]["new"] == 2
+        assert counts["2"]["total"]["new"] == 1
+        assert counts["3"]["total"]["released"] == 1
+        assert counts["9"]["total"]["new"] == 1
+
+        assert counts["1"]["by_image"]["PLEIADES_RGB:test_image"]["released"] == 1
+        assert counts["1"]["by_image"]["PLEIADES_RGB:test_image2"]["new"] == 1
+        assert counts["9"]["by_image"] == {}
+        assert counts["1"]["by_annotator"]["1"]["new"] == 1
+        assert counts["1"]["by_annotator"]["2"]["new"] == 1
+
+        # classes without annotations are returned
+        empty_classes = [c for c in counts.values() if not any(c["total"].values())]
+        assert empty_classes
+        assert all(key.isdigit() for key in counts)
+
+
+def test_annotation_taxonomy_counts_not_found(client):
+    r = client.get("/annotations/counts", params={"taxonomy_id": 123456})
+    assert r.status_code == 404
+
+
+def test_annotation_counts_approximate(client):
+    with _clean_annotation_session() as session:
+        write_annotation(session=session, taxonomy_class=3, status="released")
+        write_annotation(session=session, taxonomy_class=2)
+
+        # the test table is smaller than the sample size, the counts are exact
+        params = {"approximate": True}
+        r = client.get("/annotations/counts/1", params=params)
+        assert r.status_code == 200
+        assert r.headers["X-Counts-Sample-Percent"] == "100"
+        assert r.headers["X-Counts-Error-Margin"] == "0"
+        assert r.json()["1"]["released"] == 1
+        assert r.json()["1"]["new"] == 1
+
+        r = client.get("/annotations/counts", params=params)
+        assert r.status_code == 200
+        assert r.headers["X-Counts-Sample-Percent"] == "100"
+        assert r.json()["2"]["total"]["released"] == 1
+
+
+def test_annotation_counts_source(monkeypatch):
+    monkeypatch.setattr(config.settings, "approximate_counts_sample_rows", 100)
+
+    assert _annotation_counts_source(1000, approximate=False) == (AnnotationCount, 1)
+    assert _annotation_counts_source(50, approximate=True) == (AnnotationCount, 1)
+
+    source, fraction = _annotation_counts_source(1000, approximate=True)
+    assert fraction == 0.1
+    statement = Query(func.sum(source.annotation_count)).statement
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    # pages of the rollup table are sampled, see _estimate_sampled_counts
+    assert "annotation_count TABLESAMPLE system(" in sql
+
+
+def test_estimate_sampled_counts():
+    counts = AnnotationCountByStatus(new=10, released=0)
+    squares = AnnotationCountByStatus(new=40, released=0)
+    margin = _estimate_sampled_counts([(counts, squares)], fraction=0.1)
+
+    assert counts.new == 100
+    assert counts.released == 0
+    assert round(margin) == round(1.96 * (40 * 0.9) ** 0.5 / 0.1)
+
+
+def test_estimate_sampled_counts_rule_of_three():
+    counts = AnnotationCountByStatus()
+    margin = _estimate_sampled_counts([(counts, AnnotationCountByStatus())], 0.1)
+
+    # nothing sampled: the count is 0, but could be up to 3 / fraction
+    assert counts.new == 0
+    assert margin == 3 / 0.1
+
+
+def test_annotation_count_table_consistency():
+    with _clean_annotation_session() as session:
+        for taxonomy_class_id in (2, 2, 3, 9):
+            write_annotation(session=session, taxonomy_class=taxonomy_class_id)
+        write_annotation(session=session, taxonomy_class=3, image_id=None)
+
+        session.query(Annotation).filter_by(taxonomy_class_id=2).update(
+            {Annotation.status: AnnotationStatus.released}, synchronize_session=False
+        )
+        session.query(Annotation).filter_by(taxonomy_class_id=9).update(
+            {Annotation.taxonomy_class_id: 3, Annotation.review_requested: True},
+            synchronize_session=False,
+        )
+        session.query(Annotation).filter_by(image_id=None).delete()
+        session.commit()
+
+        assert annotation_count_differences(session) == []
+
+        stored = session.query(
+            AnnotationCount.taxonomy_class_id,
+            AnnotationCount.status,
+            AnnotationCount.review_requested,
+            AnnotationCount.annotation_count,
+        ).all()
+        assert sorted(stored) == sorted(
+            [
+                (2, AnnotationStatus.released, False, 2),
+                (3, AnnotationStatus.new, False, 1),
+                (3, AnnotationStatus.new, True, 1),
+            ]
+        )
+
+
+def test_annotation_count_table_rebuild():
+    with _clean_annotation_session() as session:
+        write_annotation(session=session, taxonomy_class=2)
+        write_annotation(session=session, taxonomy_class=3)
+
+        session.query(AnnotationCount).update(
+            {AnnotationCount.annotation_count: 10}, synchronize_session=False
+        )
+        session.commit()
+        assert len(annotation_count_differences(session)) == 2
+
+        rebuild_annotation_counts(session)
+        assert annotation_count_differences(session) == []
+
+
 def test_friendly_name():
     with connection_manager.get_db_session() as session:
         geometry = "SRID=4326;POLYGON((-71 39,-71 41,-69 41,-69 39,-71 39))"
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Query
+
+from geoimagenet_api.database.async_connection import (
+    Row,
+    compile_statement,
+    cached_statement,
+    close_pool,
+    fetch_all,
+    _get_pool,
+)
+from geoimagenet_api.database.models import Annotation, AnnotationStatus, Image
+
+
+@pytest.fixture(params=[False, True], ids=["threadpool", "asyncpg"])
+def async_database(request, monkeypatch):
+    monkeypatch.setenv("GEOIMAGENET_API_ASYNC_DATABASE", str(request.param).lower())
+    return request.param
+
+
+def test_compile_statement():
+    query = Query(Annotation.id).filter(
+        Annotation.status == AnnotationStatus.validated,
+        Annotation.taxonomy_class_id.in_([1, 2]),
+    )
+    sql, args = compile_statement(query)
+
+    assert "$1" in sql and "$3" in sql
+    assert ":1" not in sql
+    # the enum bind processor is applied
+    assert args == ["validated", 1, 2]
+
+
+def test_cached_statement(async_database):
+    built = []
+
+    def build():
+        built.append(1)
+        return Query(Image.id).filter(Image.bits == bindparam("bits"))
+
+    statement = cached_statement("test_cached_statement", build)
+    assert cached_statement("test_cached_statement", build) is statement
+    assert len(built) == 1
+
+    assert statement.args({"bits": 8}) == [8]
+
+    loop = asyncio.new_event_loop()
+    try:
+        rows_8 = loop.run_until_complete(fetch_all(statement, {"bits": 8}))
+        rows_16 = loop.run_until_complete(fetch_all(statement, {"bits": 16}))
+    finally:
+        loop.close()
+    assert not set(r.id for r in rows_8) & set(r.id for r in rows_16)
+
+
+def test_get_pool_concurrent():
+    async def get_pools():
+        try:
+            return await asyncio.gather(*[_get_pool() for _ in range(5)])
+        finally:
+            await close_pool()
+
+    loop = asyncio.new_event_loop()
+    try:
+        pools = loop.run_until_complete(get_pools())
+    finally:
+        loop.close()
+
+    assert all(pool is pools[0] for pool in pools)
+
+
+def test_row():
+    class Record(dict):
+        pass
+
+    row = Row(Record(id=1, name="a"))
+    id_, name = row
+    assert (id_, name) == (1, "a")
+    assert row.name == "a"
+    with pytest.raises(AttributeError):
+        row.something
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/images",
+        "/taxonomy",
+        "/taxonomy_classes",
+        "/taxonomy_classes/1",
+        "/annotations",
+        "/annotations/counts",
+        "/annotations/counts/1",
+    ],
+)
+def test_read_endpoints_same_response(client, async_database, monkeypatch, path):
+    r = client.get(path)
+    assert r.status_code == 200
+
+    monkeypatch.setenv(
+        "GEOIMAGENET_API_ASYNC_DATABASE", str(not async_database).lower()
+    )
+    assert client.get(path).json() == r.json()
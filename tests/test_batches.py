@@ -1,13 +1,17 @@
+import asyncio
 import datetime
 import json
 import random
-from unittest import mock
-import pytest
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
-import requests
+import pytest
+from starlette.datastructures import Headers
 
 from geoimagenet_api.database.connection import connection_manager
 from geoimagenet_api.database.models import Annotation, AnnotationStatus
+from geoimagenet_api.endpoints.batches import _export_snapshot_key, _write_snapshot
+from geoimagenet_api.responses import FileRangeResponse, parse_range
 from .test_annotations import write_annotation, _clean_annotation_session
 from .test_images import pleiades_images
 
@@ -42,6 +46,143 @@ def test_get_annotations(client):
         assert image_names == [None, None, None]
 
 
+def test_get_annotations_snapshot(client):
+    with _clean_annotation_session() as session:
+        # ----- given
+        write_annotation(session=session, status=AnnotationStatus.validated)
+        r = client.get("/batches/annotations")
+        etag = r.headers["ETag"]
+        content = r.content
+
+        # ----- when
+        r = client.get("/batches/annotations", headers={"If-None-Match": etag})
+
+        # ----- then
+        assert r.status_code == 304
+
+        # ----- when
+        r = client.get("/batches/annotations", headers={"Range": "bytes=10-19"})
+
+        # ----- then
+        assert r.status_code == 206
+        assert r.content == content[10:20]
+        assert r.headers["Content-Range"] == f"bytes 10-19/{len(content)}"
+
+        # ----- when
+        r = client.get("/batches/annotations", headers={"Range": "bytes=-5"})
+
+        # ----- then
+        assert r.content == content[-5:]
+
+        # ----- when
+        headers = {"Range": f"bytes={len(content)}-"}
+        r = client.get("/batches/annotations", headers=headers)
+
+        # ----- then
+        assert r.status_code == 416
+
+        # ----- when
+        write_annotation(session=session, status=AnnotationStatus.validated)
+        r = client.get("/batches/annotations", headers={"If-None-Match": etag})
+
+        # ----- then
+        assert r.status_code == 200
+        assert r.headers["ETag"] != etag
+        assert len(r.json()["features"]) == 2
+
+
+def test_export_snapshot_key():
+    with _clean_annotation_session() as session:
+        key = _export_snapshot_key(session)
+
+        # annotations that are not validated are not exported
+        a = write_annotation(session=session, status=AnnotationStatus.new)
+        assert _export_snapshot_key(session) == key
+
+        session.query(Annotation).filter_by(id=a.id).update(
+            {Annotation.status: AnnotationStatus.validated}, synchronize_session=False
+        )
+        session.commit()
+        assert _export_snapshot_key(session) != key
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=900-2000", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=0-1,5-6", 1000) is None
+    assert parse_range("items=0-1", 1000) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=1000-", 1000)
+    with pytest.raises(ValueError):
+        parse_range("bytes=10-5", 1000)
+
+
+def test_file_range_response_snapshot_rewrite(tmp_path):
+    # ----- given
+    content = b"0123456789" * 20000
+    path = tmp_path / "annotations_old.json"
+    path.write_bytes(content)
+    response = FileRangeResponse(str(path), Headers({}), media_type="application/json")
+
+    messages = []
+
+    async def receive():  # pragma: no cover
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+        if message["type"] == "http.response.start":
+            # a concurrent export writes a new snapshot, removing the old one
+            _write_snapshot(tmp_path / "annotations_new.json", iter(["[]"])).close()
+
+    # ----- when
+    loop = asyncio.new_event_loop()
+    try:
+        scope = {"type": "http", "method": "GET"}
+        loop.run_until_complete(response(scope, receive, send))
+    finally:
+        loop.close()
+
+    # ----- then
+    assert not path.exists()
+    assert messages[0]["status"] == 200
+    body_messages = messages[1:]
+    assert len(body_messages) > 1
+    assert b"".join(m["body"] for m in body_messages) == content
+    assert response.file.closed
+
+
+def test_file_range_response_not_modified(tmp_path):
+    path = tmp_path / "annotations_missing.json"
+    headers = Headers({"if-none-match": '"abc"'})
+
+    # the file is not opened for a 304 response
+    response = FileRangeResponse(str(path), headers, etag='"abc"')
+
+    assert response.status_code == 304
+    assert response.file is None
+    assert "content-length" not in response.headers
+
+
+def test_write_snapshot_removed_before_read(tmp_path):
+    # ----- given
+    path = tmp_path / "annotations_old.json"
+
+    # ----- when
+    snapshot = _write_snapshot(path, iter(["[1, ", "2]"]))
+    # a concurrent export writes a new snapshot, removing this one
+    _write_snapshot(tmp_path / "annotations_new.json", iter(["[]"])).close()
+
+    # ----- then
+    assert not path.exists()
+    response = FileRangeResponse(snapshot, Headers({}), etag='"old"')
+    assert response.headers["content-length"] == "6"
+    with response.file as f:
+        assert f.read() == b"[1, 2]"
+
+
 def test_get_annotation_images_16_bits(client, pleiades_images):
     with _clean_annotation_session() as session:
         # ----- given
@@ -103,49 +244,125 @@ def test_get_annotations_load_testing(client):
         session.commit()
 
 
-def test_mock_post(client_application):
+class _MLServiceStub(BaseHTTPRequestHandler):
+    """Stand-in for the batch creation service.
+
+    Answers with the status codes in `responses`, one per request.
+    """
+
+    responses = []
+    received = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.received.append(json.loads(body))
+        status = self.responses.pop(0) if self.responses else 201
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps({"meta": "", "data": ""}).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ml_service(monkeypatch):
+    _MLServiceStub.responses = []
+    _MLServiceStub.received = []
+    server = HTTPServer(("127.0.0.1", 0), _MLServiceStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    url = f"http://127.0.0.1:{server.server_port}/ml/processes/batch-creation/jobs"
+    monkeypatch.setenv("GEOIMAGENET_API_BATCH_CREATION_URL", url)
+    monkeypatch.setattr("geoimagenet_api.endpoints.batches.RETRY_BACKOFF", 0)
+
+    yield _MLServiceStub
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_post(client_application, ml_service):
     # ----- given
     data = {"name": "test_batch", "taxonomy_id": 1, "overwrite": "False"}
 
-    with mock.patch("geoimagenet_api.endpoints.batches.requests") as mock_requests:
-        mock_requests.exceptions.RequestException = requests.exceptions.RequestException
-        response = mock.Mock()
-        response.raise_for_status.return_value = None
-        response.json.return_value = {"meta": "", "data": ""}
-        mock_requests.post.return_value = response
-        batches_url = "http://testserver/ml/processes/batch-creation/jobs"
-        execute = {
-            "inputs": [
-                {"id": "name", "value": datetime.datetime.now().strftime("%Y-%m-%d")},
-                {
-                    "id": "geojson_url",
-                    "href": "http://testserver/api/v1/batches/annotations",
-                },
-                {"id": "overwrite", "value": data["overwrite"]},
-            ],
-            "outputs": [],
-        }
+    execute = {
+        "inputs": [
+            {"id": "name", "value": datetime.datetime.now().strftime("%Y-%m-%d")},
+            {
+                "id": "geojson_url",
+                "href": "http://testserver/api/v1/batches/annotations",
+            },
+            {"id": "overwrite", "value": data["overwrite"]},
+        ],
+        "outputs": [],
+    }
 
-        # ----- when
-        r = client_application.post("/api/v1/batches", json=data)
+    # ----- when
+    r = client_application.post("/api/v1/batches", json=data)
 
-        # ----- then
-        assert r.status_code == 202
-        mock_requests.post.assert_called_with(batches_url, json=json.dumps(execute))
+    # ----- then
+    assert r.status_code == 202
+    assert r.json()["status"] == "pending"
+    assert r.json()["sent_to_ml"] == execute
+    assert ml_service.received == [json.dumps(execute)]
 
-        assert r.json() == {"sent_to_ml": execute, "response_from_ml": {"meta": "", "data": ""}}
+    # the background task ran before the test client returned
+    r = client_application.get(f"/api/v1/batches/{r.json()['id']}")
+    assert r.json()["status"] == "sent"
+    assert r.json()["attempts"] == 1
+    assert r.json()["response_from_ml"] == {"meta": "", "data": ""}
 
 
-def test_mock_post_failure(client):
+def test_post_retries(client, ml_service, monkeypatch):
     # ----- given
+    monkeypatch.setenv("GEOIMAGENET_API_BATCH_CREATION_RETRIES", "2")
+    ml_service.responses = [503, 502]
     data = {"name": "test_batch", "taxonomy_id": 1, "overwrite": False}
 
     # ----- when
-    # it's faster to mock the exception than to let it raise an error
-    with mock.patch("geoimagenet_api.endpoints.batches.requests") as mock_requests:
-        mock_requests.exceptions.RequestException = requests.exceptions.RequestException
-        mock_requests.post.side_effect = requests.exceptions.HTTPError
-        r = client.post("/batches", json=data)
+    r = client.post("/batches", json=data)
 
     # ----- then
-    assert r.status_code == 503
+    r = client.get(f"/batches/{r.json()['id']}")
+    assert r.json()["status"] == "sent"
+    assert r.json()["attempts"] == 3
+
+
+def test_post_failure(client, ml_service, monkeypatch):
+    # ----- given
+    monkeypatch.setenv("GEOIMAGENET_API_BATCH_CREATION_RETRIES", "1")
+    ml_service.responses = [500, 500]
+    data = {"name": "test_batch", "taxonomy_id": 1, "overwrite": False}
+
+    # ----- when
+    r = client.post("/batches", json=data)
+
+    # ----- then
+    assert r.status_code == 202
+    r = client.get(f"/batches/{r.json()['id']}")
+    assert r.json()["status"] == "failed"
+    assert r.json()["attempts"] == 2
+    assert "500" in r.json()["error"]
+
+
+def test_post_client_error_not_retried(client, ml_service):
+    # ----- given
+    ml_service.responses = [400]
+    data = {"name": "test_batch", "taxonomy_id": 1, "overwrite": False}
+
+    # ----- when
+    r = client.post("/batches", json=data)
+
+    # ----- then
+    r = client.get(f"/batches/{r.json()['id']}")
+    assert r.json()["status"] == "failed"
+    assert r.json()["attempts"] == 1
+
+
+def test_get_submission_not_found(client):
+    r = client.get("/batches/999999")
+    assert r.status_code == 404
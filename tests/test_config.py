@@ -9,8 +9,10 @@ from geoimagenet_api.config.config import ENVIRONMENT_PREFIX
 
 
 @pytest.fixture(autouse=True)
-def force_reload_config():
-    config.config.config_ini = None
+def force_reload_config(request):
+    # the fixtures below change the environment and the ini files, the
+    # configuration is read again at the start and the end of each test
+    request.addfinalizer(config.reload)
 
 
 @pytest.fixture(autouse=True)
@@ -33,6 +35,7 @@ def ignore_custom_ini(request):
     if os.path.exists(custom_ini_path):
         previous_custom_data = custom_ini_path.read_text()
         custom_ini_path.unlink()
+    config.reload()
 
     def write_data_back():
         if previous_custom_data is not None:
@@ -51,6 +54,7 @@ def ignore_environment_variables(request):
     }
     for k in previous_environ:
         os.environ.pop(k)
+    config.reload()
 
     def set_os_environ_back():
         if previous_environ:
@@ -90,6 +94,7 @@ def temp_custom_ini(request):
         r"postgis_db = (.+)", "postgis_db = bananas", default_config_data
     )
     custom_ini_path.write_text(test_config_data)
+    config.reload()
 
     def write_data_back():
         if previous_custom_data is not None:
@@ -110,6 +115,7 @@ def temp_environment_variable_db(request):
     old = os.environ.get("GEOIMAGENET_API_POSTGIS_DB")
 
     os.environ["GEOIMAGENET_API_POSTGIS_DB"] = "bananas"
+    config.reload()
 
     def put_back_environment():
         if old is not None:
@@ -143,15 +149,38 @@ def test_sentry(ignore_custom_ini, ignore_environment_variables):
     old = os.environ.get("GEOIMAGENET_API_SENTRY_URL", "")
 
     os.environ["GEOIMAGENET_API_SENTRY_URL"] = "http://test"
+    config.reload()
 
-    import importlib
-    import geoimagenet_api
+    from geoimagenet_api.main import _create_apps
 
-    with mock.patch("geoimagenet_api.sentry_sdk.init") as p:
-        importlib.reload(geoimagenet_api)
+    with mock.patch("sentry_sdk.init") as p:
+        _create_apps()
         assert p.called
         assert p.call_args_list[0][1]["dsn"] == "http://test"
 
-    assert geoimagenet_api.sentry_sdk
-
     os.environ["GEOIMAGENET_API_SENTRY_URL"] = old
+
+
+def test_snapshot():
+    assert config.settings.db_pool_size == config.get("db_pool_size", int)
+
+    os.environ["GEOIMAGENET_API_DB_POOL_SIZE"] = "3"
+    try:
+        # the environment is only read on reload
+        assert config.settings.db_pool_size != 3
+        config.reload()
+        assert config.settings.db_pool_size == 3
+        assert config.get("db_pool_size", int) == 3
+        assert config.get_all_config()["db_pool_size"] == "3"
+        assert isinstance(config.settings.magpie_verify_ssl, bool)
+    finally:
+        del os.environ["GEOIMAGENET_API_DB_POOL_SIZE"]
+
+
+def test_invalid_value():
+    os.environ["GEOIMAGENET_API_DB_POOL_SIZE"] = "many"
+    try:
+        with pytest.raises(ValueError, match="db_pool_size"):
+            config.reload()
+    finally:
+        del os.environ["GEOIMAGENET_API_DB_POOL_SIZE"]
@@ -0,0 +1,140 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+from starlette.responses import PlainTextResponse
+from starlette.testclient import TestClient
+
+from geoimagenet_api import config
+from geoimagenet_api.database.connection import (
+    connection_manager,
+    primary_reads,
+    replica_lag_query,
+)
+from geoimagenet_api.middleware import ReadYourWritesMiddleware
+
+
+@pytest.fixture
+def reload_connection_manager(request, monkeypatch):
+    def reload():
+        monkeypatch.undo()
+        connection_manager.reload_config()
+
+    request.addfinalizer(reload)
+    return monkeypatch
+
+
+@pytest.fixture
+def replica(reload_connection_manager):
+    # the primary itself is used as a replica, its lag is always 0
+    host = config.get("postgis_host", str)
+    reload_connection_manager.setenv("GEOIMAGENET_API_POSTGIS_REPLICA_HOST", host)
+    connection_manager.reload_config()
+    return reload_connection_manager
+
+
+def test_pool_configuration(reload_connection_manager):
+    reload_connection_manager.setenv("GEOIMAGENET_API_DB_POOL_SIZE", "3")
+    reload_connection_manager.setenv("GEOIMAGENET_API_DB_MAX_OVERFLOW", "2")
+    connection_manager.reload_config()
+
+    stats = connection_manager.pool_stats()
+    assert stats["size"] == 3
+    assert stats["max_overflow"] == 2
+
+
+def test_statement_timeout(reload_connection_manager):
+    reload_connection_manager.setenv("GEOIMAGENET_API_DB_STATEMENT_TIMEOUT", "50")
+    reload_connection_manager.setenv("GEOIMAGENET_API_DB_EXPORT_STATEMENT_TIMEOUT", "0")
+    connection_manager.reload_config()
+
+    with connection_manager.get_db_session() as session:
+        with pytest.raises(OperationalError):
+            session.execute("SELECT pg_sleep(1);")
+
+    with connection_manager.get_db_session(export=True) as session:
+        assert session.execute("SHOW statement_timeout;").scalar() == "0"
+        session.execute("SELECT pg_sleep(0.1);")
+
+
+def test_pool_stats(client):
+    with connection_manager.get_db_session() as session:
+        session.execute("SELECT 1;")
+
+    r = client.get("/status/database_pool")
+    stats = r.json()
+    assert stats["checkouts"] >= 1
+    assert stats["checkout_wait_max"] >= 0
+    assert 0 <= stats["saturation"] <= 1
+
+
+def test_pool_checkouts(reload_connection_manager):
+    connection_manager.reload_config()
+
+    for _ in range(3):
+        with connection_manager.engine.connect() as connection:
+            connection.execute("SELECT 1;")
+
+    stats = connection_manager.pool_stats()
+    assert stats["checkouts"] == 3
+    assert stats["checkout_errors"] == 0
+    assert stats["checkout_wait_total"] >= stats["checkout_wait_max"] >= 0
+
+
+def test_no_replica():
+    assert connection_manager.replica_engine is None
+    assert not connection_manager.use_replica()
+    with connection_manager.get_db_session(read_only=True) as session:
+        assert session.bind is connection_manager.engine
+
+
+def test_replica_lag_query_server_version():
+    query_96 = replica_lag_query((9, 6, 17))
+    assert "pg_last_xlog_receive_location()" in query_96
+    assert "pg_last_xlog_replay_location()" in query_96
+    assert "_wal_" not in query_96
+
+    query_10 = replica_lag_query((10, 0))
+    assert "pg_last_wal_receive_lsn()" in query_10
+    assert "pg_last_wal_replay_lsn()" in query_10
+    assert "xlog" not in query_10
+
+
+def test_replica_routing(replica):
+    assert connection_manager.use_replica()
+    assert connection_manager.check_replica_lag() == 0
+
+    with connection_manager.get_db_session(read_only=True) as session:
+        assert session.bind is connection_manager.replica_engine
+        session.execute("SELECT 1;")
+    with connection_manager.get_db_session() as session:
+        assert session.bind is connection_manager.engine
+
+    with primary_reads():
+        assert not connection_manager.use_replica()
+
+    assert "replica" in connection_manager.pool_stats()
+
+
+def test_replica_lag_fallback(replica):
+    replica.setenv("GEOIMAGENET_API_REPLICA_MAX_LAG", "-1")
+    assert not connection_manager.use_replica()
+
+
+def test_read_your_writes(replica):
+    used_replica = []
+
+    async def app(scope, receive, send):
+        used_replica.append(connection_manager.use_replica())
+        await PlainTextResponse("ok")(scope, receive, send)
+
+    client = TestClient(ReadYourWritesMiddleware(app))
+
+    client.get("/")
+    assert used_replica[-1]
+
+    r = client.post("/")
+    assert not used_replica[-1]
+    assert ReadYourWritesMiddleware.cookie_name in r.cookies
+
+    # the cookie is sent back by the client
+    client.get("/")
+    assert not used_replica[-1]
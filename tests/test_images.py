@@ -5,8 +5,10 @@ from sqlalchemy import func
 from starlette.exceptions import HTTPException
 
 from geoimagenet_api.database.connection import connection_manager
-from geoimagenet_api.database.models import Image
+from geoimagenet_api.database.image_rgbn_16_bit import rebuild_image_rgbn_16_bit
+from geoimagenet_api.database.models import Image, ImageRgbn16Bit
 from geoimagenet_api.endpoints.images import query_rgbn_16_bit_image, image_id_from_image_name, image_id_from_properties
+from geoimagenet_api.endpoints.images import TRACE_ZOOM_LEVELS, _trace_for_zoom
 from geoimagenet_api.openapi_schemas import AnnotationProperties
 from tests.test_annotations import write_annotation, _clean_annotation_session
 
@@ -40,6 +42,53 @@ def test_get_image_by_id(client, pleiades_images):
     assert image["layer_name"]
 
 
+def test_get_images_filters(client, pleiades_images):
+    r = client.get(f"/images", params={"sensor_name": "pleiades", "bits": 16})
+    images = r.json()
+    assert len(images) == 40
+    assert r.headers["X-Total-Count"] == "40"
+    assert all(i["bits"] == 16 and i["bands"] == "RGBN" for i in images)
+
+    r = client.get(f"/images", params={"bands": "NRG", "bits": 8})
+    assert all(i["bands"] == "NRG" for i in r.json())
+
+
+def test_get_images_pagination(client, pleiades_images):
+    all_images = client.get(f"/images").json()
+
+    r = client.get(f"/images", params={"limit": 10, "offset": 5})
+    images = r.json()
+    assert images == all_images[5:15]
+    assert r.headers["X-Total-Count"] == str(len(all_images))
+
+
+@pytest.mark.parametrize(
+    "params", [{"limit": 0}, {"limit": -1}, {"offset": -1}, {"limit": 10, "offset": -5}]
+)
+def test_get_images_pagination_bounds(client, params):
+    r = client.get(f"/images", params=params)
+    assert r.status_code == 422
+
+
+def test_get_images_etag(client, pleiades_images):
+    r = client.get(f"/images")
+    etag = r.headers["ETag"]
+
+    r = client.get(f"/images", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+
+    # the etag changes when the image table is modified
+    image = write_image("PLEIADES", "RGB", 8, "etag_test_image", ".tif")
+    try:
+        r = client.get(f"/images", headers={"If-None-Match": etag})
+        assert r.status_code == 200
+        assert r.headers["ETag"] != etag
+        assert image.id in [i["id"] for i in r.json()]
+    finally:
+        with connection_manager.get_db_session() as session:
+            session.query(Image).filter_by(id=image.id).delete()
+            session.commit()
+
 def write_image(sensor_name, bands, bits, filename, extension, *, session=None):
     def _write(_session):
         image = Image(
@@ -165,6 +214,48 @@ def test_get_rgbn_16_bit_image_prespatou(pleiades_images):
         )
 
 
+def test_rgbn_16_bit_pairing_updated_by_triggers(pleiades_images):
+    name = "Pleiades_20141012_RGBN_50cm_8bits_AOI_14_Prespatou_BC"
+    prespatou_8_id = next(i.id for i in pleiades_images if i.filename == name)
+
+    def paired_image_id(session):
+        return (
+            session.query(ImageRgbn16Bit.rgbn_16_bit_image_id)
+            .filter_by(image_id=prespatou_8_id)
+            .scalar()
+        )
+
+    with connection_manager.get_db_session() as session:
+        # levenshtein distance of 1, instead of 2 for the '16bits' image
+        closer_name = name.replace("8bits", "6bits")
+        image_16 = write_image("PLEIADES", "RGBN", 16, closer_name, ".tif")
+        try:
+            assert paired_image_id(session) == image_16.id
+        finally:
+            session.query(Image).filter_by(id=image_16.id).delete()
+            session.commit()
+
+        paired_image = session.query(Image).get(paired_image_id(session))
+        assert paired_image.filename == name.replace("8bits", "16bits")
+
+
+def test_rgbn_16_bit_pairing_rebuild(pleiades_images):
+    def all_pairings(session):
+        query = session.query(
+            ImageRgbn16Bit.image_id, ImageRgbn16Bit.rgbn_16_bit_image_id
+        )
+        return query.order_by(ImageRgbn16Bit.image_id).all()
+
+    with connection_manager.get_db_session() as session:
+        before = all_pairings(session)
+        paired_ids = {image_id for image_id, _ in before}
+        assert all(i.id in paired_ids for i in pleiades_images)
+
+        rebuild_image_rgbn_16_bit(session)
+
+        assert all_pairings(session) == before
+
+
 def test_image_id_from_image_name(pleiades_images):
     image_name = "PLEIADES_NRG:Pleiades_20150917_RGBN_50cm_8bits_AOI_5_Edmunston_NB"
     with _clean_annotation_session() as session:
@@ -203,3 +294,82 @@ def test_image_trace_simplified(pleiades_images):
 
         # --- then
         assert trace_simplified_before != image.trace_simplified
+
+
+def test_image_trace_zoom_levels(pleiades_images):
+    with _clean_annotation_session() as session:
+        # --- given
+        image = session.query(Image).filter_by(id=pleiades_images[0].id).one()
+
+        # --- when
+        # a circle, with a lot of points
+        geometry = "SRID=4326;POINT(-70 40)"
+        trace = func.ST_Transform(func.ST_GeomFromEWKT(geometry), 3857)
+        image.trace = func.ST_Buffer(trace, 50000)
+        session.commit()
+
+        # --- then
+        columns = [Image.trace_simplified] + [
+            getattr(Image, f"trace_zoom_{zoom}") for zoom in TRACE_ZOOM_LEVELS
+        ]
+        n_points = (
+            session.query(*[func.ST_NPoints(c) for c in columns])
+            .filter_by(id=image.id)
+            .one()
+        )
+        simplified, *zoom_levels = n_points
+        assert all(n >= 4 for n in zoom_levels)
+        # the lower the zoom level, the simpler the trace
+        assert zoom_levels == sorted(zoom_levels)
+        assert zoom_levels[0] < simplified
+
+        image.trace = None
+        session.commit()
+
+
+def test_trace_for_zoom():
+    assert _trace_for_zoom(None) is Image.trace_simplified
+    assert _trace_for_zoom(0) is Image.trace_zoom_3
+    assert _trace_for_zoom(3) is Image.trace_zoom_3
+    assert _trace_for_zoom(4) is Image.trace_zoom_6
+    assert _trace_for_zoom(12) is Image.trace_zoom_12
+    assert _trace_for_zoom(13) is Image.trace_simplified
+
+
+def test_search_images(client, pleiades_images):
+    image_id = pleiades_images[0].id
+    with connection_manager.get_db_session() as session:
+        image = session.query(Image).filter_by(id=image_id).one()
+        geometry = "SRID=4326;POLYGON((-74 45,-74 46,-73 46,-73 45,-74 45))"
+        image.trace = func.ST_Transform(func.ST_GeomFromEWKT(geometry), 3857)
+        session.commit()
+
+    try:
+        params = {"bbox": "-73.5,45.5,-72,47", "srid": 4326}
+        r = client.get(f"/images/search", params=params)
+        assert r.status_code == 200
+        features = r.json()["features"]
+        assert [f["id"] for f in features] == [f"image.{image_id}"]
+        assert features[0]["properties"]["filename"] == pleiades_images[0].filename
+        assert features[0]["geometry"]["type"] == "Polygon"
+
+        # the traces are simplified at low zoom levels, but never collapse
+        r = client.get(f"/images/search", params={**params, "zoom": 2})
+        assert len(r.json()["features"][0]["geometry"]["coordinates"][0]) >= 4
+
+        r = client.get(f"/images/search", params={"bbox": "-60,45,-59,46", "srid": 4326})
+        assert r.json()["features"] == []
+
+        point = {"type": "Point", "coordinates": [-73.5, 45.5]}
+        r = client.post(f"/images/search", params={"srid": 4326}, json=point)
+        assert [f["id"] for f in r.json()["features"]] == [f"image.{image_id}"]
+    finally:
+        with connection_manager.get_db_session() as session:
+            image = session.query(Image).filter_by(id=image_id).one()
+            image.trace = None
+            session.commit()
+
+
+def test_search_images_bad_bbox(client):
+    r = client.get(f"/images/search", params={"bbox": "1,2,3"})
+    assert r.status_code == 400
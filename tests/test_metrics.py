@@ -0,0 +1,117 @@
+import pytest
+from prometheus_client.parser import text_string_to_metric_families
+from sqlalchemy.exc import ProgrammingError
+
+from geoimagenet_api.database.connection import connection_manager
+from geoimagenet_api.metrics import latest_metrics
+from geoimagenet_api.utils import geojson_stream
+
+
+def _samples(client):
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    samples = {}
+    for family in text_string_to_metric_families(r.text):
+        for sample in family.samples:
+            key = (sample.name, tuple(sorted(sample.labels.items())))
+            samples[key] = sample.value
+    return samples
+
+
+def test_request_metrics(client):
+    client.get("/taxonomy")
+    client.get("/images/1")
+
+    samples = _samples(client)
+    count = samples[
+        (
+            "geoimagenet_api_request_duration_seconds_count",
+            (("method", "GET"), ("route", "/taxonomy")),
+        )
+    ]
+    assert count >= 1
+    # labeled with the route, not the requested path
+    assert (
+        "geoimagenet_api_request_duration_seconds_count",
+        (("method", "GET"), ("route", "/images/{id}")),
+    ) in samples
+
+    queries = samples[
+        ("geoimagenet_api_db_queries_per_request_sum", (("route", "/taxonomy"),))
+    ]
+    assert queries >= 1
+    assert (
+        "geoimagenet_api_db_pool_checked_out",
+        (("database", "primary"),),
+    ) in samples
+
+
+def test_geojson_stream_metrics(client):
+    class Row:
+        id = 1
+        name = "a"
+
+    before = _samples(client).get(
+        ("geoimagenet_api_geojson_stream_rows_total", (("feature", "test"),)), 0
+    )
+    text = "".join(
+        geojson_stream([Row(), Row()], ["name"], with_geometry=False, id_prefix="test")
+    )
+
+    samples = _samples(client)
+    rows = samples[
+        ("geoimagenet_api_geojson_stream_rows_total", (("feature", "test"),))
+    ]
+    assert rows - before == 2
+    assert samples[
+        ("geoimagenet_api_geojson_stream_bytes_total", (("feature", "test"),))
+    ] >= len(text)
+
+
+def _sample_values(name: str) -> dict:
+    values = {}
+    for family in text_string_to_metric_families(latest_metrics().decode()):
+        for sample in family.samples:
+            if sample.name == name:
+                values[sample.labels["database"]] = sample.value
+    return values
+
+
+def test_pool_metrics_updated_on_checkout():
+    def checked_out():
+        return _sample_values("geoimagenet_api_db_pool_checked_out").get("primary")
+
+    with connection_manager.engine.connect():
+        pass
+    before = checked_out()
+    with connection_manager.engine.connect():
+        # no request is made, the gauges are set on checkout and checkin
+        assert checked_out() == before + 1
+    assert checked_out() == before
+
+
+def test_pool_checkout_counters():
+    def wait_total():
+        name = "geoimagenet_api_db_pool_checkout_wait_seconds_total"
+        return _sample_values(name).get("primary", 0)
+
+    before = wait_total()
+    with connection_manager.engine.connect():
+        pass
+    assert wait_total() > before
+
+
+def test_failed_query_metrics():
+    def errors():
+        for family in text_string_to_metric_families(latest_metrics().decode()):
+            for sample in family.samples:
+                if sample.name == "geoimagenet_api_db_query_errors_total":
+                    return sample.value
+
+    before = errors()
+    with connection_manager.engine.connect() as connection:
+        with pytest.raises(ProgrammingError):
+            connection.execute("SELECT * FROM table_that_does_not_exist;")
+        # the start time of the failed query is removed
+        assert connection.info["query_start_time"] == []
+    assert errors() == before + 1
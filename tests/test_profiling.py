@@ -0,0 +1,45 @@
+import logging
+
+from geoimagenet_api import profiling
+
+
+def test_server_timing_disabled(client_application):
+    r = client_application.get("/api/v1/taxonomy")
+    assert "server-timing" not in r.headers
+
+
+def test_server_timing(client_application, monkeypatch, caplog):
+    monkeypatch.setenv("GEOIMAGENET_API_SERVER_TIMING", "true")
+    with caplog.at_level(logging.INFO, logger="geoimagenet_api.middleware"):
+        r = client_application.get("/api/v1/taxonomy")
+
+    assert "db;dur=" in r.headers["server-timing"]
+    assert "total;dur=" in r.headers["server-timing"]
+    assert any('"path": "/api/v1/taxonomy"' in m for m in caplog.messages)
+
+
+def test_server_timing_token(client_application, monkeypatch):
+    monkeypatch.setenv("GEOIMAGENET_API_SERVER_TIMING_TOKEN", "secret")
+
+    r = client_application.get(
+        "/api/v1/taxonomy", headers={"X-Server-Timing-Token": "wrong"}
+    )
+    assert "server-timing" not in r.headers
+
+    r = client_application.get(
+        "/api/v1/taxonomy", headers={"X-Server-Timing-Token": "secret"}
+    )
+    assert "server-timing" in r.headers
+
+
+def test_repeated_statements():
+    with profiling.profile_request() as profile:
+        for _ in range(3):
+            profiling.record("db", 0.01, "SELECT 1")
+        profiling.record("db", 0.01, "SELECT 2")
+        with profiling.timed("magpie"):
+            pass
+
+    assert profiling.current_profile() is None
+    assert profile.counts == {"db": 4, "magpie": 1}
+    assert profile.repeated_statements() == [{"statement": "SELECT 1", "count": 3}]
@@ -1,3 +1,5 @@
+import json
+
 from starlette.testclient import TestClient
 
 from geoimagenet_api import application
@@ -34,3 +36,28 @@ def test_openapi_json(client):
 def test_not_found(client):
     r = client.get("/yadayada")
     assert r.status_code == 404
+
+
+def test_fast_json_response():
+    from fastapi.encoders import jsonable_encoder
+
+    from geoimagenet_api.database.models import AnnotationStatus
+    from geoimagenet_api.openapi_schemas import TaxonomyClass
+    from geoimagenet_api.responses import FastJSONResponse
+
+    child = TaxonomyClass(id=2, name_fr="É", taxonomy_id=1, code="B")
+    parent = TaxonomyClass(id=1, name_fr="A", taxonomy_id=1, code="A", children=[child])
+    content = {"tree": parent, "status": AnnotationStatus.new, "none": None}
+
+    r = FastJSONResponse(content)
+    assert r.media_type == "application/json"
+    assert json.loads(r.body) == jsonable_encoder(content)
+
+
+def test_fast_json_openapi_schema(client):
+    """The fast responses still document their response model."""
+    paths = client.get("/openapi.json").json()["paths"]
+    schema = paths["/taxonomy_classes"]["get"]["responses"]["200"]["content"]
+    assert schema["application/json"]["schema"]["items"]["$ref"].endswith(
+        "/TaxonomyClass"
+    )
@@ -0,0 +1,45 @@
+import os
+
+from tests.benchmarks.startup import import_times, APPLICATION_MODULE
+
+# dependencies of the command line scripts, or only used when configured
+NOT_IMPORTED_BY_THE_API = [
+    "alembic",
+    "dateparser",
+    "geoserver",
+    "loguru",
+    "sentry_sdk",
+    "sqlalchemy_utils",
+    "yaml",
+    "geoimagenet_api.geoserver_setup",
+]
+
+# generous, the goal is to catch large regressions
+IMPORT_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", "10"))
+
+
+def test_package_import_is_light():
+    times = import_times("geoimagenet_api")
+    assert "fastapi" not in times
+    assert "sqlalchemy" not in times
+
+
+def test_application_import_graph():
+    times = import_times(APPLICATION_MODULE)
+
+    for module in NOT_IMPORTED_BY_THE_API:
+        assert module not in times, f"{module} is imported by the api"
+
+    assert times[APPLICATION_MODULE]["cumulative"] < IMPORT_BUDGET
+
+
+def test_create_app():
+    from geoimagenet_api import main
+
+    application = main.create_app()
+    paths = [route.path for route in application.routes]
+    assert "/api/v1" in paths
+
+    # the application is built once, and shared with the module attribute
+    assert main.create_app() is application
+    assert main.application is application
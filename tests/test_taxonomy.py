@@ -1,6 +1,6 @@
 from geoimagenet_api.database.connection import connection_manager
-from geoimagenet_api.endpoints.taxonomy import get_latest_taxonomy_ids
-from geoimagenet_api.database.models import Taxonomy
+from geoimagenet_api.endpoints.taxonomy import get_latest_taxonomy_ids, TaxonomyIndex
+from geoimagenet_api.database.models import Taxonomy, TaxonomyClass
 
 
 def test_taxonomy_search_all(client):
@@ -100,3 +100,72 @@ def test_get_latest_taxonomy_ids():
             synchronize_session=False
         )
         session.commit()
+
+
+def test_taxonomy_index():
+    rows = [
+        ([3, 1], "Couverture de sol", "Land cover", [300, 100], ["2", "1"]),
+        ([2], "Objets", None, [200], ["1"]),
+    ]
+    index = TaxonomyIndex(rows)
+
+    assert index.latest_version == "2"
+    assert index.find("land-cover") == index.find("Couverture de sol")
+    assert index.find("not-found") == []
+    assert index.get("couverture-de-sol", "2").root_taxonomy_class_id == 300
+    assert index.get("couverture-de-sol", "3") is None
+    assert sorted(index.taxonomy_ids("1")) == [1, 2]
+    assert index.taxonomy_ids("1", "objets") == [2]
+
+
+def test_taxonomy_index_refreshed(client):
+    r = client.get(f"/taxonomy/index-test/1")
+    assert r.status_code == 404
+
+    with connection_manager.get_db_session() as session:
+        taxonomy = Taxonomy(name_fr="Index test", version="1")
+        session.add(taxonomy)
+        session.flush()
+        session.add(TaxonomyClass(taxonomy_id=taxonomy.id, name_fr="a", code="IDXT"))
+        session.commit()
+        try:
+            r = client.get(f"/taxonomy/index-test/1")
+            assert r.status_code == 200
+            assert r.json()["id"] == taxonomy.id
+        finally:
+            session.query(TaxonomyClass).filter_by(code="IDXT").delete()
+            session.delete(taxonomy)
+            session.commit()
+
+    r = client.get(f"/taxonomy/index-test/1")
+    assert r.status_code == 404
+
+
+def test_taxonomy_classes_response_cache(client):
+    r = client.get("/taxonomy_classes", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["cache-control"] == "no-cache"
+    etag = r.headers["etag"]
+    tree = r.json()
+
+    r = client.get("/taxonomy_classes", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers
+    assert r.headers["etag"] != etag
+    assert r.json() == tree
+
+    headers = {"Accept-Encoding": "gzip", "If-None-Match": etag}
+    r = client.get("/taxonomy_classes", headers=headers)
+    assert r.status_code == 304
+
+    # a write to the taxonomy tables changes the data version
+    with connection_manager.get_db_session() as session:
+        session.add(Taxonomy(name_fr="Cache test", version="1"))
+        session.commit()
+        session.query(Taxonomy).filter_by(name_fr="Cache test").delete()
+        session.commit()
+
+    r = client.get("/taxonomy_classes", headers=headers)
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
+    assert r.json() == tree
@@ -1,7 +1,10 @@
+from collections import namedtuple
+
 import pytest
 
 from geoimagenet_api.database.models import Taxonomy, TaxonomyClass
 from geoimagenet_api.database.connection import connection_manager
+from geoimagenet_api.endpoints.taxonomy_classes import build_taxonomy_classes_trees
 
 
 @pytest.fixture
@@ -108,14 +111,51 @@ def test_taxonomy_class_by_id_route_depth_1(client):
     assert r.json()["name_fr"] == "Objets"
 
 
+def max_depth(obj, depth=0):
+    return max([max_depth(c["children"], depth + 1) for c in obj] + [depth])
+
+
 def test_taxonomy_class_by_id_route_infinite_depth(client):
     id_ = 1
     query = {"depth": -1}
     r = client.get(f"/taxonomy_classes/{id_}", params=query)
 
-    def max_depth(obj, depth=0):
-        return max([max_depth(c["children"], depth + 1) for c in obj] + [depth])
-
     assert len(r.json()["children"]) >= 1
     depth = max_depth([r.json()])
     assert depth >= 3
+
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_taxonomy_class_depth_limited(client, depth):
+    # max_depth counts the level of the root class
+    query = {"taxonomy_name": "Objets", "depth": depth}
+    r = client.get("/taxonomy_classes", params=query)
+    assert max_depth(r.json()[:1]) == depth + 1
+
+    r = client.get(f"/taxonomy_classes/1", params={"depth": depth})
+    assert max_depth([r.json()]) == depth + 1
+
+
+def test_build_taxonomy_classes_trees():
+    Row = namedtuple("Row", "id name_fr name_en taxonomy_id parent_id code")
+    rows = [
+        Row(1, "a", "a", 1, None, "A"),
+        Row(2, "b", "b", 1, 1, "B"),
+        Row(3, "c", "c", 1, 2, "C"),
+        Row(4, "d", "d", 1, 1, "D"),
+    ]
+
+    (tree,) = build_taxonomy_classes_trees(rows, [1])
+    assert [c.id for c in tree.children] == [2, 4]
+    assert tree.children[0].children[0].id == 3
+
+    assert tree.has_children
+    assert not tree.children[1].has_children
+
+    (tree,) = build_taxonomy_classes_trees(rows, [1], depth=1)
+    assert [c.children for c in tree.children] == [[], []]
+    # cut off by the depth, but not a leaf
+    assert [c.has_children for c in tree.children] == [True, False]
+
+    subtrees = build_taxonomy_classes_trees(rows, [2, 4, 99], depth=0)
+    assert [(t.id, t.children) for t in subtrees] == [(2, []), (4, [])]
@@ -1,3 +1,6 @@
+import threading
+from http.server import ThreadingHTTPServer
+
 import pytest
 from unittest import mock
 
@@ -8,6 +11,7 @@ from geoimagenet_api.database.models import Person, PersonFollower
 from geoimagenet_api.openapi_schemas import User
 
 import geoimagenet_api.endpoints.users
+from tests.magpie_stub import MagpieStub, user_cookie
 
 
 @pytest.fixture()
@@ -161,3 +165,26 @@ def test_delete_followers(client, magpie_current_user_1):
         # cleanup
         session.delete(follower_2)
         session.commit()
+
+
+def test_magpie_stub(client, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MagpieStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv(
+        "GEOIMAGENET_API_MAGPIE_URL", f"http://127.0.0.1:{server.server_port}"
+    )
+
+    try:
+        r = client.get("/users/current/followed_users", cookies=user_cookie(1234))
+        assert r.status_code == 200
+
+        with connection_manager.get_db_session() as session:
+            person = session.query(Person).filter_by(id=1234).one()
+            assert person.username == "user_1234"
+
+        r = client.get("/users/current/followed_users")
+        assert r.status_code == 403
+    finally:
+        server.shutdown()
+        server.server_close()